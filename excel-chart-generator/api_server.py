@@ -0,0 +1,403 @@
+"""
+無狀態的圖表生成 HTTP API（與 Streamlit 介面分開部署）
+
+用法：
+    python api_server.py --port 8000 --workers 4 --queue-size 16 --data-dir api_data
+
+端點：
+    GET  /health                         服務狀態與佇列統計
+    GET  /metrics                        各階段耗時直方圖（Prometheus text 格式）
+    POST /datasets?filename=sales.csv    上傳檔案（請求內容為原始檔案），回傳數據集 ID
+    GET  /datasets/{id}                  數據集基本資訊
+    GET  /datasets/{id}/analysis         數據分析結果
+    POST /datasets/{id}/charts           生成圖表，請求內容為 {"query": "...", "use_fallback": true}
+
+工作佇列已滿時回傳 429（含 Retry-After）。數據集以內容雜湊為 ID，
+多個實例共用同一個 --data-dir 時可放在負載平衡器後面水平擴充。
+設定 QUERY_ENGINE=duckdb（需安裝 duckdb）時，數據集會匯入磁碟上的 DuckDB，生成的代碼以 db.sql() 先聚合。
+"""
+
+import argparse
+import base64
+import json
+import math
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, Callable
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+# 載入環境變數
+load_dotenv()
+
+from modules.gemini_client import GeminiClient
+from modules.chart_generator import ChartGenerator
+from modules.chart_pipeline import run_chart_query
+from modules.dataset_store import DatasetStore, DatasetNotFoundError
+from modules.query_engine import QueryEngineCache
+from modules.tracing import get_tracer
+
+# 與 Streamlit 預設的上傳上限相同
+MAX_UPLOAD_BYTES = 200 * 1024 * 1024
+# JSON 請求內容的上限（圖表請求只有查詢文字）
+MAX_JSON_BYTES = 64 * 1024
+
+
+class QueueFullError(Exception):
+    """工作佇列已滿"""
+
+
+class WorkerPool:
+    """固定大小的工作執行緒池，加上有上限的等待佇列"""
+
+    def __init__(self, workers: int = 4, queue_size: int = 16):
+        """
+        Args:
+            workers: 同時執行的工作數
+            queue_size: 最多等待中的工作數（超過時拒絕）
+        """
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api-worker')
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self._stats = {'pending': 0, 'running': 0, 'completed': 0, 'failed': 0, 'rejected': 0}
+
+    def submit(self, fn: Callable, *args, **kwargs):
+        """提交工作；佇列已滿時拋出 QueueFullError"""
+
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise QueueFullError()
+
+        with self._lock:
+            self._stats['pending'] += 1
+
+        def run():
+            with self._lock:
+                self._stats['pending'] -= 1
+                self._stats['running'] += 1
+            try:
+                result = fn(*args, **kwargs)
+                with self._lock:
+                    self._stats['completed'] += 1
+                return result
+            except Exception:
+                with self._lock:
+                    self._stats['failed'] += 1
+                raise
+            finally:
+                with self._lock:
+                    self._stats['running'] -= 1
+                self._slots.release()
+
+        return self._executor.submit(run)
+
+    def stats(self) -> Dict[str, Any]:
+        """取得佇列統計"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['workers'] = self.workers
+        stats['queue_size'] = self.queue_size
+        return stats
+
+
+def to_jsonable(value):
+    """將分析結果中的 numpy/pandas 型別轉為可序列化的 JSON 值"""
+
+    if isinstance(value, dict):
+        return {str(key): to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return [to_jsonable(item) for item in value.tolist()]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float):
+        return None if math.isnan(value) or math.isinf(value) else value
+    if isinstance(value, (pd.Timestamp, pd.Timedelta)):
+        return None if pd.isna(value) else str(value)
+    if value is None or isinstance(value, (str, int, bool)):
+        return value
+    if value is pd.NaT:
+        return None
+    return str(value)
+
+
+class ChartService:
+    """API 的業務邏輯：數據集上傳、分析與圖表生成"""
+
+    def __init__(self, store: DatasetStore, gemini_client: GeminiClient, query_engines: QueryEngineCache = None):
+        self.store = store
+        self.gemini_client = gemini_client
+        self.query_engines = query_engines
+
+    def upload(self, filename: str, data: bytes) -> Dict[str, Any]:
+        """儲存並預先載入數據集"""
+        dataset_id = self.store.put(filename, data)
+        return self.describe(dataset_id)
+
+    def describe(self, dataset_id: str) -> Dict[str, Any]:
+        """數據集基本資訊"""
+        dataset = self.store.get(dataset_id)
+        data_analysis = dataset['data_analysis']
+        return {
+            'dataset_id': dataset_id,
+            'row_count': data_analysis['row_count'],
+            'column_count': data_analysis['column_count'],
+            'columns': [str(col) for col in dataset['df'].columns],
+            'column_types': data_analysis['column_types']
+        }
+
+    def analysis(self, dataset_id: str) -> Dict[str, Any]:
+        """完整的數據分析結果"""
+        dataset = self.store.get(dataset_id)
+        return {'dataset_id': dataset_id, 'analysis': to_jsonable(dataset['data_analysis'])}
+
+    def generate_chart(self, dataset_id: str, user_query: str, use_fallback: bool = True) -> Dict[str, Any]:
+        """生成圖表；plotly 圖表以 figure JSON 回傳，matplotlib 圖表以 base64 PNG 回傳"""
+
+        dataset = self.store.get(dataset_id)
+        query_engine = None
+        if self.query_engines is not None:
+            query_engine = self.query_engines.get(dataset_id, self.store.source_path(dataset_id),
+                                                  df_loader=lambda: dataset['df'])
+        chart_generator = ChartGenerator(dataset['df'], dataset_key=dataset_id, show_module_status=False,
+                                         query_engine=query_engine)
+        result = run_chart_query(chart_generator, self.gemini_client, dataset['data_analysis'],
+                                 user_query, use_fallback=use_fallback)
+
+        figures = []
+        for figure in result['figures']:
+            if figure['type'] == 'plotly':
+                figures.append({'type': 'plotly', 'figure': json.loads(figure['json'])})
+            else:
+                figures.append({'type': 'png', 'data': base64.b64encode(figure['data']).decode('ascii')})
+
+        return {
+            'dataset_id': dataset_id,
+            'query': user_query,
+            'success': result['success'],
+            'fallback': result['fallback'],
+            'code': result['code'],
+            'repairs': result['repairs'],
+            'figures': figures,
+            'error': result['error'],
+            'timings': result['timings'],
+            'llm_calls': result['llm_calls']
+        }
+
+
+class ChartAPIHandler(BaseHTTPRequestHandler):
+    """HTTP 路由；實際工作交給 WorkerPool 執行"""
+
+    server_version = 'ChartAPI/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    _DATASET_ROUTE = re.compile(r'^/datasets/([0-9a-f]{64})(/analysis|/charts)?/?$')
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+
+        if path == '/health':
+            query_engines = self.server.service.query_engines
+            self._send_json(200, {
+                'status': 'ok',
+                'queue': self.server.pool.stats(),
+                'datasets': self.server.service.store.stats(),
+                'query_engines': query_engines.report() if query_engines is not None else None
+            })
+            return
+
+        if path == '/metrics':
+            body = get_tracer().export_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        match = self._DATASET_ROUTE.match(path)
+        if not match or match.group(2) == '/charts':
+            self._send_error(404, '找不到路徑')
+            return
+
+        dataset_id = match.group(1)
+        if match.group(2) == '/analysis':
+            self._dispatch(self.server.service.analysis, dataset_id)
+        else:
+            self._dispatch(self.server.service.describe, dataset_id)
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        path = parsed.path
+
+        if path.rstrip('/') == '/datasets':
+            length = self._content_length()
+            if length is None:
+                return
+            if length <= 0:
+                self._send_error(400, '請求內容為空')
+                return
+            if length > MAX_UPLOAD_BYTES:
+                self._reject_body(413, f'檔案超過上限 {MAX_UPLOAD_BYTES // (1024 * 1024)} MB')
+                return
+
+            filename = parse_qs(parsed.query).get('filename', [None])[0] or self.headers.get('X-Filename')
+            if not filename:
+                self._send_error(400, '缺少 filename 參數')
+                return
+
+            data = self.rfile.read(length)
+            self._dispatch(self.server.service.upload, filename, data, status=201)
+            return
+
+        match = self._DATASET_ROUTE.match(path)
+        if not match or match.group(2) != '/charts':
+            self._send_error(404, '找不到路徑')
+            return
+
+        body = self._read_json()
+        if body is None:
+            return
+        user_query = body.get('query')
+        if not isinstance(user_query, str) or not user_query.strip():
+            self._send_error(400, '缺少 query')
+            return
+
+        self._dispatch(self.server.service.generate_chart, match.group(1), user_query.strip(),
+                       bool(body.get('use_fallback', True)))
+
+    def _dispatch(self, fn: Callable, *args, status: int = 200):
+        """交給工作池執行並等待結果；佇列已滿回傳 429，逾時回傳 504"""
+
+        started = time.perf_counter()
+        try:
+            future = self.server.pool.submit(fn, *args)
+        except QueueFullError:
+            self._send_error(429, '服務忙碌中，請稍後再試', headers={'Retry-After': str(self.server.retry_after)})
+            return
+
+        try:
+            result = future.result(timeout=self.server.request_timeout)
+        except FutureTimeoutError:
+            self._send_error(504, '處理逾時')
+            return
+        except DatasetNotFoundError:
+            self._send_error(404, '數據集不存在')
+            return
+        except ValueError as e:
+            self._send_error(400, str(e))
+            return
+        except Exception as e:
+            self._send_error(500, f'{type(e).__name__}: {str(e)}')
+            return
+
+        self._send_json(status, result, headers={'X-Elapsed-Seconds': f'{time.perf_counter() - started:.3f}'})
+
+    def _content_length(self):
+        """讀取 Content-Length（格式錯誤時回傳 400 並回傳 None）"""
+        try:
+            return int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            self._reject_body(400, 'Content-Length 格式錯誤')
+            return None
+
+    def _read_json(self):
+        """讀取 JSON 物件請求內容（失敗時已回傳錯誤並回傳 None）"""
+        length = self._content_length()
+        if length is None:
+            return None
+        if length > MAX_JSON_BYTES:
+            self._reject_body(413, f'請求內容超過上限 {MAX_JSON_BYTES // 1024} KB')
+            return None
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            # 包括 JSONDecodeError 與無法以 UTF-8 解碼的內容
+            self._send_error(400, '請求內容不是有效的 JSON')
+            return None
+        if not isinstance(body, dict):
+            # 包括 null，避免與失敗時的 None 混淆
+            self._send_error(400, '請求內容必須是 JSON 物件')
+            return None
+        return body
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Dict[str, str] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str, headers: Dict[str, str] = None):
+        self._send_json(status, {'error': message}, headers=headers)
+
+    def _reject_body(self, status: int, message: str):
+        """回傳錯誤並關閉連線（請求內容沒有讀取，同一連線上不能再處理下一個請求）"""
+        self.close_connection = True
+        self._send_error(status, message, headers={'Connection': 'close'})
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class ChartAPIServer(ThreadingHTTPServer):
+    """持有共用的工作池與服務物件"""
+
+    daemon_threads = True
+
+    def __init__(self, address, service: ChartService, pool: WorkerPool, request_timeout: float = 120.0,
+                 retry_after: int = 5, quiet: bool = False):
+        super().__init__(address, ChartAPIHandler)
+        self.service = service
+        self.pool = pool
+        self.request_timeout = request_timeout
+        self.retry_after = retry_after
+        self.quiet = quiet
+
+
+def main():
+    parser = argparse.ArgumentParser(description='圖表生成 HTTP API')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=4, help='同時處理的請求數')
+    parser.add_argument('--queue-size', type=int, default=16, help='等待佇列長度，超過時回傳 429')
+    parser.add_argument('--data-dir', default='api_data', help='數據集存放目錄（可由多個實例共用）')
+    parser.add_argument('--max-loaded', type=int, default=8, help='每個實例保留在記憶體中的數據集數')
+    parser.add_argument('--request-timeout', type=float, default=120.0, help='單一請求的等待上限（秒）')
+    args = parser.parse_args()
+
+    api_key = os.getenv('GEMINI_API_KEY')
+    if not api_key or api_key == 'your_api_key_here':
+        parser.error('請在 .env 檔案中設定 GEMINI_API_KEY')
+
+    service = ChartService(DatasetStore(args.data_dir, max_loaded=args.max_loaded), GeminiClient(api_key),
+                           query_engines=QueryEngineCache.from_env())
+    pool = WorkerPool(workers=args.workers, queue_size=args.queue_size)
+    server = ChartAPIServer((args.host, args.port), service, pool, request_timeout=args.request_timeout)
+
+    print(f"圖表 API 啟動於 http://{args.host}:{args.port}（workers={args.workers}, queue={args.queue_size}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,44 @@
 import streamlit as st
 import pandas as pd
+import math
 import os
+import re
+import uuid
+from concurrent.futures import CancelledError
+from datetime import datetime
 from pathlib import Path
 from dotenv import load_dotenv
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx, RerunException, StopException
 
 # 載入環境變數
 load_dotenv()
 
+DEBUG_MODE = os.getenv('DEBUG_MODE', 'false').lower() in ('1', 'true', 'yes')
+
+# 背景分析進行中時，分析區塊的更新間隔（秒）
+PROFILING_REFRESH_SECONDS = 0.5
+
 # 導入自訂模組
-from modules.data_analyzer import DataAnalyzer
 from modules.gemini_client import GeminiClient
 from modules.chart_generator import ChartGenerator
+from modules.file_loader import read_data_file
+from modules.figure_cache import FigureCache, fingerprint_bytes, render_cached_figures
+from modules.figure_optimizer import format_bytes
+from modules.render_manager import RenderManager
+from modules.tracing import span, traced, get_tracer
+from modules.memory_accountant import MemoryAccountant
+from modules.history_store import ChartHistoryStore, PAGE_SIZE
+from modules.intent_router import IntentRouter, DEFAULT_THRESHOLD
+from modules.chart_prefetcher import ChartPrefetcher
+from modules.query_engine import QueryEngineCache
+from modules.generation_manager import GenerationManager
+
+# 網址中保存圖表歷史擁有者鍵的查詢參數
+HISTORY_OWNER_PARAM = 'history'
+
+# 本地意圖判斷的信心門檻（大於 1 表示停用，一律交給 Gemini）
+INTENT_ROUTER_THRESHOLD = float(os.getenv('INTENT_ROUTER_THRESHOLD', DEFAULT_THRESHOLD))
 
 # 設定頁面
 st.set_page_config(
@@ -41,14 +69,182 @@ st.markdown("""
 
 def initialize_session_state():
     """初始化 session state"""
-    if 'df' not in st.session_state:
-        st.session_state.df = None
-    if 'data_analysis' not in st.session_state:
-        st.session_state.data_analysis = None
+    if 'session_data' not in st.session_state:
+        # 數據集與分析結果交由記憶體管理器追蹤（可暫存到磁碟）
+        ctx = get_script_run_ctx()
+        session_id = ctx.session_id if ctx is not None else uuid.uuid4().hex
+        st.session_state.session_data = get_memory_accountant().get_session(session_id)
     if 'gemini_client' not in st.session_state:
         st.session_state.gemini_client = None
-    if 'chart_history' not in st.session_state:
-        st.session_state.chart_history = []
+    if 'history_page' not in st.session_state:
+        st.session_state.history_page = 0
+
+@st.cache_resource
+def get_memory_accountant():
+    """取得跨 session 共用的記憶體管理器"""
+    return MemoryAccountant.from_env()
+
+@st.cache_resource
+def get_figure_cache():
+    """取得跨 session 共用的圖表快取"""
+    return FigureCache()
+
+@st.cache_resource
+def get_chart_prefetcher():
+    """取得跨 session 共用的建議圖表預先繪製器（結果寫入共用的圖表快取）"""
+    return ChartPrefetcher.from_env(get_figure_cache())
+
+@st.cache_resource
+def get_query_engines():
+    """取得跨 session 共用的 DuckDB 查詢引擎（QUERY_ENGINE=duckdb 且已安裝 duckdb 時才啟用）"""
+    return QueryEngineCache.from_env()
+
+def get_dataset_query_engine(session_data):
+    """取得目前數據集的查詢引擎；未啟用或匯入失敗時回傳 None（生成的代碼改用 df）"""
+    engines = get_query_engines()
+    if engines is None or session_data.dataset_hash is None:
+        return None
+    source_path = next(Path("uploads").glob(f"{session_data.dataset_hash}.*"), None)
+    return engines.get(session_data.dataset_hash, source_path, df_loader=lambda: session_data.df)
+
+def create_chart_generator(session_data):
+    """建立目前數據集的圖表生成器（啟用查詢引擎時以 db 注入執行環境）"""
+    return ChartGenerator(
+        session_data.df, dataset_key=session_data.dataset_hash,
+        query_engine=get_dataset_query_engine(session_data)
+    )
+
+@st.cache_resource
+def get_generation_manager():
+    """取得跨 session 共用的 Gemini 請求管理器（背景 asyncio 事件迴圈）"""
+    return GenerationManager()
+
+@st.cache_resource
+def get_history_store():
+    """取得圖表歷史資料庫（重新整理頁面或重新啟動後仍保留）"""
+    return ChartHistoryStore(os.getenv('CHART_HISTORY_DB', 'chart_history.db'))
+
+def history_owner():
+    """
+    目前使用者的圖表歷史擁有者鍵
+
+    歷史資料庫由所有使用者共用，讀取與刪除都以此鍵過濾；鍵保存在網址的查詢參數中，
+    重新整理頁面後仍是同一個使用者（沒有時產生新的鍵）。
+    """
+    if 'history_owner' not in st.session_state:
+        owner = st.query_params.get(HISTORY_OWNER_PARAM, '')
+        if not re.fullmatch(r'[0-9a-f]{32}', owner):
+            owner = uuid.uuid4().hex
+            st.query_params[HISTORY_OWNER_PARAM] = owner
+        st.session_state.history_owner = owner
+    return st.session_state.history_owner
+
+def record_chart_history(user_query, code, cache_key=None):
+    """記錄圖表歷史"""
+    session_data = st.session_state.session_data
+    get_history_store().add(
+        session_data.dataset_hash, user_query, code,
+        cache_key=cache_key, session_id=history_owner()
+    )
+
+def display_payload_reports(reports):
+    """顯示圖表傳輸大小（壓縮前後）"""
+    for report in reports:
+        if not report:
+            continue
+        details = []
+        if report['webgl_traces']:
+            details.append(f"WebGL {report['webgl_traces']} 條")
+        if report['binary_arrays']:
+            details.append(f"二進位陣列 {report['binary_arrays']} 個")
+        suffix = f"（{', '.join(details)}）" if details else ""
+        st.caption(
+            f"圖表傳輸大小: {format_bytes(report['before_bytes'])} → "
+            f"{format_bytes(report['after_bytes'])}{suffix}"
+        )
+
+def display_memory_usage(session_data, accountant):
+    """在側邊欄顯示本 session 與全部 session 的記憶體用量"""
+    usage = session_data.usage()
+    report = accountant.report()
+
+    with st.sidebar.expander("記憶體用量", expanded=False):
+        st.write(
+            f"**本 session:** {format_bytes(usage['total'])} / {format_bytes(report['session_budget_bytes'])}"
+        )
+        st.caption(
+            f"數據集 {format_bytes(usage['df'])}、分析結果 {format_bytes(usage['data_analysis'])}"
+        )
+        if session_data.is_spilled:
+            st.caption("數據集引用已釋放，下次使用時自動載回")
+        st.progress(min(1.0, usage['total'] / max(1, report['session_budget_bytes'])))
+
+        st.write(
+            f"**全部 session（{report['sessions']} 個）:** "
+            f"{format_bytes(report['total_bytes'])} / {format_bytes(report['global_budget_bytes'])}"
+        )
+        if report['shared_datasets']:
+            st.caption(
+                f"共用數據集 {report['shared_datasets']} 個（{format_bytes(report['shared_bytes'])}，"
+                f"相同內容的檔案只保留一份）"
+            )
+        if report['spills']:
+            st.caption(
+                f"已暫存 {report['spills']} 次（{format_bytes(report['bytes_spilled'])}），"
+                f"目前 {report['spilled_sessions']} 個 session 已釋放數據集引用"
+            )
+
+def display_debug_panel():
+    """在側邊欄顯示各階段耗時與 Prometheus 指標（僅 DEBUG_MODE）"""
+    tracer = get_tracer()
+
+    with st.sidebar.expander("效能追蹤", expanded=False):
+        for trace in tracer.recent_traces(limit=3):
+            lines = []
+            for span_info in trace:
+                attributes = ', '.join(f"{key}={value}" for key, value in span_info['attributes'].items())
+                marker = ' ❌' if span_info['status'] == 'error' else ''
+                lines.append(
+                    f"{'  ' * span_info['depth']}{span_info['name']} "
+                    f"{span_info['duration'] * 1000:.1f} ms{marker}"
+                    + (f"  [{attributes}]" if attributes else "")
+                )
+            st.code('\n'.join(lines), language=None)
+
+        prefetch = get_chart_prefetcher().report()
+        if prefetch['scheduled']:
+            st.caption(
+                f"建議圖表: 預先繪製 {prefetch['rendered']}/{prefetch['scheduled']} 個，"
+                f"被使用 {prefetch['used']} 個，Gemini 呼叫 {prefetch['llm_calls']} 次"
+            )
+
+        gemini_client = st.session_state.get('gemini_client')
+        if gemini_client is not None and gemini_client.report():
+            st.caption("Gemini 模型用量")
+            st.dataframe(pd.DataFrame(gemini_client.report()), hide_index=True)
+
+        generation = get_generation_manager().report()
+        if generation['abandoned']:
+            reasons = '、'.join(f"{reason} {count}" for reason, count in generation['abandoned_by_reason'].items())
+            st.caption(f"Gemini 請求: 送出 {generation['submitted']} 次，被取消 {generation['abandoned']} 次（{reasons}）")
+
+        engines = get_query_engines()
+        if engines is not None:
+            engine_report = engines.report()
+            st.caption(
+                f"查詢引擎: {engine_report['engines']} 個數據集，匯入 {engine_report['built']} 次，"
+                f"重用 {engine_report['reused']} 次，失敗 {engine_report['failed']} 次"
+            )
+
+        summary = tracer.stage_summary()
+        if summary:
+            st.dataframe(pd.DataFrame(summary), hide_index=True)
+            st.download_button(
+                "下載 Prometheus 指標",
+                tracer.export_prometheus(),
+                file_name="chart_pipeline_metrics.prom",
+                mime="text/plain"
+            )
 
 def setup_gemini_client():
     """設定 Gemini 客戶端"""
@@ -68,49 +264,40 @@ def setup_gemini_client():
     
     return True
 
-def load_file(uploaded_file):
-    """載入 Excel 或 CSV 檔案"""
+def load_file(uploaded_file, dataset_hash):
+    """
+    載入 Excel 或 CSV 檔案
+
+    相同內容的檔案在所有 session 間共用，只有第一個 session 需要解析；
+    回傳共用數據集的引用。
+    """
     try:
-        # 儲存上傳的檔案
+        # 儲存上傳的檔案（以內容雜湊命名，之後重新載入時仍讀到同一份內容）
         uploads_dir = Path("uploads")
         uploads_dir.mkdir(exist_ok=True)
-        
-        file_path = uploads_dir / uploaded_file.name
-        with open(file_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        
-        # 根據檔案類型讀取
-        file_extension = uploaded_file.name.lower().split('.')[-1]
-        
-        if file_extension == 'xlsx':
-            df = pd.read_excel(file_path)
-        elif file_extension == 'csv':
-            # 嘗試不同的編碼格式
-            encodings = ['utf-8', 'gbk', 'big5', 'cp1252', 'iso-8859-1']
-            df = None
-            
-            for encoding in encodings:
-                try:
-                    df = pd.read_csv(file_path, encoding=encoding)
-                    st.info(f"使用 {encoding} 編碼成功載入 CSV")
-                    break
-                except UnicodeDecodeError:
-                    continue
-            
-            if df is None:
-                raise ValueError("無法使用常見編碼格式讀取 CSV 檔案")
-        
-        else:
-            raise ValueError(f"不支援的檔案格式: {file_extension}")
-        
-        # 清理欄位名稱（移除前後空白）
-        df.columns = df.columns.str.strip()
-        
-        return df, str(file_path)
+        file_path = uploads_dir / f"{dataset_hash}{Path(uploaded_file.name).suffix.lower()}"
+        if not file_path.exists():
+            with span('load_file.write', file_bytes=uploaded_file.size):
+                with open(file_path, "wb") as f:
+                    f.write(uploaded_file.getbuffer())
+        file_bytes = uploaded_file.size
+
+        # loader 會被數據集引用保留（暫存後重新載入時使用），只能引用檔案路徑，不能引用上傳內容
+        def loader():
+            with span('load_file', file_bytes=file_bytes):
+                # 根據檔案類型讀取
+                with span('load_file.parse') as parse_span:
+                    df, encoding = read_data_file(file_path)
+                    parse_span.set_attributes(rows=len(df), columns=len(df.columns), encoding=encoding)
+            if encoding:
+                st.info(f"使用 {encoding} 編碼成功載入 CSV")
+            return df
+
+        return get_memory_accountant().registry.acquire(dataset_hash, loader)
     
     except Exception as e:
         st.error(f"檔案載入失敗: {str(e)}")
-        return None, None
+        return None
 
 def display_data_analysis(data_analysis):
     """顯示數據分析結果"""
@@ -152,19 +339,257 @@ def display_data_analysis(data_analysis):
             if len(data_analysis['categorical']) > 5:
                 st.write(f"... 還有 {len(data_analysis['categorical']) - 5} 個")
 
-def generate_chart(user_query, data_analysis, gemini_client, chart_generator):
+def run_saved_code(code, chart_generator, figure_cache=None, dataset_hash=None):
+    """執行先前生成的代碼（不呼叫 Gemini；相同代碼已執行過時從圖表快取顯示）"""
+
+    is_safe, safety_msg = chart_generator.validate_chart_code(code)
+    if not is_safe:
+        return {'success': False, 'error': f"代碼安全檢查失敗: {safety_msg}"}
+
+    cache_key = None
+    if figure_cache is not None and dataset_hash:
+        cache_key = FigureCache.make_key(dataset_hash, code)
+        cached_figures = figure_cache.get(cache_key)
+        if cached_figures:
+            render_cached_figures(cached_figures)
+            return {'success': True, 'figures': cached_figures, 'cache_key': cache_key}
+
+    exec_result = chart_generator.execute_chart_code(code)
+    if cache_key and exec_result['success'] and exec_result.get('figures'):
+        figure_cache.put(cache_key, exec_result['figures'], code=code)
+    else:
+        cache_key = None
+    exec_result['cache_key'] = cache_key
+    return exec_result
+
+def display_profiling_progress(job, types_ready, done):
+    """
+    顯示背景分析的進度與目前已識別的欄位
+
+    以 fragment 定期更新；類型識別或全部分析完成時重新執行整頁，讓查詢區塊與完整結果出現。
+    """
+
+    if job.types_ready != types_ready or job.done != done:
+        st.rerun()
+
+    snapshot = job.snapshot()
+    total = max(1, snapshot['column_count'])
+    if not job.types_ready:
+        st.progress(
+            snapshot['columns_classified'] / total,
+            text=f"正在識別欄位類型... {snapshot['columns_classified']}/{snapshot['column_count']}"
+        )
+    elif not job.done:
+        st.progress(
+            snapshot['columns_profiled'] / total,
+            text=f"正在計算欄位統計... {snapshot['columns_profiled']}/{snapshot['column_count']}（已可輸入查詢）"
+        )
+
+    display_data_analysis(snapshot)
+
+    if job.done and not job.failed and snapshot['total_seconds'] is not None:
+        st.caption(
+            f"分析耗時 {snapshot['total_seconds']:.2f} 秒"
+            f"（欄位類型識別 {snapshot['types_seconds']:.2f} 秒）"
+        )
+
+def display_chart_suggestions(prefetch_job, done):
+    """
+    顯示預先繪製好的建議圖表，點選後直接從快取顯示
+
+    以 fragment 定期更新；全部繪製完成後不再更新。
+    """
+
+    if prefetch_job.done != done:
+        st.rerun()
+
+    entries = prefetch_job.entries()
+    ready = [entry for entry in entries if entry['status'] == 'ready']
+    if not ready:
+        if not prefetch_job.done:
+            st.caption(f"正在預先繪製建議圖表... 0/{len(entries)}")
+        return
+
+    st.write("**建議圖表**（已預先繪製，點選即可顯示）")
+    columns = st.columns(len(ready))
+    for column, entry in zip(columns, ready):
+        with column:
+            if st.button(entry['query'], key=f"suggestion_{entry['cache_key']}", use_container_width=True):
+                # 在整頁執行時顯示，讓圖表與歷史一起更新
+                st.session_state.picked_suggestion = entry
+                st.rerun()
+    if not prefetch_job.done:
+        st.caption(f"正在預先繪製建議圖表... {len(ready)}/{len(entries)}")
+
+def show_suggested_chart(entry, session_data, figure_cache, prefetcher):
+    """顯示點選的建議圖表（已被快取淘汰時重新執行對應的代碼）"""
+
+    dataset_hash = session_data.dataset_hash
+    cached_figures = figure_cache.get(entry['cache_key'])
+    if cached_figures:
+        render_cached_figures(cached_figures)
+        cache_key = entry['cache_key']
+    else:
+        chart_generator = create_chart_generator(session_data)
+        exec_result = run_saved_code(entry['code'], chart_generator, figure_cache, dataset_hash)
+        if not exec_result['success']:
+            st.error(f"圖表執行失敗: {exec_result['error']}")
+            return
+        cache_key = exec_result['cache_key']
+
+    st.success(f"已顯示建議圖表：{entry['query']}")
+    with st.expander("查看對應的代碼"):
+        st.code(entry['code'], language='python')
+    prefetcher.mark_used(dataset_hash, entry['cache_key'])
+    record_chart_history(entry['query'], entry['code'], cache_key)
+
+def request_chart_code(gemini_client, user_query, data_analysis, available_modules, **kwargs):
+    """
+    在背景事件迴圈生成代碼並等待結果（參數同 generate_chart_code）
+
+    同一 session 送出新查詢、重新執行或中斷連線時取消進行中的請求與等待中的重試，
+    被取代的查詢不再繼續消耗 API 配額。
+    """
+
+    manager = get_generation_manager()
+    ctx = get_script_run_ctx()
+    runtime = Runtime.instance() if Runtime.exists() else None
+    request = manager.submit(
+        st.session_state.session_data.session_id,
+        gemini_client.generate_chart_code_async(user_query, data_analysis, available_modules, **kwargs)
+    )
+    status = st.empty()
+
+    def on_tick(elapsed):
+        if runtime is not None and ctx is not None and not runtime.is_active_session(ctx.session_id):
+            manager.cancel(request, 'disconnected')
+            return
+        # 更新畫面時 Streamlit 會檢查是否有新的執行要求，有的話以例外中斷這次執行
+        status.caption(f"等待 Gemini 回應... {elapsed:.0f} 秒")
+
+    try:
+        result = manager.wait(request, on_tick=on_tick)
+    except RerunException:
+        manager.cancel(request, 'rerun')
+        raise
+    except StopException:
+        manager.cancel(request, 'stopped')
+        raise
+    except CancelledError:
+        result = {'success': False, 'error': f"請求已取消（{request.cancel_reason}）"}
+    status.empty()
+    return result
+
+def show_generation_usage(result):
+    """顯示 Gemini 請求使用的模型、token 用量與耗時"""
+    usage = result['usage']
+    st.caption(
+        f"模型: {result['model']}，tokens: 輸入 {usage['prompt_tokens']} / 輸出 {usage['response_tokens']}，"
+        f"耗時 {result['seconds']} 秒"
+    )
+
+def retry_with_error_feedback(user_query, data_analysis, gemini_client, chart_generator, failed_result):
+    """本地修正失敗後，附上錯誤訊息請 Gemini 重新生成並執行一次（失敗時回傳原本的結果）"""
+
+    st.warning(f"代碼執行失敗且無法在本地修正（{failed_result['error']}），正在依錯誤訊息重新生成...")
+    retry_result = request_chart_code(
+        gemini_client, user_query, data_analysis, chart_generator.available_modules,
+        error_feedback={'code': failed_result['code'], 'error': failed_result['error']}
+    )
+    if retry_result['success']:
+        show_generation_usage(retry_result)
+    if not retry_result['success'] or not chart_generator.validate_chart_code(retry_result['code'])[0]:
+        return failed_result
+
+    code = retry_result['code']
+    perf_result = chart_generator.check_performance(code)
+    if perf_result['success'] and perf_result['rewritten']:
+        code = perf_result['code']
+    return chart_generator.execute_with_repair(code, data_analysis)
+
+@traced('generate_chart')
+def generate_chart(user_query, data_analysis, gemini_client, chart_generator, figure_cache=None, dataset_hash=None,
+                   history_store=None, prefetcher=None):
     """生成圖表"""
 
+    # 相同數據集上的相同查詢：直接從快取重播，不呼叫 API 也不執行代碼
+    if figure_cache is not None and dataset_hash:
+        cached = figure_cache.lookup_query(dataset_hash, user_query)
+        if cached is not None:
+            cache_key, cached_code = cached
+            cached_figures = figure_cache.get(cache_key)
+            if cached_figures:
+                if prefetcher is not None and prefetcher.mark_used(dataset_hash, cache_key):
+                    st.success("已使用預先繪製的建議圖表")
+                else:
+                    st.success("已從快取載入相同查詢的圖表")
+                with st.expander("查看生成的代碼"):
+                    st.code(cached_code, language='python')
+                render_cached_figures(cached_figures)
+                record_chart_history(user_query, cached_code, cache_key)
+                return True
+
+    # 歷史中有相同查詢（例如重新啟動後快取已清空）：重用先前的代碼，不呼叫 API
+    if history_store is not None and dataset_hash:
+        previous = history_store.find_query(history_owner(), dataset_hash, user_query)
+        if previous is not None:
+            exec_result = run_saved_code(previous['code'], chart_generator, figure_cache, dataset_hash)
+            if exec_result['success'] and exec_result.get('figures'):
+                st.success("已重用歷史中相同查詢的代碼")
+                with st.expander("查看生成的代碼"):
+                    st.code(previous['code'], language='python')
+                if exec_result['cache_key']:
+                    figure_cache.remember_query(dataset_hash, user_query, exec_result['cache_key'])
+                record_chart_history(user_query, previous['code'], exec_result['cache_key'])
+                return True
+
+    # 簡單的查詢（例如「price 的直方圖」）直接以內建圖表函數繪製，不呼叫 API
+    intent = IntentRouter(data_analysis, threshold=INTENT_ROUTER_THRESHOLD).route(user_query)
+    if intent is not None and intent['confident']:
+        # 相同意圖已繪製過（包括預先繪製的建議圖表）時直接從快取顯示
+        if figure_cache is not None and dataset_hash:
+            cache_key = FigureCache.make_intent_key(dataset_hash, intent)
+            cached_figures = figure_cache.get(cache_key)
+            if cached_figures:
+                if prefetcher is not None and prefetcher.mark_used(dataset_hash, cache_key):
+                    st.success(f"已使用預先繪製的建議圖表：{intent['description']}")
+                else:
+                    st.success(f"已從快取載入{intent['description']}（未呼叫 AI）")
+                with st.expander("查看對應的代碼"):
+                    st.code(intent['code'], language='python')
+                render_cached_figures(cached_figures)
+                figure_cache.remember_query(dataset_hash, user_query, cache_key)
+                record_chart_history(user_query, intent['code'], cache_key)
+                return True
+
+        routed_result = chart_generator.create_intent_chart(intent, data_analysis)
+        if routed_result['success'] and routed_result.get('figure') is not None:
+            st.success(f"已直接生成{intent['description']}（未呼叫 AI）")
+            with st.expander("查看對應的代碼"):
+                st.code(intent['code'], language='python')
+            display_payload_reports([routed_result.get('payload_report')])
+
+            cache_key = None
+            if figure_cache is not None and dataset_hash:
+                cache_key = FigureCache.make_intent_key(dataset_hash, intent)
+                figure_cache.put(
+                    cache_key, [{'type': 'plotly', 'json': routed_result['figure'].to_json()}], code=intent['code']
+                )
+                figure_cache.remember_query(dataset_hash, user_query, cache_key)
+            record_chart_history(user_query, intent['code'], cache_key)
+            return True
+
     with st.spinner("正在分析您的需求並生成圖表..."):
         
         # 獲取可用模組資訊
         available_modules = chart_generator.available_modules
         
         # 調用 Gemini API 生成圖表代碼（傳入可用模組）
-        result = gemini_client.generate_chart_code(user_query, data_analysis, available_modules)
+        result = request_chart_code(gemini_client, user_query, data_analysis, available_modules)
         
         if result['success']:
             st.success(f"代碼生成成功！（第 {result['attempt']} 次嘗試）")
+            show_generation_usage(result)
 
             # 顯示生成的代碼
             with st.expander("查看生成的代碼"):
@@ -177,18 +602,89 @@ def generate_chart(user_query, data_analysis, gemini_client, chart_generator):
                 st.error(f"代碼安全檢查失敗: {safety_msg}")
                 return False
 
-            # 執行圖表代碼
-            exec_result = chart_generator.execute_chart_code(result['code'])
+            # 效能靜態分析
+            code = result['code']
+            perf_result = chart_generator.check_performance(code)
+
+            if perf_result['success'] and perf_result['needs_regeneration']:
+                st.warning("生成的代碼包含逐行處理，正在要求重新生成向量化版本...")
+                retry_result = request_chart_code(
+                    gemini_client, user_query, data_analysis, available_modules,
+                    performance_hint=perf_result['hint']
+                )
+                if retry_result['success']:
+                    show_generation_usage(retry_result)
+
+                if retry_result['success'] and chart_generator.validate_chart_code(retry_result['code'])[0]:
+                    code = retry_result['code']
+                    perf_result = chart_generator.check_performance(code)
+
+                    with st.expander("查看重新生成的代碼"):
+                        st.code(code, language='python')
+
+            if perf_result['success']:
+                if perf_result['rewritten']:
+                    code = perf_result['code']
+                    st.info("已自動將大型散點圖/pairplot 改寫為採樣版本")
+                    for issue in perf_result['issues']:
+                        if issue['fixable']:
+                            st.caption(f"• {issue['message']}")
+
+                cost = perf_result['estimated_cost']
+                st.caption(
+                    f"預估執行成本: {cost['level']}（約 {cost['estimated_seconds']} 秒，"
+                    f"繪製 {cost['rendered_points']} 個點）"
+                )
+
+            # 相同數據與相同代碼已執行過時，直接從快取顯示
+            cache_key = None
+            cached_figures = None
+            if figure_cache is not None and dataset_hash:
+                cache_key = FigureCache.make_key(dataset_hash, code)
+                cached_figures = figure_cache.get(cache_key)
+
+            if cached_figures:
+                render_cached_figures(cached_figures)
+                exec_result = {'success': True, 'figures': cached_figures}
+            else:
+                # 執行圖表代碼；欄位名稱、模組別名、日期轉換等常見錯誤先在本地修正
+                exec_result = chart_generator.execute_with_repair(code, data_analysis)
+                if exec_result['success'] and exec_result['repairs']:
+                    st.info(f"已在本地修正代碼（未呼叫 AI）：{'；'.join(exec_result['repairs'])}")
+
+                if not exec_result['success']:
+                    exec_result = retry_with_error_feedback(
+                        user_query, data_analysis, gemini_client, chart_generator, exec_result
+                    )
+
+                # 快取與歷史記錄實際執行成功的代碼
+                if exec_result['success'] and exec_result['code'] != code:
+                    code = exec_result['code']
+                    with st.expander("查看修正後的代碼"):
+                        st.code(code, language='python')
+                    if cache_key is not None:
+                        cache_key = FigureCache.make_key(dataset_hash, code)
 
             if exec_result['success']:
                 st.success("圖表生成成功！")
+                display_payload_reports(exec_result.get('payload_reports', []))
+
+                render_report = exec_result.get('render_report')
+                if render_report and (render_report['figures_leaked'] or render_report['artists_rasterized']):
+                    st.caption(
+                        f"matplotlib: 已自動關閉 {render_report['figures_leaked']} 個未顯示的圖表，"
+                        f"點陣化 {render_report['artists_rasterized']} 個高密度圖層"
+                    )
+
+                # 快取產生的圖表
+                if cache_key and exec_result.get('figures'):
+                    figure_cache.put(cache_key, exec_result['figures'], code=code)
+                    figure_cache.remember_query(dataset_hash, user_query, cache_key)
                 
                 # 記錄到歷史
-                st.session_state.chart_history.append({
-                    'query': user_query,
-                    'code': result['code'],
-                    'timestamp': pd.Timestamp.now()
-                })
+                record_chart_history(
+                    user_query, code, cache_key if exec_result.get('figures') else None
+                )
                 
                 return True
             
@@ -212,6 +708,7 @@ def generate_chart(user_query, data_analysis, gemini_client, chart_generator):
 
                 if fallback_result['success']:
                     st.warning(f"已生成後備圖表: {fallback_result['message']}")
+                    display_payload_reports([fallback_result.get('payload_report')])
                     return True
                 else:
                     st.error(f"後備圖表也失敗了: {fallback_result['error']}")
@@ -226,11 +723,80 @@ def generate_chart(user_query, data_analysis, gemini_client, chart_generator):
 
             if fallback_result['success']:
                 st.warning(f"已生成後備圖表: {fallback_result['message']}")
+                display_payload_reports([fallback_result.get('payload_report')])
                 return True
             else:
                 st.error(f"後備圖表也失敗了: {fallback_result['error']}")
                 return False
 
+def change_history_page(delta):
+    """切換圖表歷史的頁碼"""
+    st.session_state.history_page = max(0, st.session_state.history_page + delta)
+
+def display_chart_history(history_store, session_data, figure_cache):
+    """分頁顯示目前使用者的圖表歷史，並可搜尋其所有數據集過去的查詢（代碼在勾選後才讀取）"""
+
+    owner = history_owner()
+    dataset_hash = session_data.dataset_hash
+    total = history_store.count(owner, dataset_hash)
+
+    st.header("圖表歷史")
+    search_text = st.text_input(
+        "搜尋過去的查詢",
+        key="history_search",
+        placeholder="例如：趨勢、price、各產品類別"
+    )
+
+    if search_text:
+        records = history_store.search(owner, search_text, limit=PAGE_SIZE * 2)
+        st.caption(f"找到 {len(records)} 筆（包含其他數據集）")
+    elif total:
+        pages = math.ceil(total / PAGE_SIZE)
+        page = min(st.session_state.history_page, pages - 1)
+        records = history_store.page(owner, dataset_hash, page)
+
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            st.button("上一頁", on_click=change_history_page, args=(-1,), disabled=page == 0)
+        with col2:
+            st.caption(f"第 {page + 1} / {pages} 頁（共 {total} 筆）")
+        with col3:
+            st.button("下一頁", on_click=change_history_page, args=(1,), disabled=page >= pages - 1)
+    else:
+        st.caption("尚無圖表歷史")
+        return
+
+    for record in records:
+        other_dataset = record['dataset_hash'] != dataset_hash
+        timestamp = datetime.fromtimestamp(record['created_at']).strftime('%m-%d %H:%M:%S')
+        label = f"{timestamp} - {record['query'][:50]}..." + ("（其他數據集）" if other_dataset else "")
+
+        with st.expander(label):
+            st.write(f"**查詢:** {record['query']}")
+            history_key = f"history_{record['id']}"
+
+            if st.checkbox("顯示代碼", key=f"{history_key}_code"):
+                code = history_store.get(owner, record['id'])['code']
+                st.code(code, language='python')
+
+                # 重用代碼：在目前的數據集上執行，不呼叫 API
+                if st.button("在目前數據集上執行", key=f"{history_key}_run"):
+                    chart_generator = create_chart_generator(session_data)
+                    exec_result = run_saved_code(code, chart_generator, figure_cache, dataset_hash)
+                    if exec_result['success']:
+                        record_chart_history(record['query'], code, exec_result['cache_key'])
+                    else:
+                        st.error(f"圖表執行失敗: {exec_result['error']}")
+
+            # 從圖表快取重播，不重新執行代碼
+            if record['cache_key'] and not other_dataset:
+                if st.checkbox("顯示圖表", key=f"{history_key}_show"):
+                    cached_figures = figure_cache.get(record['cache_key'])
+                    if cached_figures:
+                        render_cached_figures(cached_figures, key_prefix=history_key)
+                    else:
+                        st.info("圖表已從快取中移除，請重新生成")
+
 def main():
     """主函數"""
     
@@ -258,14 +824,23 @@ def main():
         # 顯示使用說明
         st.header("使用說明")
         st.write("1. 上傳 Excel 或 CSV 檔案")
-        st.write("2. 點擊分析數據")
+        st.write("2. 等待數據分析（識別欄位類型後即可輸入查詢）")
         st.write("3. 描述想要的圖表")
         st.write("4. 生成圖表")
         
-        if st.session_state.df is not None:
+        session_data = st.session_state.session_data
+        if session_data.shape is not None:
             st.markdown("---")
-            st.write(f"**當前檔案:** {len(st.session_state.df)} 行")
-            st.write(f"**欄位數:** {len(st.session_state.df.columns)} 個")
+            st.write(f"**當前檔案:** {session_data.shape[0]} 行")
+            st.write(f"**欄位數:** {session_data.shape[1]} 個")
+
+        # matplotlib 圖表註冊表狀態
+        render_stats = RenderManager.get_stats()
+        if render_stats['executions']:
+            st.caption(
+                f"matplotlib 圖表: 目前開啟 {render_stats['open_figures']} 個，"
+                f"累計自動關閉 {render_stats['figures_leaked']} 個未顯示的圖表"
+            )
     
     # 主要內容區域
     # 步驟1: 上傳檔案
@@ -278,11 +853,21 @@ def main():
     )
     
     if uploaded_file is not None:
-        # 載入數據
-        df, file_path = load_file(uploaded_file)
+        session_data = st.session_state.session_data
+
+        # 同一個上傳檔案只載入一次，之後從共用的數據集登錄表取得（可能需從磁碟暫存載回）
+        file_id = getattr(uploaded_file, 'file_id', uploaded_file.name)
+        if session_data.file_id != file_id:
+            # 以檔案內容計算數據集雜湊
+            lease = load_file(uploaded_file, fingerprint_bytes(uploaded_file.getbuffer()))
+            if lease is not None:
+                session_data.set_dataset(lease, file_id)
+                # 載入後立即在背景開始分析
+                session_data.start_profiling()
+
+        df = session_data.df if session_data.file_id == file_id else None
         
         if df is not None:
-            st.session_state.df = df
             st.success(f"檔案載入成功！共 {len(df)} 行，{len(df.columns)} 欄")
 
             # 顯示數據預覽
@@ -292,21 +877,32 @@ def main():
             # 步驟2: 分析數據
             st.header("步驟 2: 數據分析")
 
-            if st.button("開始分析數據", type="primary"):
-                with st.spinner("正在分析數據結構..."):
-                    analyzer = DataAnalyzer(df)
-                    data_analysis = analyzer.analyze_data()
-                    st.session_state.data_analysis = data_analysis
+            # 分析進行中時定期更新已識別的欄位；完成後不再更新
+            job = session_data.profiling_job or session_data.start_profiling()
+            refresh = None if job.done else PROFILING_REFRESH_SECONDS
+            st.fragment(display_profiling_progress, run_every=refresh)(job, job.types_ready, job.done)
 
-                st.success("數據分析完成！")
+            if job.failed:
+                st.error(f"數據分析失敗: {job.error}")
+                if st.button("重新分析"):
+                    session_data.start_profiling(retry_failed=True)
+                    st.rerun()
             
-            # 顯示分析結果
-            if st.session_state.data_analysis is not None:
-                display_data_analysis(st.session_state.data_analysis)
-                
+            # 欄位類型識別完成後即可生成圖表（統計可能仍在背景計算）
+            if session_data.data_analysis is not None:
                 # 步驟3: 生成圖表
                 st.header("步驟 3: 生成圖表")
 
+                # 分析完成後在背景預先繪製建議圖表（輸入查詢期間即可完成）
+                prefetcher = get_chart_prefetcher()
+                if job.done and not job.failed:
+                    prefetch_job = prefetcher.prefetch(
+                        session_data.dataset_hash, df, session_data.data_analysis,
+                        gemini_client=st.session_state.gemini_client
+                    )
+                    refresh = None if prefetch_job.done else PROFILING_REFRESH_SECONDS
+                    st.fragment(display_chart_suggestions, run_every=refresh)(prefetch_job, prefetch_job.done)
+
                 # 用戶輸入
                 user_query = st.text_area(
                     "描述您想要的圖表:",
@@ -322,26 +918,38 @@ def main():
                 with col2:
                     clear_btn = st.button("清除歷史")
                     if clear_btn:
-                        st.session_state.chart_history = []
+                        get_history_store().clear(history_owner(), session_data.dataset_hash)
+                        st.session_state.history_page = 0
                         st.success("歷史已清除！")
                 
+                picked = st.session_state.pop('picked_suggestion', None)
+                if picked is not None:
+                    show_suggested_chart(picked, session_data, get_figure_cache(), prefetcher)
+                
                 if generate_btn and user_query:
-                    chart_generator = ChartGenerator(st.session_state.df)
+                    chart_generator = create_chart_generator(session_data)
                     generate_chart(
                         user_query, 
-                        st.session_state.data_analysis,
+                        session_data.data_analysis,
                         st.session_state.gemini_client,
-                        chart_generator
+                        chart_generator,
+                        figure_cache=get_figure_cache(),
+                        dataset_hash=session_data.dataset_hash,
+                        history_store=get_history_store(),
+                        prefetcher=prefetcher
                     )
                 
                 # 圖表歷史
-                if st.session_state.chart_history:
-                    st.header("圖表歷史")
+                display_chart_history(get_history_store(), session_data, get_figure_cache())
+
+    # 執行結束時檢查記憶體預算（閒置 session 的數據集會被暫存到磁碟）
+    accountant = get_memory_accountant()
+    accountant.enforce(active_session_id=st.session_state.session_data.session_id)
+    display_memory_usage(st.session_state.session_data, accountant)
 
-                    for i, record in enumerate(reversed(st.session_state.chart_history[-5:])):
-                        with st.expander(f"{record['timestamp'].strftime('%H:%M:%S')} - {record['query'][:50]}..."):
-                            st.write(f"**查詢:** {record['query']}")
-                            st.code(record['code'], language='python')
+    # 放在最後，才能包含本次執行的追蹤
+    if DEBUG_MODE:
+        display_debug_panel()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,258 @@
+"""
+無介面批次圖表生成
+
+用法：
+    python batch_generate.py manifest.json -o batch_output
+
+manifest 可以是 JSON 清單或 CSV（欄位：file, query，可選 id）：
+    [{"file": "uploads/sales.csv", "query": "各產品類別的平均價格"}, ...]
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from pathlib import Path
+from typing import Dict, Any, List
+
+from dotenv import load_dotenv
+
+# 載入環境變數
+load_dotenv()
+
+from modules.data_analyzer import DataAnalyzer
+from modules.gemini_client import GeminiClient
+from modules.chart_generator import ChartGenerator
+from modules.query_engine import QueryEngineCache
+from modules.chart_pipeline import run_chart_query
+from modules.file_loader import read_data_file
+from modules.figure_cache import fingerprint_bytes
+from modules.figure_optimizer import figure_from_json
+
+
+def load_manifest(manifest_path: str) -> List[Dict[str, Any]]:
+    """讀取 (file, query) 清單"""
+
+    path = Path(manifest_path)
+
+    if path.suffix.lower() == '.csv':
+        with open(path, newline='', encoding='utf-8') as f:
+            entries = list(csv.DictReader(f))
+    else:
+        with open(path, encoding='utf-8') as f:
+            entries = json.load(f)
+
+    jobs = []
+    for i, entry in enumerate(entries):
+        if not entry.get('file') or not entry.get('query'):
+            raise ValueError(f"manifest 第 {i + 1} 筆缺少 file 或 query")
+
+        # 相對路徑以 manifest 所在目錄為準
+        file_path = Path(entry['file'])
+        if not file_path.is_absolute():
+            file_path = path.parent / file_path
+
+        jobs.append({
+            'id': str(entry.get('id') or f'{i + 1:04d}'),
+            'file': str(file_path),
+            'query': entry['query']
+        })
+
+    return jobs
+
+
+class BatchPipeline:
+    """以階段信號量限制並行度的批次管線：載入/分析 → Gemini 生成 → 執行"""
+
+    def __init__(self, gemini_client: GeminiClient, output_dir: str, load_workers: int = 2,
+                 llm_workers: int = 8, exec_workers: int = 2, use_fallback: bool = True,
+                 embed_plotlyjs: bool = False):
+        """
+        Args:
+            gemini_client: Gemini 客戶端
+            output_dir: 輸出目錄
+            load_workers: 同時解析/分析的檔案數（CPU）
+            llm_workers: 同時進行的 Gemini 請求數（I/O）
+            exec_workers: 同時執行的圖表代碼數（CPU）
+            use_fallback: 代碼失敗時是否輸出後備圖表
+            embed_plotlyjs: HTML 是否內嵌 plotly.js（否則使用 CDN）
+        """
+        self.gemini_client = gemini_client
+        self.output_dir = Path(output_dir)
+        self.use_fallback = use_fallback
+        self.embed_plotlyjs = embed_plotlyjs
+
+        self.load_workers = load_workers
+        self.llm_workers = llm_workers
+        self.exec_workers = exec_workers
+        self._load_slots = threading.Semaphore(load_workers)
+        self._llm_slots = threading.Semaphore(llm_workers)
+        self._exec_slots = threading.Semaphore(exec_workers)
+
+        # QUERY_ENGINE=duckdb 時，生成的代碼可在 DuckDB 內聚合
+        self.query_engines = QueryEngineCache.from_env()
+
+        # 同一檔案只解析與分析一次
+        self._datasets = {}
+        self._datasets_lock = threading.Lock()
+
+    def run(self, jobs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """執行所有工作並寫出結果索引"""
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        started = time.perf_counter()
+
+        # 每個工作一個執行緒，實際並行度由各階段的信號量控制
+        max_workers = self.load_workers + self.llm_workers + self.exec_workers
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='batch') as executor:
+            results = list(executor.map(self._run_job, jobs))
+
+        index = {
+            'total': len(results),
+            'succeeded': sum(1 for result in results if result['success']),
+            'elapsed_seconds': round(time.perf_counter() - started, 3),
+            'results': results
+        }
+        with open(self.output_dir / 'results.json', 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+
+        return results
+
+    def _get_dataset(self, file_path: str) -> Dict[str, Any]:
+        """取得（必要時載入並分析）數據集"""
+
+        with self._datasets_lock:
+            future = self._datasets.get(file_path)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._datasets[file_path] = future
+
+        if owner:
+            try:
+                with self._load_slots:
+                    df, _ = read_data_file(file_path)
+                    data_analysis = DataAnalyzer(df).analyze_data()
+                    with open(file_path, 'rb') as f:
+                        dataset_hash = fingerprint_bytes(f.read())
+                future.set_result({
+                    'df': df,
+                    'data_analysis': data_analysis,
+                    'dataset_hash': dataset_hash
+                })
+            except Exception as e:
+                future.set_exception(e)
+
+        return future.result()
+
+    def _run_job(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """執行單一 (file, query) 工作"""
+
+        result = {
+            'id': job['id'],
+            'file': job['file'],
+            'query': job['query'],
+            'success': False,
+            'fallback': False,
+            'code': None,
+            'repairs': [],
+            'outputs': [],
+            'error': None,
+            'timings': {},
+            'llm_calls': []
+        }
+
+        try:
+            stage_start = time.perf_counter()
+            dataset = self._get_dataset(job['file'])
+            result['timings']['load_analyze'] = round(time.perf_counter() - stage_start, 3)
+
+            # 每個工作使用自己的 ChartGenerator（渲染報告是實例狀態），數據與分析結果共用
+            query_engine = None
+            if self.query_engines is not None:
+                query_engine = self.query_engines.get(dataset['dataset_hash'], job['file'],
+                                                      df_loader=lambda: dataset['df'])
+            chart_generator = ChartGenerator(dataset['df'], dataset_key=dataset['dataset_hash'],
+                                             show_module_status=False, query_engine=query_engine)
+            data_analysis = dataset['data_analysis']
+
+            query_result = run_chart_query(
+                chart_generator, self.gemini_client, data_analysis, job['query'],
+                use_fallback=self.use_fallback, llm_slot=self._llm_slots, exec_slot=self._exec_slots
+            )
+            result['timings'].update(query_result['timings'])
+            for key in ('success', 'fallback', 'code', 'repairs', 'error', 'llm_calls'):
+                result[key] = query_result[key]
+            if query_result['figures']:
+                result['outputs'] = self._write_figures(job['id'], query_result['figures'])
+
+        except Exception as e:
+            result['error'] = f'{type(e).__name__}: {str(e)}'
+
+        status = '✓' if result['success'] else '✗'
+        print(f"[{status}] {job['id']} {job['query'][:40]}", file=sys.stderr)
+        return result
+
+    def _write_figures(self, job_id: str, figures: List[Dict[str, Any]]) -> List[str]:
+        """將擷取的圖表寫成 HTML（plotly）或 PNG（matplotlib）"""
+
+        safe_id = re.sub(r'[^\w.-]', '_', job_id)
+        outputs = []
+
+        for i, figure in enumerate(figures):
+            if figure['type'] == 'plotly':
+                path = self.output_dir / f'{safe_id}_{i}.html'
+                figure_from_json(figure['json']).write_html(
+                    str(path), include_plotlyjs=True if self.embed_plotlyjs else 'cdn'
+                )
+            else:
+                path = self.output_dir / f'{safe_id}_{i}.png'
+                path.write_bytes(figure['data'])
+            outputs.append(path.name)
+
+        return outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批次生成圖表（不需要 Streamlit 介面）')
+    parser.add_argument('manifest', help='(file, query) 清單，JSON 或 CSV')
+    parser.add_argument('-o', '--output', default='batch_output', help='輸出目錄')
+    parser.add_argument('--load-workers', type=int, default=2, help='同時解析/分析的檔案數')
+    parser.add_argument('--llm-workers', type=int, default=8, help='同時進行的 Gemini 請求數')
+    parser.add_argument('--exec-workers', type=int, default=2, help='同時執行的圖表代碼數')
+    parser.add_argument('--no-fallback', action='store_true', help='失敗時不輸出後備圖表')
+    parser.add_argument('--embed-plotlyjs', action='store_true', help='HTML 內嵌 plotly.js（可離線開啟）')
+    args = parser.parse_args()
+
+    api_key = os.getenv('GEMINI_API_KEY')
+    if not api_key or api_key == 'your_api_key_here':
+        parser.error('請在 .env 檔案中設定 GEMINI_API_KEY')
+
+    jobs = load_manifest(args.manifest)
+    gemini_client = GeminiClient(api_key)
+    pipeline = BatchPipeline(
+        gemini_client,
+        args.output,
+        load_workers=args.load_workers,
+        llm_workers=args.llm_workers,
+        exec_workers=args.exec_workers,
+        use_fallback=not args.no_fallback,
+        embed_plotlyjs=args.embed_plotlyjs
+    )
+    results = pipeline.run(jobs)
+
+    succeeded = sum(1 for result in results if result['success'])
+    print(f"完成 {succeeded}/{len(results)} 個圖表，結果索引: {Path(args.output) / 'results.json'}")
+    for stats in gemini_client.report():
+        print(f"  {stats['model']}: {stats['requests']} 次請求，輸入 {stats['prompt_tokens']} / "
+              f"輸出 {stats['response_tokens']} tokens，平均 {stats['mean_seconds']} 秒")
+    return 0 if succeeded == len(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
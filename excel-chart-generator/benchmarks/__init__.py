@@ -0,0 +1,10 @@
+"""
+效能基準測試
+
+在 excel-chart-generator 目錄下執行：
+    python -m benchmarks --profile quick                 # 執行並與基準線比較
+    python -m benchmarks --profile quick --save-baseline # 更新基準線
+"""
+
+from benchmarks.datasets import generate_dataframe, materialize, get_profile, PROFILES
+from benchmarks.runner import run_benchmarks, measure, compare_to_baseline, load_baseline, save_baseline
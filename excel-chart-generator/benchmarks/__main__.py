@@ -0,0 +1,65 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from benchmarks.datasets import get_profile, PROFILES, DEFAULT_DATA_DIR
+from benchmarks.runner import (
+    run_benchmarks, compare_to_baseline, load_baseline, save_baseline, DEFAULT_BASELINE
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='圖表生成流程的效能基準測試')
+    parser.add_argument('--profile', choices=list(PROFILES), default='quick', help='數據集規模')
+    parser.add_argument('--repeat', type=int, default=3, help='每項測試的計時次數')
+    parser.add_argument('--only', help='只執行名稱包含此字串的測試，例如 medium/ 或 fallback:')
+    parser.add_argument('--no-memory', action='store_true', help='不量測記憶體峰值（較快）')
+    parser.add_argument('--data-dir', default=str(DEFAULT_DATA_DIR), help='合成數據快取目錄')
+    parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help='基準線 JSON 路徑')
+    parser.add_argument('--save-baseline', action='store_true', help='將本次結果存為基準線')
+    parser.add_argument('--output', help='另存本次結果的 JSON 路徑')
+    args = parser.parse_args()
+
+    report = run_benchmarks(
+        get_profile(args.profile),
+        data_dir=Path(args.data_dir),
+        repeat=args.repeat,
+        track_memory=not args.no_memory,
+        only=args.only
+    )
+    report['meta']['profile'] = args.profile
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    failed = [name for name, result in report['results'].items() if not result['ok']]
+    for name in failed:
+        print(f"失敗: {name}: {report['results'][name]['error']}")
+
+    if args.save_baseline:
+        save_baseline(report, Path(args.baseline))
+        print(f"已儲存基準線: {args.baseline}")
+        return 0
+
+    if not Path(args.baseline).exists():
+        print(f"找不到基準線 {args.baseline}，請先以 --save-baseline 建立")
+        return 0
+
+    regressions = compare_to_baseline(report, load_baseline(Path(args.baseline)))
+    if not regressions:
+        print('沒有效能回歸')
+        return 0
+
+    print(f'發現 {len(regressions)} 項回歸：')
+    for item in regressions:
+        if item['metric'] == 'ok':
+            print(f"  {item['name']}: 基準線成功，本次失敗（{item['error']}）")
+        else:
+            print(f"  {item['name']}: {item['metric']} {item['baseline']} → {item['current']}（×{item['ratio']}）")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
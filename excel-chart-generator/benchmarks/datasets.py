@@ -0,0 +1,171 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, Any, List
+
+import numpy as np
+import pandas as pd
+
+# 基準測試使用的固定欄位（罐頭代碼與後備圖表依賴這些名稱）
+BASE_COLUMNS = ['date', 'region', 'value', 'quantity', 'amount', 'sku']
+
+# 混合格式的日期字串
+DATE_FORMATS = ['%Y-%m-%d', '%Y/%m/%d', '%d-%b-%Y', '%Y年%m月%d日']
+
+# big5 與 gbk 都能編碼的地區名稱
+REGIONS = ['台北', '台中', '高雄', '台南', '新竹', '桃園', '基隆', '嘉義']
+
+# 格式化字串的取樣池上限（避免千萬行時逐一格式化）
+FORMAT_POOL_SIZE = 200000
+SKU_POOL_SIZE = 1000000
+
+# XLSX 的行數上限
+XLSX_MAX_ROWS = 1048575
+
+DEFAULT_DATA_DIR = Path(__file__).parent / '.data'
+
+
+# 各測試規模的數據集組合
+PROFILES = {
+    'quick': [
+        {'name': 'small', 'rows': 1000, 'cols': 6, 'format': 'csv', 'encoding': 'utf-8'},
+        {'name': 'medium', 'rows': 100000, 'cols': 12, 'format': 'csv', 'encoding': 'utf-8'},
+        {'name': 'medium_big5', 'rows': 100000, 'cols': 8, 'format': 'csv', 'encoding': 'big5'},
+        {'name': 'wide', 'rows': 10000, 'cols': 200, 'format': 'csv', 'encoding': 'utf-8'},
+    ],
+    'standard': [
+        {'name': 'small', 'rows': 1000, 'cols': 6, 'format': 'csv', 'encoding': 'utf-8'},
+        {'name': 'medium', 'rows': 100000, 'cols': 12, 'format': 'csv', 'encoding': 'utf-8'},
+        {'name': 'medium_big5', 'rows': 100000, 'cols': 8, 'format': 'csv', 'encoding': 'big5'},
+        {'name': 'medium_xlsx', 'rows': 50000, 'cols': 12, 'format': 'xlsx', 'encoding': None},
+        {'name': 'large_gbk', 'rows': 1000000, 'cols': 12, 'format': 'csv', 'encoding': 'gbk'},
+        {'name': 'very_wide', 'rows': 10000, 'cols': 1000, 'format': 'csv', 'encoding': 'utf-8'},
+    ],
+    'full': [
+        {'name': 'small', 'rows': 1000, 'cols': 6, 'format': 'csv', 'encoding': 'utf-8'},
+        {'name': 'medium', 'rows': 100000, 'cols': 12, 'format': 'csv', 'encoding': 'utf-8'},
+        {'name': 'medium_big5', 'rows': 100000, 'cols': 8, 'format': 'csv', 'encoding': 'big5'},
+        {'name': 'medium_xlsx', 'rows': 50000, 'cols': 12, 'format': 'xlsx', 'encoding': None},
+        {'name': 'large_gbk', 'rows': 1000000, 'cols': 12, 'format': 'csv', 'encoding': 'gbk'},
+        {'name': 'very_wide', 'rows': 10000, 'cols': 1000, 'format': 'csv', 'encoding': 'utf-8'},
+        {'name': 'huge', 'rows': 10000000, 'cols': 8, 'format': 'csv', 'encoding': 'utf-8'},
+    ],
+}
+
+
+def _pooled_strings(rng: np.random.Generator, rows: int, pool: np.ndarray) -> np.ndarray:
+    """從已格式化的字串池隨機取值"""
+    return pool[rng.integers(0, len(pool), size=rows)]
+
+
+def _mixed_dates(rng: np.random.Generator, rows: int) -> np.ndarray:
+    """約十年範圍內、隨機混用多種格式的日期字串"""
+    days = pd.date_range('2015-01-01', periods=3650, freq='D')
+    pool = np.array([day.strftime(fmt) for fmt in DATE_FORMATS for day in days], dtype=object)
+    return _pooled_strings(rng, rows, pool)
+
+
+def _currency(rng: np.random.Generator, rows: int) -> np.ndarray:
+    """含貨幣符號與千分位的金額字串，例如 $1,234.50 或 NT$12,000"""
+    pool_size = min(rows, FORMAT_POOL_SIZE)
+    amounts = rng.lognormal(mean=7, sigma=1.5, size=pool_size)
+    prefixes = rng.choice(['$', 'NT$'], size=pool_size)
+    pool = np.array([f'{prefix}{amount:,.2f}' for prefix, amount in zip(prefixes, amounts)], dtype=object)
+    return _pooled_strings(rng, rows, pool)
+
+
+def _high_cardinality(rng: np.random.Generator, rows: int, prefix: str = 'SKU') -> np.ndarray:
+    """高基數類別（約為行數的一半）"""
+    pool_size = max(1, min(rows // 2, SKU_POOL_SIZE))
+    pool = np.array([f'{prefix}-{i:07d}' for i in range(pool_size)], dtype=object)
+    return _pooled_strings(rng, rows, pool)
+
+
+def generate_dataframe(rows: int, cols: int, seed: int = 42) -> pd.DataFrame:
+    """
+    產生合成數據集
+
+    前幾個欄位固定為 BASE_COLUMNS（混合格式日期、中文地區、數值、整數、貨幣字串、高基數 SKU），
+    其餘欄位依序輪流為浮點數、整數、低基數類別與高基數類別。
+
+    Args:
+        rows: 行數
+        cols: 欄位數（至少 5）
+        seed: 亂數種子
+    """
+
+    if cols < 5:
+        raise ValueError('欄位數至少為 5')
+
+    rng = np.random.default_rng(seed)
+    region_codes = rng.integers(0, len(REGIONS), size=rows)
+
+    columns = {
+        'date': _mixed_dates(rng, rows),
+        'region': np.array(REGIONS, dtype=object)[region_codes],
+        # 與地區相關的數值，讓分組結果有差異
+        'value': rng.normal(loc=100 + region_codes * 10, scale=25, size=rows).round(2),
+        'quantity': rng.poisson(lam=20, size=rows),
+        'amount': _currency(rng, rows),
+        'sku': _high_cardinality(rng, rows),
+    }
+    data = {name: columns[name] for name in BASE_COLUMNS[:cols]}
+
+    for i in range(cols - len(data)):
+        kind = i % 4
+        if kind == 0:
+            data[f'metric_{i}'] = rng.normal(size=rows).round(4)
+        elif kind == 1:
+            data[f'count_{i}'] = rng.integers(0, 1000, size=rows)
+        elif kind == 2:
+            data[f'category_{i}'] = np.array(list('ABCDEFGH'), dtype=object)[rng.integers(0, 8, size=rows)]
+        else:
+            data[f'code_{i}'] = _high_cardinality(rng, rows, prefix=f'C{i}')
+
+    return pd.DataFrame(data)
+
+
+def dataset_path(spec: Dict[str, Any], data_dir: Path = DEFAULT_DATA_DIR) -> Path:
+    """依規格計算快取檔案路徑（規格改變時會產生新檔案）"""
+    digest = hashlib.sha256(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    return Path(data_dir) / f"{spec['name']}_{digest}.{spec['format']}"
+
+
+def materialize(spec: Dict[str, Any], data_dir: Path = DEFAULT_DATA_DIR, seed: int = 42) -> Path:
+    """
+    產生（或重用已快取的）數據集檔案
+
+    Args:
+        spec: 數據集規格 {'name', 'rows', 'cols', 'format', 'encoding'}
+        data_dir: 快取目錄
+        seed: 亂數種子
+
+    Returns:
+        檔案路徑
+    """
+
+    path = dataset_path(spec, data_dir)
+    if path.exists():
+        return path
+
+    if spec['format'] == 'xlsx' and spec['rows'] > XLSX_MAX_ROWS:
+        raise ValueError(f"XLSX 最多 {XLSX_MAX_ROWS} 行")
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    df = generate_dataframe(spec['rows'], spec['cols'], seed=seed)
+
+    temp_path = path.with_name(path.stem + '.tmp' + path.suffix)
+    if spec['format'] == 'xlsx':
+        df.to_excel(temp_path, index=False)
+    else:
+        df.to_csv(temp_path, index=False, encoding=spec.get('encoding') or 'utf-8')
+    temp_path.replace(path)
+
+    return path
+
+
+def get_profile(name: str) -> List[Dict[str, Any]]:
+    """取得測試規模對應的數據集規格"""
+    if name not in PROFILES:
+        raise ValueError(f"未知的測試規模: {name}（可用: {', '.join(PROFILES)}）")
+    return PROFILES[name]
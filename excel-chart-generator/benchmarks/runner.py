@@ -0,0 +1,285 @@
+import gc
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+import warnings
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Callable, Tuple
+
+import pandas as pd
+import streamlit.logger
+from streamlit import config as streamlit_config
+
+from modules.chart_generator import ChartGenerator
+from modules.data_analyzer import DataAnalyzer
+from modules.file_loader import read_data_file
+from modules.figure_cache import fingerprint_bytes
+from benchmarks.datasets import materialize, DEFAULT_DATA_DIR
+
+DEFAULT_BASELINE = Path(__file__).parent / 'baseline.json'
+
+# 預設的回歸門檻：同時超過比例與絕對差值才算回歸（避免小數值的雜訊）
+DEFAULT_THRESHOLDS = {
+    'time_ratio': 1.3,
+    'min_seconds': 0.1,
+    'memory_ratio': 1.25,
+    'min_memory_mb': 5.0
+}
+
+# 行數超過此值時只跑一次計時
+SINGLE_RUN_ROWS = 1000000
+
+# 暖身用的小數據集（先觸發 plotly/matplotlib 的延遲載入，避免算進第一項測試）
+WARMUP_SPEC = {'name': 'warmup', 'rows': 200, 'cols': 6, 'format': 'csv', 'encoding': 'utf-8'}
+
+# 模擬 Gemini 生成的代碼（欄位名稱來自 benchmarks.datasets.BASE_COLUMNS）
+CANNED_CODE = {
+    'groupby_bar': (
+        "summary = df.groupby('region')['value'].mean().reset_index()\n"
+        "fig = px.bar(summary, x='region', y='value')\n"
+        "st.plotly_chart(fig)"
+    ),
+    'scatter': (
+        "fig = px.scatter(df, x='value', y='quantity')\n"
+        "st.plotly_chart(fig)"
+    ),
+    'matplotlib_hist': (
+        "fig, ax = plt.subplots()\n"
+        "ax.hist(df['value'], bins=50)\n"
+        "st.pyplot(fig)"
+    ),
+}
+
+
+FALLBACK_BENCHMARKS = ['cube', 'time_series', 'scatter', 'bar', 'histogram', 'data_summary']
+
+BENCHMARK_NAMES = (
+    ['load_file', 'analyze_data']
+    + [f'execute:{name}' for name in CANNED_CODE]
+    + [f'fallback:{name}' for name in FALLBACK_BENCHMARKS]
+)
+
+
+def _succeeded(result) -> Tuple[bool, str]:
+    """判斷結果是否成功（圖表相關函數以 success 欄位回報錯誤）"""
+    if isinstance(result, dict) and 'success' in result:
+        return bool(result['success']), result.get('error')
+    return True, None
+
+
+def measure(fn: Callable[[], Any], repeat: int = 3, track_memory: bool = True) -> Dict[str, Any]:
+    """
+    計時並量測記憶體峰值
+
+    計時與記憶體量測分開執行（tracemalloc 會拖慢執行速度）。
+
+    Returns:
+        {'ok', 'error', 'seconds_min', 'seconds_median', 'peak_memory_mb', 'runs'}
+    """
+
+    times = []
+    ok, error = True, None
+
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as e:
+            result = {'success': False, 'error': f'{type(e).__name__}: {str(e)}'}
+        times.append(time.perf_counter() - started)
+
+        ok, error = _succeeded(result)
+        if not ok:
+            break
+
+    peak_memory_mb = None
+    if track_memory and ok:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+            peak_memory_mb = round(peak / (1024 * 1024), 2)
+        except Exception:
+            pass
+        finally:
+            tracemalloc.stop()
+
+    return {
+        'ok': ok,
+        'error': error,
+        'seconds_min': round(min(times), 4),
+        'seconds_median': round(statistics.median(times), 4),
+        'peak_memory_mb': peak_memory_mb,
+        'runs': len(times)
+    }
+
+
+def _dataset_benchmarks(path: Path) -> List[Tuple[str, Callable[[], Any]]]:
+    """為單一數據集建立所有待測函數"""
+
+    df, _ = read_data_file(path)
+    data_analysis = DataAnalyzer(df).analyze_data()
+    dataset_key = fingerprint_bytes(path.read_bytes())
+    chart_generator = ChartGenerator(df, dataset_key=dataset_key, show_module_status=False)
+
+    benchmarks = [
+        ('load_file', lambda: read_data_file(path)),
+        ('analyze_data', lambda: DataAnalyzer(df).analyze_data()),
+    ]
+
+    for name, code in CANNED_CODE.items():
+        benchmarks.append((f'execute:{name}', lambda code=code: chart_generator.execute_chart_code(code)))
+
+    benchmarks.extend([
+        ('fallback:cube', lambda: chart_generator._create_fallback_from_cube(
+            data_analysis['summary_cube'], data_analysis['numeric'],
+            data_analysis['categorical'], data_analysis['datetime'])),
+        ('fallback:time_series', lambda: chart_generator._create_time_series_chart('date', 'value')),
+        ('fallback:scatter', lambda: chart_generator._create_scatter_chart('value', 'quantity')),
+        ('fallback:bar', lambda: chart_generator._create_bar_chart('region', 'value')),
+        ('fallback:histogram', lambda: chart_generator._create_histogram('value')),
+        ('fallback:data_summary', lambda: chart_generator._create_data_summary()),
+    ])
+
+    return benchmarks
+
+
+def run_benchmarks(specs: List[Dict[str, Any]], data_dir: Path = DEFAULT_DATA_DIR, repeat: int = 3,
+                   track_memory: bool = True, only: str = None) -> Dict[str, Any]:
+    """
+    對每個數據集規格執行所有基準測試
+
+    Args:
+        specs: 數據集規格清單
+        data_dir: 合成數據快取目錄
+        repeat: 每項測試的計時次數
+        track_memory: 是否量測記憶體峰值
+        only: 只執行名稱包含此字串的測試
+
+    Returns:
+        {'meta': ..., 'results': {'<數據集>/<測試>': 測量結果}}
+    """
+
+    # 無介面執行時 Streamlit 呼叫會輸出警告；先解析設定，避免之後被設定檔的 log level 覆寫
+    streamlit_config.get_config_options()
+    streamlit.logger.set_log_level('error')
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for _, fn in _dataset_benchmarks(materialize(WARMUP_SPEC, data_dir)):
+            try:
+                fn()
+            except Exception:
+                pass
+
+    results = {}
+    for spec in specs:
+        names = [f"{spec['name']}/{bench_name}" for bench_name in BENCHMARK_NAMES]
+        if only and not any(only in name for name in names):
+            continue
+
+        print(f"準備數據集 {spec['name']}（{spec['rows']:,} 行 × {spec['cols']} 欄，{spec['format']}）...")
+        path = materialize(spec, data_dir)
+        spec_repeat = 1 if spec['rows'] >= SINGLE_RUN_ROWS else repeat
+
+        for bench_name, fn in _dataset_benchmarks(path):
+            name = f"{spec['name']}/{bench_name}"
+            if only and only not in name:
+                continue
+
+            with warnings.catch_warnings():
+                # 混合格式日期等解析警告與效能無關
+                warnings.simplefilter('ignore')
+                result = measure(fn, repeat=spec_repeat, track_memory=track_memory)
+            result.update({'rows': spec['rows'], 'cols': spec['cols']})
+            results[name] = result
+
+            status = '✓' if result['ok'] else '✗'
+            memory = f"{result['peak_memory_mb']:.1f} MB" if result['peak_memory_mb'] is not None else '-'
+            print(f"  [{status}] {name:<40} {result['seconds_median']:>9.3f} s  {memory:>10}")
+
+    return {'meta': _environment(), 'results': results}
+
+
+def _environment() -> Dict[str, Any]:
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine()
+    }
+
+
+def load_baseline(path: Path = DEFAULT_BASELINE) -> Dict[str, Any]:
+    """讀取基準線"""
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(report: Dict[str, Any], path: Path = DEFAULT_BASELINE, thresholds: Dict[str, float] = None) -> None:
+    """
+    將測量結果存為基準線
+
+    保留舊基準線中的門檻設定與個別測試的 overrides。
+    """
+
+    existing = {}
+    if Path(path).exists():
+        existing = load_baseline(path)
+
+    baseline = {
+        'meta': report['meta'],
+        'thresholds': {**DEFAULT_THRESHOLDS, **existing.get('thresholds', {}), **(thresholds or {})},
+        'overrides': existing.get('overrides', {}),
+        'results': report['results']
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2)
+
+
+def compare_to_baseline(report: Dict[str, Any], baseline: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    與基準線比較
+
+    基準線的 overrides 可針對個別測試（'<數據集>/<測試>'）覆寫門檻。
+
+    Returns:
+        回歸清單 [{'name', 'metric', 'baseline', 'current', 'ratio'}]
+    """
+
+    regressions = []
+    thresholds = {**DEFAULT_THRESHOLDS, **baseline.get('thresholds', {})}
+    overrides = baseline.get('overrides', {})
+
+    for name, current in report['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if previous is None:
+            continue
+
+        limits = {**thresholds, **overrides.get(name, {})}
+
+        if previous.get('ok') and not current['ok']:
+            regressions.append({'name': name, 'metric': 'ok', 'baseline': True, 'current': False,
+                                'ratio': None, 'error': current['error']})
+            continue
+
+        checks = [
+            ('seconds_median', limits['time_ratio'], limits['min_seconds']),
+            ('peak_memory_mb', limits['memory_ratio'], limits['min_memory_mb']),
+        ]
+        for metric, max_ratio, min_delta in checks:
+            before, after = previous.get(metric), current.get(metric)
+            if not before or after is None:
+                continue
+            ratio = after / before
+            if ratio > max_ratio and after - before > min_delta:
+                regressions.append({'name': name, 'metric': metric, 'baseline': before,
+                                    'current': after, 'ratio': round(ratio, 2)})
+
+    return regressions
@@ -0,0 +1,178 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Union, List, Optional
+
+import pandas as pd
+
+from modules.file_loader import parse_dates
+
+ColumnSpec = Union[str, List[str]]
+
+
+def agg(df: pd.DataFrame, by: ColumnSpec, col: ColumnSpec, func: Union[str, List[str]] = 'mean') -> pd.DataFrame:
+    """分組聚合：df.groupby(by)[col].agg(func).reset_index()"""
+    return df.groupby(by)[col].agg(func).reset_index()
+
+
+def value_counts(df: pd.DataFrame, col: str, top: int = None, normalize: bool = False) -> pd.DataFrame:
+    """計算類別次數，回傳含 col 與 count（或 proportion）欄位的 DataFrame"""
+    counts = df[col].value_counts(normalize=normalize)
+    if top:
+        counts = counts.head(top)
+    return counts.reset_index()
+
+
+def resample(df: pd.DataFrame, date_col: str, value_col: ColumnSpec, freq: str = 'D',
+             func: Union[str, List[str]] = 'sum') -> pd.DataFrame:
+    """依時間頻率重新取樣聚合（會自動將日期欄位轉為 datetime，可混用多種格式）"""
+    dates = parse_dates(df[date_col])
+    data = df[value_col].to_frame() if isinstance(value_col, str) else df[value_col]
+    data = data.set_axis(dates, axis=0)
+    data = data[data.index.notna()]
+    result = data.resample(freq).agg(func)
+    result.index.name = date_col
+    return result.reset_index()
+
+
+class AggregationCache:
+    """以數據集指紋為鍵的聚合結果 LRU 快取（跨 session 共用）"""
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 256 * 1024 * 1024):
+        """初始化聚合快取"""
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key: tuple, compute: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """讀取快取，沒有時計算並寫入；回傳副本避免呼叫端修改快取內容"""
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0].copy()
+            self.misses += 1
+
+        result = compute()
+        size = int(result.memory_usage(deep=True).sum())
+
+        if size <= self.max_bytes:
+            with self._lock:
+                if key in self._entries:
+                    self._total_bytes -= self._entries.pop(key)[1]
+                self._entries[key] = (result, size)
+                self._total_bytes += size
+                while len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes:
+                    _, (_, evicted_size) = self._entries.popitem(last=False)
+                    self._total_bytes -= evicted_size
+
+        return result.copy()
+
+    def stats(self) -> Dict[str, Any]:
+        """取得快取統計"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+# 行程內共用的聚合快取
+_AGGREGATION_CACHE = AggregationCache()
+
+
+def get_aggregation_cache() -> AggregationCache:
+    """取得行程內共用的聚合快取"""
+    return _AGGREGATION_CACHE
+
+
+def _freeze(value):
+    """將參數轉為可雜湊的快取鍵"""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    return value
+
+
+class AggregationHelpers:
+    """綁定到單次執行的記憶化輔助函數"""
+
+    def __init__(self, dataset_key: str, exec_df: pd.DataFrame, source_df: pd.DataFrame,
+                 cache: AggregationCache = None):
+        """
+        Args:
+            dataset_key: 數據集指紋
+            exec_df: 傳給生成代碼的 df（source_df 的副本）
+            source_df: 數據集原本的 DataFrame（生成代碼無法存取，用來確認 exec_df 未被修改）
+            cache: 聚合快取（預設使用行程內共用快取）
+        """
+        self.dataset_key = dataset_key
+        self.exec_df = exec_df
+        self.source_df = source_df
+        self.cache = cache or get_aggregation_cache()
+
+    def _is_pristine(self, df: pd.DataFrame, columns: List[str]) -> bool:
+        """
+        只有傳入原始 df 且使用到的欄位內容與數據集相同時才使用快取
+
+        快取鍵只有數據集指紋，因此逐欄比對內容：欄位被替換或以 df.loc[...] = v 就地修改時都不使用快取。
+        """
+        if df is not self.exec_df or self.dataset_key is None:
+            return False
+        for col in columns:
+            if col not in self.source_df.columns or col not in df.columns:
+                return False
+            if not df[col].equals(self.source_df[col]):
+                return False
+        return True
+
+    def _columns(self, *specs) -> List[str]:
+        columns = []
+        for spec in specs:
+            if spec is None:
+                continue
+            columns.extend(spec if isinstance(spec, (list, tuple)) else [spec])
+        return columns
+
+    def agg(self, df: pd.DataFrame, by: ColumnSpec, col: ColumnSpec, func='mean') -> pd.DataFrame:
+        if not self._is_pristine(df, self._columns(by, col)):
+            return agg(df, by, col, func)
+        key = (self.dataset_key, 'agg', _freeze(by), _freeze(col), _freeze(func))
+        return self.cache.get_or_compute(key, lambda: agg(df, by, col, func))
+
+    def value_counts(self, df: pd.DataFrame, col: str, top: int = None, normalize: bool = False) -> pd.DataFrame:
+        if not self._is_pristine(df, [col]):
+            return value_counts(df, col, top, normalize)
+        key = (self.dataset_key, 'value_counts', col, top, normalize)
+        return self.cache.get_or_compute(key, lambda: value_counts(df, col, top, normalize))
+
+    def resample(self, df: pd.DataFrame, date_col: str, value_col: ColumnSpec, freq: str = 'D',
+                 func='sum') -> pd.DataFrame:
+        if not self._is_pristine(df, self._columns(date_col, value_col)):
+            return resample(df, date_col, value_col, freq, func)
+        key = (self.dataset_key, 'resample', date_col, _freeze(value_col), freq, _freeze(func))
+        return self.cache.get_or_compute(key, lambda: resample(df, date_col, value_col, freq, func))
+
+    def as_namespace(self) -> Dict[str, Callable]:
+        """取得要注入執行環境的函數"""
+        return {
+            'agg': self.agg,
+            'value_counts': self.value_counts,
+            'resample': self.resample
+        }
+
+
+def get_aggregation_helpers() -> Dict[str, Callable]:
+    """取得未記憶化的輔助函數（執行時會替換為記憶化版本）"""
+    return {
+        'agg': agg,
+        'value_counts': value_counts,
+        'resample': resample
+    }
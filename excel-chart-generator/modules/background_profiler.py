@@ -0,0 +1,163 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, Optional
+
+import pandas as pd
+
+from modules.data_analyzer import DataAnalyzer
+
+
+class ProfilingJob:
+    """
+    背景分析的進度
+
+    由工作執行緒寫入，Streamlit 每次執行時以 snapshot() 讀取；
+    欄位類型識別完成後 current_analysis() 即可用於生成圖表。
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.row_count = len(df)
+        self.column_count = len(df.columns)
+        self.status = 'pending'
+        self.error = None
+        self._analyzer = DataAnalyzer(df)
+        self._lock = threading.Lock()
+        self._types_event = threading.Event()
+        self._done_event = threading.Event()
+        self._column_types = {'numeric': [], 'datetime': [], 'categorical': []}
+        self._columns_profiled = 0
+        self._partial: Optional[Dict[str, Any]] = None
+        self._result: Optional[Dict[str, Any]] = None
+        self._started = None
+        self.types_seconds = None
+        self.total_seconds = None
+
+    def run(self) -> None:
+        """在工作執行緒中執行分析（每完成一個欄位就更新進度）"""
+
+        self._started = time.perf_counter()
+        with self._lock:
+            self.status = 'types'
+
+        try:
+            for event in self._analyzer.iter_analysis():
+                kind = event[0]
+                with self._lock:
+                    if kind == 'column_type':
+                        self._column_types[event[2]].append(event[1])
+                    elif kind == 'types':
+                        self._partial = event[1]
+                        self.status = 'stats'
+                        self.types_seconds = time.perf_counter() - self._started
+                        self._types_event.set()
+                    elif kind == 'column_stats':
+                        self._columns_profiled += 1
+                    elif kind == 'done':
+                        self._result = event[1]
+                        self.status = 'done'
+        except Exception as e:
+            with self._lock:
+                self.error = f'{type(e).__name__}: {str(e)}'
+                self.status = 'error'
+        finally:
+            # 分析結束後不再持有 DataFrame，讓共用數據可以被暫存或釋放
+            self._analyzer = None
+            self.total_seconds = time.perf_counter() - self._started
+            self._types_event.set()
+            self._done_event.set()
+
+    @property
+    def types_ready(self) -> bool:
+        """欄位類型是否已識別完成"""
+        return self._partial is not None
+
+    @property
+    def done(self) -> bool:
+        return self._done_event.is_set()
+
+    @property
+    def failed(self) -> bool:
+        return self.status == 'error'
+
+    def current_analysis(self) -> Optional[Dict[str, Any]]:
+        """目前可用的分析結果：完成時為完整結果，類型識別完成後為初步結果，否則為 None"""
+        with self._lock:
+            return self._result or self._partial
+
+    def wait(self, timeout: float = None) -> Dict[str, Any]:
+        """
+        等待分析完成
+
+        Raises:
+            TimeoutError: 超過等待時間
+            RuntimeError: 分析失敗
+        """
+        if not self._done_event.wait(timeout):
+            raise TimeoutError('數據分析尚未完成')
+        if self.error:
+            raise RuntimeError(f'數據分析失敗: {self.error}')
+        return self._result
+
+    def wait_for_types(self, timeout: float = None) -> Optional[Dict[str, Any]]:
+        """等待欄位類型識別完成，回傳初步結果（失敗時為 None）"""
+        self._types_event.wait(timeout)
+        return self.current_analysis()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """目前進度（可直接傳給 display_data_analysis 顯示已識別的欄位）"""
+        with self._lock:
+            classified = sum(len(columns) for columns in self._column_types.values())
+            return {
+                'status': self.status,
+                'error': self.error,
+                'row_count': self.row_count,
+                'column_count': self.column_count,
+                'numeric': list(self._column_types['numeric']),
+                'datetime': list(self._column_types['datetime']),
+                'categorical': list(self._column_types['categorical']),
+                'columns_classified': classified,
+                'columns_profiled': self._columns_profiled,
+                'elapsed': time.perf_counter() - self._started if self._started else 0.0,
+                'types_seconds': self.types_seconds,
+                'total_seconds': self.total_seconds
+            }
+
+
+class BackgroundProfiler:
+    """執行背景分析的執行緒池"""
+
+    def __init__(self, workers: int = 2):
+        """
+        Args:
+            workers: 同時分析的數據集數
+        """
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='profiler')
+        self._lock = threading.Lock()
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0}
+
+    def submit(self, df: pd.DataFrame, on_done: Callable[[ProfilingJob], None] = None) -> ProfilingJob:
+        """
+        開始在背景分析數據集
+
+        Args:
+            df: 要分析的 DataFrame
+            on_done: 分析結束（成功或失敗）時在工作執行緒中呼叫
+
+        Returns:
+            可查詢進度的分析工作
+        """
+
+        job = ProfilingJob(df)
+        with self._lock:
+            self.stats['submitted'] += 1
+        self._executor.submit(self._run, job, on_done)
+        return job
+
+    def _run(self, job: ProfilingJob, on_done: Callable[[ProfilingJob], None] = None) -> None:
+        job.run()
+        with self._lock:
+            self.stats['failed' if job.failed else 'completed'] += 1
+        if on_done is not None:
+            on_done(job)
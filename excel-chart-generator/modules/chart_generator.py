@@ -15,6 +15,7 @@ class ChartGenerator:
         self.current_chart = None
         
 import pandas as pd
+import numpy as np
 import matplotlib.pyplot as plt
 import plotly.express as px
 import plotly.graph_objects as go
@@ -23,15 +24,87 @@ import streamlit as st
 from typing import Dict, Any, Tuple
 import io
 import base64
+import ast
+import re
+import builtins
 import importlib
 import sys
 
+from modules.performance_linter import PerformanceLinter
+from modules.code_repair import CodeRepairer
+from modules.figure_cache import FigureCapture, fingerprint_dataframe
+from modules.aggregation_helpers import AggregationHelpers, get_aggregation_helpers
+from modules.figure_optimizer import optimize_figure
+from modules.file_loader import parse_dates
+from modules.render_manager import RenderManager
+from modules.tracing import span, traced, set_attributes, get_tracer
+from modules.downsampling import (
+    downsample_line, density_scatter, binned_histogram, get_downsampling_helpers
+)
+
+# 生成代碼可使用的 Python 內建函數（不含 __import__、open、eval 等；
+# getattr、setattr、type 可以繞過屬性檢查取得 __class__、__globals__ 等物件，也不提供）
+SAFE_BUILTINS = (
+    'len', 'range', 'enumerate', 'zip', 'list', 'dict', 'set',
+    'tuple', 'str', 'int', 'float', 'bool', 'min', 'max', 'sum',
+    'abs', 'round', 'sorted', 'reversed', 'print',
+    'isinstance', 'hasattr',
+    'any', 'all', 'map', 'filter', 'slice', 'format',
+    'Exception', 'ValueError', 'KeyError', 'TypeError', 'IndexError'
+)
+
+# 格式字串中存取雙底線屬性的欄位，例如 '{0.__init__.__globals__}'
+_DUNDER_FORMAT_FIELD = re.compile(r'\{[^{}]*__\w+__[^{}]*\}')
+
+
+def find_dunder_access(code: str):
+    """
+    找出代碼中的雙底線名稱或屬性（__class__、__globals__、__builtins__ 等可用來跳出執行環境）
+
+    Returns:
+        第一個找到的名稱；沒有時回傳 None（無法解析的代碼也回傳 None，交由執行時回報語法錯誤）
+    """
+
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Attribute) and node.attr.startswith('__'):
+            return node.attr
+        if isinstance(node, ast.Name) and node.id.startswith('__'):
+            return node.id
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            match = _DUNDER_FORMAT_FIELD.search(node.value)
+            if match:
+                return match.group(0)
+    return None
+
+# 本地修正代碼後最多重新執行的次數
+MAX_REPAIR_ROUNDS = 3
+
 class ChartGenerator:
-    def __init__(self, df: pd.DataFrame):
-        """初始化圖表生成器"""
+    def __init__(self, df: pd.DataFrame, dataset_key: str = None, show_module_status: bool = True,
+                 query_engine=None):
+        """
+        初始化圖表生成器
+        
+        Args:
+            df: 數據
+            dataset_key: 數據集指紋（用於跨請求記憶化聚合結果；未提供時自動計算）
+            show_module_status: 是否在側邊欄顯示模組狀態（無介面執行時關閉）
+            query_engine: 數據集的 QueryEngine（有值時以 db 注入執行環境，讓代碼在引擎內聚合）
+        """
         self.df = df
+        self.dataset_key = dataset_key
+        self.show_module_status = show_module_status
+        self.query_engine = query_engine
         self.current_chart = None
+        self.render_manager = RenderManager()
         self.available_modules = self._discover_available_modules()
+        if query_engine is not None:
+            self.available_modules['db'] = query_engine
         
     def _discover_available_modules(self) -> Dict[str, Any]:
         """動態發現可用的模組"""
@@ -66,6 +139,12 @@ class ChartGenerator:
             ('networkx', 'nx')
         ]
         
+        # 大數據降採樣輔助函數
+        modules.update(get_downsampling_helpers())
+        
+        # 聚合輔助函數（執行時替換為記憶化版本）
+        modules.update(get_aggregation_helpers())
+        
         available_optional = []
         unavailable_optional = []
         
@@ -77,6 +156,9 @@ class ChartGenerator:
             except ImportError:
                 unavailable_optional.append(f"{alias} ({module_name})")
         
+        if not self.show_module_status:
+            return modules
+        
         # 在側邊欄顯示模組狀態（更簡潔）
         if available_optional:
             st.sidebar.success(f"✅ 可用進階模組: {len(available_optional)} 個")
@@ -141,6 +223,7 @@ class ChartGenerator:
         
         return False
     
+    @traced('chart.execute')
     def execute_chart_code(self, code: str) -> Dict[str, Any]:
         """
         安全執行圖表生成代碼
@@ -152,33 +235,56 @@ class ChartGenerator:
             執行結果字典
         """
         
+        # 包裝 st 以記錄代碼顯示的圖表，供圖表快取重播
+        capture = FigureCapture(self.available_modules.get('st', st), self.render_manager)
+        set_attributes(rows=len(self.df), columns=len(self.df.columns), code_chars=len(code))
+        
         try:
+            with span('chart.copy_df'):
+                exec_df = self.df.copy()  # 使用副本避免修改原始數據
+            
+            # 以數據集指紋記憶化的聚合輔助函數
+            if self.dataset_key is None:
+                self.dataset_key = fingerprint_dataframe(self.df)
+            aggregation_helpers = AggregationHelpers(self.dataset_key, exec_df, self.df)
+            
             global_vars = {
-                # Python 內建函數
-                "__builtins__": {
-                    'len', 'range', 'enumerate', 'zip', 'list', 'dict', 'set', 
-                    'tuple', 'str', 'int', 'float', 'bool', 'min', 'max', 'sum',
-                    'abs', 'round', 'sorted', 'reversed', 'print', 'type',
-                    'isinstance', 'hasattr', 'getattr', 'setattr'
-                },
+                # Python 內建函數（exec 需要名稱到函數的字典）
+                "__builtins__": {name: getattr(builtins, name) for name in SAFE_BUILTINS},
                 # 動態載入的模組
-                **self.available_modules
+                **self.available_modules,
+                **aggregation_helpers.as_namespace(),
+                'st': capture
             }
             
             local_vars = {
-                'df': self.df.copy(),  # 使用副本避免修改原始數據
+                'df': exec_df,
             }
             
             # 清理代碼 - 移除多餘的 import 語句
             cleaned_code = self._clean_code(code)
+
+            # 本地修正或效能改寫後的代碼沒有再經過 validate_chart_code，執行前再檢查一次
+            dunder = find_dunder_access(cleaned_code)
+            if dunder:
+                return {
+                    'success': False,
+                    'error': f'代碼包含潛在危險操作: 存取 {dunder}',
+                    'error_type': 'UnsafeCode'
+                }
             
-            # 執行代碼
-            exec(cleaned_code, global_vars, local_vars)
+            # 執行代碼（結束時關閉執行期間建立的 matplotlib 圖表）
+            with span('chart.exec'), self.render_manager.session(cleaned_code):
+                exec(cleaned_code, global_vars, local_vars)
+            set_attributes(figures=len(capture.figures))
             
             return {
                 'success': True,
                 'message': '圖表生成成功',
-                'local_vars': local_vars
+                'local_vars': local_vars,
+                'figures': capture.figures,
+                'payload_reports': capture.payload_reports,
+                'render_report': self.render_manager.report
             }
             
         except NameError as e:
@@ -193,13 +299,15 @@ class ChartGenerator:
                     'error': f'缺少模組: {missing_module}',
                     'error_type': 'MissingModule',
                     'missing_module': missing_module,
-                    'suggestion': f'請安裝 {missing_module} 模組或使用其他圖表類型'
+                    'suggestion': f'請安裝 {missing_module} 模組或使用其他圖表類型',
+                    'exception': e.with_traceback(None)
                 }
             
             return {
                 'success': False,
                 'error': str(e),
-                'error_type': 'NameError'
+                'error_type': 'NameError',
+                'exception': e.with_traceback(None)
             }
             
         except ImportError as e:
@@ -207,16 +315,60 @@ class ChartGenerator:
                 'success': False,
                 'error': f'模組導入錯誤: {str(e)}',
                 'error_type': 'ImportError',
-                'suggestion': '請安裝缺少的套件或使用更簡單的圖表類型'
+                'suggestion': '請安裝缺少的套件或使用更簡單的圖表類型',
+                'exception': e.with_traceback(None)
             }
             
         except Exception as e:
+            # 不保留 traceback，避免執行環境中的數據副本被例外引用而無法釋放
             return {
                 'success': False,
                 'error': str(e),
-                'error_type': type(e).__name__
+                'error_type': type(e).__name__,
+                'exception': e.with_traceback(None)
             }
     
+    @traced('chart.repair')
+    def execute_with_repair(self, code: str, data_info: Dict[str, Any] = None,
+                            max_rounds: int = MAX_REPAIR_ROUNDS) -> Dict[str, Any]:
+        """
+        執行代碼；失敗時先在本地修正常見錯誤（欄位名稱、模組別名、未轉換的日期）再重新執行
+        
+        Args:
+            code: 要執行的代碼
+            data_info: 數據分析結果（欄位名稱取自 sample_data.columns）
+            max_rounds: 最多修正並重新執行的次數
+            
+        Returns:
+            execute_chart_code 的結果，另含 code（最後執行的代碼）與 repairs（修正說明）
+        """
+        
+        data_info = data_info or {}
+        columns = data_info.get('sample_data', {}).get('columns') or list(self.df.columns)
+        repairer = CodeRepairer(
+            columns, datetime_columns=data_info.get('datetime', []),
+            available_names=list(self.available_modules) + ['st'] + list(SAFE_BUILTINS)
+        )
+        
+        result = self.execute_chart_code(code)
+        repairs = []
+        for _ in range(max_rounds):
+            if result['success'] or result.get('exception') is None:
+                break
+            repair = repairer.repair(code, result['exception'])
+            if not repair['fixes']:
+                break
+            code = repair['code']
+            repairs.extend(repair['fixes'])
+            result = self.execute_chart_code(code)
+        
+        set_attributes(repairs=len(repairs))
+        if repairs:
+            get_tracer().increment('code_repairs', outcome='fixed' if result['success'] else 'failed')
+        result['code'] = code
+        result['repairs'] = repairs
+        return result
+    
     def _clean_code(self, code: str) -> str:
         """清理代碼，移除不必要的 import 語句"""
         
@@ -263,6 +415,7 @@ class ChartGenerator:
         
         return '\n'.join(cleaned_lines)
     
+    @traced('chart.fallback')
     def create_fallback_chart(self, data_info: Dict[str, Any], user_query: str) -> Dict[str, Any]:
         """
         當自動生成失敗時，創建後備圖表
@@ -280,6 +433,15 @@ class ChartGenerator:
             categorical_cols = data_info.get('categorical', [])
             datetime_cols = data_info.get('datetime', [])
             
+            # 優先使用分析時預先計算的聚合立方體（不需重新掃描數據）
+            summary_cube = data_info.get('summary_cube')
+            if summary_cube:
+                cube_result = self._create_fallback_from_cube(
+                    summary_cube, numeric_cols, categorical_cols, datetime_cols
+                )
+                if cube_result is not None:
+                    return cube_result
+            
             # 根據數據類型選擇合適的預設圖表
             if datetime_cols and numeric_cols:
                 # 時間序列圖
@@ -307,21 +469,216 @@ class ChartGenerator:
                 'error': f'後備圖表生成失敗: {str(e)}'
             }
     
+    def intent_figure(self, intent: Dict[str, Any], data_info: Dict[str, Any] = None):
+        """
+        本地判斷出的圖表意圖（見 IntentRouter）對應的圖表，不顯示（可在背景執行緒中呼叫）
+        
+        Args:
+            intent: IntentRouter.route 或 make_intent 的結果
+            data_info: 數據分析結果（有聚合立方體時優先使用）
+            
+        Returns:
+            plotly 圖表
+        """
+        
+        columns = intent['columns']
+        chart_type = intent['chart_type']
+        cube = (data_info or {}).get('summary_cube')
+        
+        # 立方體已有所需的聚合時不需重新掃描數據
+        fig = None
+        if cube:
+            if chart_type == 'histogram':
+                fig = self._cube_histogram_figure(cube, columns['column'])
+            elif chart_type == 'time_series':
+                fig = self._cube_time_series_figure(cube, columns['date'], columns['value'])
+            elif chart_type == 'scatter':
+                fig = self._cube_scatter_figure(cube, columns['x'], columns['y'])
+            elif intent['aggregation'] == 'mean':
+                fig = self._cube_bar_figure(cube, columns['category'], columns['value'])
+        if fig is not None:
+            return fig
+        
+        if chart_type == 'histogram':
+            return self._histogram_figure(columns['column'])
+        if chart_type == 'time_series':
+            return self._time_series_figure(columns['date'], columns['value'])
+        if chart_type == 'scatter':
+            return self._scatter_figure(columns['x'], columns['y'])
+        return self._bar_figure(columns['category'], columns['value'], intent['aggregation'] or 'mean')
+    
+    @traced('chart.intent')
+    def create_intent_chart(self, intent: Dict[str, Any], data_info: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        以內建圖表函數繪製並顯示本地判斷出的圖表意圖
+        
+        Returns:
+            與後備圖表相同格式的結果
+        """
+        
+        set_attributes(chart_type=intent['chart_type'])
+        
+        try:
+            fig = self.intent_figure(intent, data_info)
+            payload_report = self._display_plotly(fig)
+            return {
+                'success': True,
+                'chart_type': intent['chart_type'],
+                'message': f"已生成{intent.get('description', intent['chart_type'])}",
+                'figure': fig,
+                'payload_report': payload_report
+            }
+            
+        except Exception as e:
+            return {'success': False, 'error': f'本地圖表生成失敗: {str(e)}'}
+    
+    def _display_plotly(self, fig) -> Dict[str, Any]:
+        """壓縮圖表後顯示，回傳傳輸大小報告"""
+        compact_fig, payload_report = optimize_figure(fig)
+        st.plotly_chart(compact_fig, use_container_width=True)
+        return payload_report
+    
+    def _create_fallback_from_cube(self, cube: Dict[str, Any], numeric_cols: list,
+                                   categorical_cols: list, datetime_cols: list) -> Dict[str, Any]:
+        """
+        從聚合立方體建立後備圖表
+        
+        Returns:
+            後備圖表結果；立方體缺少所需聚合時回傳 None
+        """
+        
+        fig = None
+        
+        if datetime_cols and numeric_cols:
+            date_col, value_col = datetime_cols[0], numeric_cols[0]
+            fig = self._cube_time_series_figure(cube, date_col, value_col)
+            chart_type = 'time_series'
+            message = f'已生成 {date_col} vs {value_col} 的時間序列圖'
+        
+        elif len(numeric_cols) >= 2:
+            x_col, y_col = numeric_cols[0], numeric_cols[1]
+            fig = self._cube_scatter_figure(cube, x_col, y_col)
+            chart_type = 'scatter'
+            message = f'已生成 {x_col} vs {y_col} 的散點圖'
+        
+        elif categorical_cols and numeric_cols:
+            cat_col, num_col = categorical_cols[0], numeric_cols[0]
+            fig = self._cube_bar_figure(cube, cat_col, num_col)
+            chart_type = 'bar'
+            message = f'已生成 {cat_col} 的 {num_col} 柱狀圖'
+        
+        elif len(numeric_cols) == 1:
+            num_col = numeric_cols[0]
+            fig = self._cube_histogram_figure(cube, num_col)
+            chart_type = 'histogram'
+            message = f'已生成 {num_col} 的分布直方圖'
+        
+        if fig is None:
+            return None
+        
+        payload_report = self._display_plotly(fig)
+        
+        return {
+            'success': True,
+            'chart_type': chart_type,
+            'message': message,
+            'figure': fig,
+            'payload_report': payload_report
+        }
+    
+    def _cube_time_series_figure(self, cube: Dict[str, Any], date_col: str, value_col: str):
+        """以時間分桶的平均值繪製趨勢圖"""
+        time_agg = cube.get('time', {}).get(date_col)
+        if not time_agg or value_col not in time_agg['numeric']:
+            return None
+        
+        fig = go.Figure(go.Scatter(
+            x=pd.to_datetime(time_agg['period']),
+            y=time_agg['numeric'][value_col]['mean'],
+            mode='lines',
+            name=value_col,
+            connectgaps=False
+        ))
+        fig.update_layout(
+            title=f'{value_col} 隨時間變化趨勢（每 {time_agg["freq"]} 平均）',
+            xaxis_title=date_col,
+            yaxis_title=value_col
+        )
+        return fig
+    
+    def _cube_scatter_figure(self, cube: Dict[str, Any], x_col: str, y_col: str):
+        """以預先採樣的點繪製散點圖"""
+        scatter = cube.get('scatter')
+        if not scatter or scatter['x'] != x_col or scatter['y'] != y_col:
+            return None
+        
+        title = f'{x_col} vs {y_col} 散點圖'
+        if scatter['sampled']:
+            title += f"（採樣 {len(scatter['x_values'])}/{scatter['total_points']} 點）"
+        
+        fig = go.Figure(go.Scatter(
+            x=scatter['x_values'], y=scatter['y_values'], mode='markers', name=f'{x_col} vs {y_col}'
+        ))
+        fig.update_layout(title=title, xaxis_title=x_col, yaxis_title=y_col)
+        return fig
+    
+    def _cube_bar_figure(self, cube: Dict[str, Any], cat_col: str, num_col: str):
+        """以預先計算的類別平均值繪製柱狀圖"""
+        cat_agg = cube.get('categorical', {}).get(cat_col)
+        if not cat_agg or num_col not in cat_agg['numeric']:
+            return None
+        
+        fig = go.Figure(go.Bar(
+            x=cat_agg['categories'], y=cat_agg['numeric'][num_col]['mean'], name=num_col
+        ))
+        fig.update_layout(
+            title=f'{cat_col} 各類別的 {num_col} 平均值',
+            xaxis_title=cat_col,
+            yaxis_title=num_col
+        )
+        return fig
+    
+    def _cube_histogram_figure(self, cube: Dict[str, Any], num_col: str):
+        """以預先計算的分箱繪製直方圖"""
+        hist = cube.get('histograms', {}).get(num_col)
+        if not hist:
+            return None
+        
+        bin_start = np.asarray(hist['bin_start'])
+        bin_end = np.asarray(hist['bin_end'])
+        
+        fig = go.Figure(go.Bar(
+            x=(bin_start + bin_end) / 2, y=hist['count'], width=bin_end - bin_start, name=num_col
+        ))
+        fig.update_layout(
+            title=f'{num_col} 分布直方圖', xaxis_title=num_col, yaxis_title='count', bargap=0
+        )
+        return fig
+    
+    def _time_series_figure(self, date_col: str, value_col: str):
+        """時間序列圖表（不顯示）"""
+        # 確保日期欄位是日期時間格式（同一欄可能混用多種格式，無法解析的值略過）
+        df_copy = self.df.copy()
+        df_copy[date_col] = parse_dates(df_copy[date_col])
+        df_copy = df_copy.dropna(subset=[date_col]).sort_values(date_col)
+        
+        # 點數過多時以 LTTB 降採樣
+        df_plot = downsample_line(df_copy, date_col, value_col)
+        
+        return px.line(df_plot, x=date_col, y=value_col, 
+                       title=f'{value_col} 隨時間變化趨勢')
+    
     def _create_time_series_chart(self, date_col: str, value_col: str) -> Dict[str, Any]:
         """創建時間序列圖表"""
         try:
-            # 確保日期欄位是日期時間格式
-            df_copy = self.df.copy()
-            df_copy[date_col] = pd.to_datetime(df_copy[date_col])
-            df_copy = df_copy.sort_values(date_col)
-            
-            fig = px.line(df_copy, x=date_col, y=value_col, 
-                         title=f'{value_col} 隨時間變化趨勢')
+            fig = self._time_series_figure(date_col, value_col)
             
-            st.plotly_chart(fig, use_container_width=True)
+            payload_report = self._display_plotly(fig)
             
             return {
                 'success': True,
+                'figure': fig,
+                'payload_report': payload_report,
                 'chart_type': 'time_series',
                 'message': f'已生成 {date_col} vs {value_col} 的時間序列圖'
             }
@@ -329,16 +686,23 @@ class ChartGenerator:
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
+    def _scatter_figure(self, x_col: str, y_col: str):
+        """散點圖（不顯示）"""
+        # 點數過多時改為密度熱圖
+        return density_scatter(self.df, x_col, y_col, 
+                               title=f'{x_col} vs {y_col} 散點圖')
+    
     def _create_scatter_chart(self, x_col: str, y_col: str) -> Dict[str, Any]:
         """創建散點圖"""
         try:
-            fig = px.scatter(self.df, x=x_col, y=y_col, 
-                           title=f'{x_col} vs {y_col} 散點圖')
+            fig = self._scatter_figure(x_col, y_col)
             
-            st.plotly_chart(fig, use_container_width=True)
+            payload_report = self._display_plotly(fig)
             
             return {
                 'success': True,
+                'figure': fig,
+                'payload_report': payload_report,
                 'chart_type': 'scatter',
                 'message': f'已生成 {x_col} vs {y_col} 的散點圖'
             }
@@ -346,27 +710,34 @@ class ChartGenerator:
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
-    def _create_bar_chart(self, cat_col: str, num_col: str) -> Dict[str, Any]:
-        """創建柱狀圖"""
+    def _bar_figure(self, cat_col: str, num_col: str, agg: str = 'mean'):
+        """柱狀圖（不顯示；agg 為 mean 或 sum）"""
+        # 計算每個類別的平均值或總和
+        if self.df[cat_col].nunique() > 20:
+            # 如果類別太多，只取前20個
+            top_categories = self.df[cat_col].value_counts().head(20).index
+            df_filtered = self.df[self.df[cat_col].isin(top_categories)]
+        else:
+            df_filtered = self.df
+        
+        # 按類別分組計算平均值（或總和）
+        grouped_data = df_filtered.groupby(cat_col)[num_col].agg(agg).reset_index()
+        agg_label = '總和' if agg == 'sum' else '平均值'
+        
+        return px.bar(grouped_data, x=cat_col, y=num_col,
+                      title=f'{cat_col} 各類別的 {num_col} {agg_label}')
+    
+    def _create_bar_chart(self, cat_col: str, num_col: str, agg: str = 'mean') -> Dict[str, Any]:
+        """創建柱狀圖（agg 為 mean 或 sum）"""
         try:
-            # 計算每個類別的平均值或總和
-            if self.df[cat_col].nunique() > 20:
-                # 如果類別太多，只取前20個
-                top_categories = self.df[cat_col].value_counts().head(20).index
-                df_filtered = self.df[self.df[cat_col].isin(top_categories)]
-            else:
-                df_filtered = self.df
-            
-            # 按類別分組計算平均值
-            grouped_data = df_filtered.groupby(cat_col)[num_col].mean().reset_index()
+            fig = self._bar_figure(cat_col, num_col, agg)
             
-            fig = px.bar(grouped_data, x=cat_col, y=num_col,
-                        title=f'{cat_col} 各類別的 {num_col} 平均值')
-            
-            st.plotly_chart(fig, use_container_width=True)
+            payload_report = self._display_plotly(fig)
             
             return {
                 'success': True,
+                'figure': fig,
+                'payload_report': payload_report,
                 'chart_type': 'bar',
                 'message': f'已生成 {cat_col} 的 {num_col} 柱狀圖'
             }
@@ -374,16 +745,23 @@ class ChartGenerator:
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
+    def _histogram_figure(self, num_col: str):
+        """直方圖（不顯示）"""
+        # 以 NumPy 預先分箱，只傳送分箱結果
+        return binned_histogram(self.df, num_col, 
+                                title=f'{num_col} 分布直方圖')
+    
     def _create_histogram(self, num_col: str) -> Dict[str, Any]:
         """創建直方圖"""
         try:
-            fig = px.histogram(self.df, x=num_col, 
-                             title=f'{num_col} 分布直方圖')
+            fig = self._histogram_figure(num_col)
             
-            st.plotly_chart(fig, use_container_width=True)
+            payload_report = self._display_plotly(fig)
             
             return {
                 'success': True,
+                'figure': fig,
+                'payload_report': payload_report,
                 'chart_type': 'histogram',
                 'message': f'已生成 {num_col} 的分布直方圖'
             }
@@ -423,6 +801,24 @@ class ChartGenerator:
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
+    def check_performance(self, code: str) -> Dict[str, Any]:
+        """
+        靜態分析代碼的效能問題並預估執行成本
+
+        Args:
+            code: 要分析的代碼
+
+        Returns:
+            效能分析結果（含改寫後的代碼與重新生成提示）
+        """
+
+        with span('chart.lint', code_chars=len(code)) as lint_span:
+            linter = PerformanceLinter(len(self.df), len(self.df.columns))
+            result = linter.analyze(self._clean_code(code))
+            lint_span.set_attribute('issues', len(result.get('issues', [])))
+            return result
+
+    @traced('chart.validate')
     def validate_chart_code(self, code: str) -> Tuple[bool, str]:
         """
         驗證圖表代碼的安全性
@@ -447,5 +843,9 @@ class ChartGenerator:
         for pattern in dangerous_patterns:
             if pattern in code_lower:
                 return False, f"代碼包含潛在危險操作: {pattern}"
+
+        dunder = find_dunder_access(code)
+        if dunder:
+            return False, f"代碼包含潛在危險操作: 存取 {dunder}"
         
         return True, "代碼驗證通過"
\ No newline at end of file
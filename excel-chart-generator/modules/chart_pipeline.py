@@ -0,0 +1,150 @@
+import time
+from contextlib import nullcontext
+from typing import Dict, Any
+
+from modules.chart_generator import ChartGenerator
+from modules.gemini_client import GeminiClient
+from modules.intent_router import IntentRouter, DEFAULT_THRESHOLD
+from modules.tracing import traced
+
+
+def _llm_call(generation: Dict[str, Any]) -> Dict[str, Any]:
+    """單次 Gemini 請求的模型、嘗試次數、耗時與 token 用量"""
+    return {key: generation.get(key) for key in ('model', 'tier', 'attempts', 'seconds', 'usage')}
+
+
+@traced('run_chart_query')
+def run_chart_query(chart_generator: ChartGenerator, gemini_client: GeminiClient, data_analysis: Dict[str, Any],
+                    user_query: str, use_fallback: bool = True, llm_slot=None, exec_slot=None,
+                    use_router: bool = True, router_threshold: float = DEFAULT_THRESHOLD) -> Dict[str, Any]:
+    """
+    無介面的單次圖表生成：本地意圖判斷 → Gemini 生成 → 安全檢查 → 效能檢查 → 執行
+    （效能檢查要求重新生成時附上提示重新生成一次；執行失敗時先在本地修正，仍失敗時附上錯誤重新生成一次，
+    最後才使用後備圖表。重新生成時 GeminiClient 會改用高一層的模型）
+
+    Args:
+        chart_generator: 圖表生成器
+        gemini_client: Gemini 客戶端
+        data_analysis: 數據分析結果
+        user_query: 用戶查詢
+        use_fallback: 代碼失敗時是否產生後備圖表
+        llm_slot: Gemini 請求期間持有的 context manager（用於限制並行度）
+        exec_slot: 代碼執行期間持有的 context manager
+        use_router: 簡單的查詢是否直接以內建圖表函數繪製（不呼叫 Gemini）
+        router_threshold: 本地繪製所需的信心值
+
+    Returns:
+        包含 success、fallback、routed、code、repairs、figures（FigureCapture 格式）、error、timings、
+        llm_calls（每次 Gemini 請求的 model、tier、attempts、seconds、usage）的結果
+    """
+
+    llm_slot = llm_slot or nullcontext()
+    exec_slot = exec_slot or nullcontext()
+
+    result = {
+        'success': False,
+        'fallback': False,
+        'routed': False,
+        'code': None,
+        'repairs': [],
+        'figures': [],
+        'error': None,
+        'timings': {},
+        'llm_calls': []
+    }
+
+    if use_router:
+        stage_start = time.perf_counter()
+        intent = IntentRouter(data_analysis, threshold=router_threshold).route(user_query)
+        if intent is not None and intent['confident']:
+            with exec_slot:
+                routed_result = chart_generator.create_intent_chart(intent, data_analysis)
+            result['timings']['route'] = round(time.perf_counter() - stage_start, 3)
+            if routed_result['success'] and routed_result.get('figure') is not None:
+                result['code'] = intent['code']
+                result['figures'] = [{'type': 'plotly', 'json': routed_result['figure'].to_json()}]
+                result['success'] = True
+                result['routed'] = True
+                return result
+
+    stage_start = time.perf_counter()
+    with llm_slot:
+        generation = gemini_client.generate_chart_code(
+            user_query, data_analysis, chart_generator.available_modules
+        )
+    result['timings']['generate'] = round(time.perf_counter() - stage_start, 3)
+    result['llm_calls'].append(_llm_call(generation))
+
+    if generation['success']:
+        code = generation['code']
+        is_safe, safety_msg = chart_generator.validate_chart_code(code)
+
+        if is_safe:
+            perf_result = chart_generator.check_performance(code)
+            if perf_result['success'] and perf_result['needs_regeneration']:
+                # 逐行處理等無法自動改寫的問題：附上提示重新生成一次向量化版本
+                stage_start = time.perf_counter()
+                with llm_slot:
+                    retry = gemini_client.generate_chart_code(
+                        user_query, data_analysis, chart_generator.available_modules,
+                        performance_hint=perf_result['hint']
+                    )
+                result['timings']['regenerate'] = round(
+                    result['timings'].get('regenerate', 0) + time.perf_counter() - stage_start, 3
+                )
+                result['llm_calls'].append(_llm_call(retry))
+                if retry['success'] and chart_generator.validate_chart_code(retry['code'])[0]:
+                    code = retry['code']
+                    perf_result = chart_generator.check_performance(code)
+
+            if perf_result['success']:
+                code = perf_result['code']
+            result['code'] = code
+
+            stage_start = time.perf_counter()
+            with exec_slot:
+                exec_result = chart_generator.execute_with_repair(code, data_analysis)
+            result['timings']['execute'] = round(time.perf_counter() - stage_start, 3)
+
+            if not exec_result['success']:
+                # 本地無法修正：附上錯誤訊息重新生成一次
+                stage_start = time.perf_counter()
+                with llm_slot:
+                    retry = gemini_client.generate_chart_code(
+                        user_query, data_analysis, chart_generator.available_modules,
+                        error_feedback={'code': exec_result['code'], 'error': exec_result['error']}
+                    )
+                result['timings']['regenerate'] = round(
+                    result['timings'].get('regenerate', 0) + time.perf_counter() - stage_start, 3
+                )
+                result['llm_calls'].append(_llm_call(retry))
+                if retry['success'] and chart_generator.validate_chart_code(retry['code'])[0]:
+                    perf_result = chart_generator.check_performance(retry['code'])
+                    with exec_slot:
+                        exec_result = chart_generator.execute_with_repair(
+                            perf_result['code'] if perf_result['success'] else retry['code'], data_analysis
+                        )
+            result['code'] = exec_result['code']
+            result['repairs'] = exec_result['repairs']
+
+            if exec_result['success'] and exec_result['figures']:
+                result['figures'] = exec_result['figures']
+                result['success'] = True
+            elif exec_result['success']:
+                result['error'] = '代碼執行成功但沒有產生圖表'
+            else:
+                result['error'] = exec_result['error']
+        else:
+            result['error'] = f'代碼安全檢查失敗: {safety_msg}'
+    else:
+        result['error'] = generation['error']
+
+    if not result['success'] and use_fallback:
+        with exec_slot:
+            fallback_result = chart_generator.create_fallback_chart(data_analysis, user_query)
+        if fallback_result['success'] and fallback_result.get('figure') is not None:
+            result['figures'] = [{'type': 'plotly', 'json': fallback_result['figure'].to_json()}]
+            result['success'] = True
+            result['fallback'] = True
+
+    return result
@@ -0,0 +1,274 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+import pandas as pd
+
+from modules.chart_generator import ChartGenerator
+from modules.chart_pipeline import run_chart_query
+from modules.figure_cache import FigureCache
+from modules.intent_router import make_intent
+from modules.tracing import span
+
+# 每個數據集預先繪製的建議圖表數
+DEFAULT_PREFETCH_LIMIT = 3
+
+# 每個數據集預先呼叫 Gemini 的次數（0 表示只使用內建圖表函數）
+DEFAULT_LLM_BUDGET = 0
+
+# DataAnalyzer.get_suitable_chart_suggestions 的類型 → 內建圖表
+_BUILTIN_CHART_TYPES = {
+    'time_series': 'time_series',
+    'line': 'time_series',
+    'area': 'time_series',
+    'scatter': 'scatter',
+    'bar': 'bar',
+    'histogram': 'histogram',
+    'distribution': 'histogram',
+}
+
+# 內建圖表函數無法繪製的建議，改以 Gemini 生成（佔用預算）
+LLM_SUGGESTIONS = {
+    'heatmap': '繪製所有數值欄位的相關係數熱力圖',
+    'correlation': '繪製所有數值欄位的相關係數熱力圖',
+    'pie': '繪製 {category} 各類別數量佔比的圓餅圖',
+    'box': '比較 {category} 各類別 {value} 分布的箱形圖',
+}
+
+# 柱狀圖優先選擇類別數在此範圍內的欄位
+_MAX_BAR_CATEGORIES = 20
+
+
+def _pick_category(data_analysis: Dict[str, Any]) -> Optional[str]:
+    """挑選適合分組的類別欄位（類別數適中者優先）"""
+
+    categorical = data_analysis.get('categorical', [])
+    unique_counts = {
+        col: stats.get('unique_count')
+        for col, stats in data_analysis.get('summary', {}).get('categorical_stats', {}).items()
+    }
+    for col in categorical:
+        count = unique_counts.get(col)
+        if count is not None and 1 < count <= _MAX_BAR_CATEGORIES:
+            return col
+    return categorical[0] if categorical else None
+
+
+def suggest_charts(data_analysis: Dict[str, Any], limit: int = DEFAULT_PREFETCH_LIMIT,
+                   llm_budget: int = 0) -> List[Dict[str, Any]]:
+    """
+    依數據特性挑選要預先繪製的圖表
+
+    Args:
+        data_analysis: 數據分析結果（需要 chart_suggestions 與欄位類型）
+        limit: 內建圖表的數量上限
+        llm_budget: 以 Gemini 生成的數量上限
+
+    Returns:
+        [{'source': 'builtin' 或 'llm', 'query', 'intent', 'code'}]（llm 的 intent 與 code 為 None）
+    """
+
+    numeric = data_analysis.get('numeric', [])
+    datetime_cols = data_analysis.get('datetime', [])
+    category = _pick_category(data_analysis)
+
+    builtin, llm, seen = [], [], set()
+    for suggestion in data_analysis.get('chart_suggestions', []):
+        chart_type = _BUILTIN_CHART_TYPES.get(suggestion)
+        key = chart_type or LLM_SUGGESTIONS.get(suggestion)
+        if key is None or key in seen:
+            continue
+        seen.add(key)
+
+        if chart_type is None:
+            if len(llm) < llm_budget and (category or '{category}' not in key):
+                query = key.format(category=category, value=numeric[0] if numeric else '')
+                llm.append({'source': 'llm', 'query': query, 'intent': None, 'code': None})
+            continue
+        if len(builtin) >= limit:
+            continue
+
+        if chart_type == 'time_series' and datetime_cols and numeric:
+            intent = make_intent('time_series', {'date': datetime_cols[0], 'value': numeric[0]})
+        elif chart_type == 'scatter' and len(numeric) >= 2:
+            intent = make_intent('scatter', {'x': numeric[0], 'y': numeric[1]})
+        elif chart_type == 'bar' and category and numeric:
+            intent = make_intent('bar', {'category': category, 'value': numeric[0]})
+        elif chart_type == 'histogram' and numeric:
+            intent = make_intent('histogram', {'column': numeric[0]})
+        else:
+            continue
+        builtin.append({'source': 'builtin', 'query': intent['description'], 'intent': intent, 'code': intent['code']})
+
+    return builtin + llm
+
+
+class PrefetchJob:
+    """單一數據集的預先繪製進度（由工作執行緒寫入）"""
+
+    def __init__(self, dataset_hash: str, items: List[Dict[str, Any]]):
+        self.dataset_hash = dataset_hash
+        self._entries = [
+            dict(item, status='pending', cache_key=None, seconds=None, error=None, used=False)
+            for item in items
+        ]
+        self._lock = threading.Lock()
+        self._done_event = threading.Event()
+        if not items:
+            self._done_event.set()
+
+    @property
+    def done(self) -> bool:
+        return self._done_event.is_set()
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """所有建議圖表的目前狀態"""
+        with self._lock:
+            return [dict(entry) for entry in self._entries]
+
+    def ready(self) -> List[Dict[str, Any]]:
+        """已繪製完成、可直接顯示的建議圖表"""
+        return [entry for entry in self.entries() if entry['status'] == 'ready']
+
+    def _update(self, index: int, **values) -> None:
+        with self._lock:
+            self._entries[index].update(values)
+
+    def _mark_used(self, cache_key: str) -> bool:
+        with self._lock:
+            for entry in self._entries:
+                if entry['cache_key'] == cache_key:
+                    first_use = not entry['used']
+                    entry['used'] = True
+                    return first_use
+        return False
+
+
+class ChartPrefetcher:
+    """
+    分析完成後在背景預先繪製建議的圖表，寫入共用的 FigureCache
+
+    建議圖表以內建圖表函數繪製；內建函數無法繪製的建議（熱力圖、圓餅圖等）
+    可在預算內以低優先順序呼叫 Gemini（排在內建圖表之後，且只用一個工作執行緒）。
+    使用者點選建議或送出相同意圖的查詢時直接從快取顯示。
+    """
+
+    def __init__(self, figure_cache: FigureCache, limit: int = DEFAULT_PREFETCH_LIMIT,
+                 llm_budget: int = DEFAULT_LLM_BUDGET, workers: int = 1):
+        """
+        Args:
+            figure_cache: 寫入預先繪製結果的圖表快取
+            limit: 每個數據集預先繪製的內建圖表數（0 表示停用）
+            llm_budget: 每個數據集預先呼叫 Gemini 的次數
+            workers: 工作執行緒數
+        """
+        self.figure_cache = figure_cache
+        self.limit = limit
+        self.llm_budget = llm_budget
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch')
+        self._jobs: Dict[str, PrefetchJob] = {}
+        self._lock = threading.Lock()
+        self.stats = {'scheduled': 0, 'rendered': 0, 'failed': 0, 'llm_calls': 0, 'used': 0}
+
+    @classmethod
+    def from_env(cls, figure_cache: FigureCache) -> 'ChartPrefetcher':
+        """從環境變數 PREFETCH_CHART_LIMIT、PREFETCH_LLM_BUDGET 建立"""
+        return cls(
+            figure_cache,
+            limit=int(os.getenv('PREFETCH_CHART_LIMIT', DEFAULT_PREFETCH_LIMIT)),
+            llm_budget=int(os.getenv('PREFETCH_LLM_BUDGET', DEFAULT_LLM_BUDGET))
+        )
+
+    def prefetch(self, dataset_hash: str, df: pd.DataFrame, data_analysis: Dict[str, Any],
+                 gemini_client=None) -> PrefetchJob:
+        """
+        開始在背景繪製數據集的建議圖表（同一數據集只執行一次）
+
+        Args:
+            dataset_hash: 數據集雜湊
+            df: 數據
+            data_analysis: 完整的數據分析結果
+            gemini_client: 有值時依預算以 Gemini 生成內建函數無法繪製的建議
+
+        Returns:
+            可查詢進度的預先繪製工作
+        """
+
+        with self._lock:
+            job = self._jobs.get(dataset_hash)
+            if job is not None:
+                return job
+            llm_budget = self.llm_budget if gemini_client is not None else 0
+            job = self._jobs[dataset_hash] = PrefetchJob(
+                dataset_hash, suggest_charts(data_analysis, self.limit, llm_budget) if self.limit > 0 else []
+            )
+            self.stats['scheduled'] += len(job.entries())
+
+        if not job.done:
+            self._executor.submit(self._run, job, df, data_analysis, gemini_client)
+        return job
+
+    def get_job(self, dataset_hash: str) -> Optional[PrefetchJob]:
+        with self._lock:
+            return self._jobs.get(dataset_hash)
+
+    def mark_used(self, dataset_hash: str, cache_key: str) -> bool:
+        """記錄預先繪製的圖表被使用；回傳該快取鍵是否為預先繪製的結果"""
+        job = self.get_job(dataset_hash)
+        if job is None or not cache_key:
+            return False
+        if job._mark_used(cache_key):
+            with self._lock:
+                self.stats['used'] += 1
+        return any(entry['cache_key'] == cache_key for entry in job.entries())
+
+    def forget(self, dataset_hash: str) -> None:
+        """移除數據集的預先繪製紀錄（下次 prefetch 時重新繪製）"""
+        with self._lock:
+            self._jobs.pop(dataset_hash, None)
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'datasets': len(self._jobs), **self.stats}
+
+    def _run(self, job: PrefetchJob, df: pd.DataFrame, data_analysis: Dict[str, Any], gemini_client=None) -> None:
+        try:
+            chart_generator = ChartGenerator(df, dataset_key=job.dataset_hash, show_module_status=False)
+            for index, entry in enumerate(job.entries()):
+                started = time.perf_counter()
+                try:
+                    with span('prefetch.chart', source=entry['source'], query=entry['query']):
+                        if entry['source'] == 'builtin':
+                            fig = chart_generator.intent_figure(entry['intent'], data_analysis)
+                            code = entry['code']
+                            figures = [{'type': 'plotly', 'json': fig.to_json()}]
+                            cache_key = FigureCache.make_intent_key(job.dataset_hash, entry['intent'])
+                        else:
+                            with self._lock:
+                                self.stats['llm_calls'] += 1
+                            result = run_chart_query(
+                                chart_generator, gemini_client, data_analysis, entry['query'],
+                                use_fallback=False, use_router=False
+                            )
+                            if not result['success']:
+                                raise RuntimeError(result['error'])
+                            code, figures = result['code'], result['figures']
+                            cache_key = FigureCache.make_key(job.dataset_hash, code)
+                except Exception as e:
+                    job._update(index, status='failed', error=str(e))
+                    with self._lock:
+                        self.stats['failed'] += 1
+                    continue
+
+                self.figure_cache.put(cache_key, figures, code=code)
+                self.figure_cache.remember_query(job.dataset_hash, entry['query'], cache_key)
+                job._update(
+                    index, status='ready', code=code, cache_key=cache_key,
+                    seconds=round(time.perf_counter() - started, 3)
+                )
+                with self._lock:
+                    self.stats['rendered'] += 1
+        finally:
+            job._done_event.set()
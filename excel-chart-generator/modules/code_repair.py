@@ -0,0 +1,375 @@
+import ast
+import re
+from difflib import SequenceMatcher
+from typing import Dict, Any, List, Optional, Tuple
+
+
+def _normalize_name(name) -> str:
+    """比較欄位名稱用：忽略大小寫、空白、底線、連字號與點"""
+    return re.sub(r'[\s_\-.]+', '', str(name).lower())
+
+
+class CodeRepairer:
+    """
+    依執行錯誤與 AST 在本地修正生成代碼的常見錯誤，不需再呼叫 Gemini
+
+    - KeyError 等欄位錯誤：把錯誤的欄位名稱對應到最接近的實際欄位
+    - NameError：把模組全名或誤用的別名對應到執行環境中已載入的名稱
+    - 日期運算錯誤：在代碼開頭將用到的日期欄位轉換為 datetime
+    """
+
+    # 欄位或名稱的相似度門檻
+    MATCH_THRESHOLD = 0.8
+
+    # 模組全名或常見的誤用別名 → 執行環境中的別名
+    MODULE_ALIASES = {
+        'pandas': 'pd',
+        'numpy': 'np',
+        'plotly_express': 'px',
+        'express': 'px',
+        'graph_objects': 'go',
+        'pyplot': 'plt',
+        'matplotlib': 'plt',
+        'seaborn': 'sns',
+        'streamlit': 'st',
+        'scipy': 'stats',
+        'statsmodels': 'sm',
+    }
+    # 帶屬性的模組全名（例如 plotly.express.bar）
+    DOTTED_ALIASES = {
+        'plotly.express': 'px',
+        'plotly.graph_objects': 'go',
+        'plotly.graph_objs': 'go',
+        'matplotlib.pyplot': 'plt',
+        'scipy.stats': 'stats',
+        'statsmodels.api': 'sm',
+    }
+    # 常被誤用的數據變數名稱
+    DATAFRAME_NAMES = {'data', 'dataframe', 'data_frame', 'dataset', 'df_data'}
+
+    # 以欄位名稱為值的繪圖參數
+    COLUMN_KEYWORDS = {
+        'x', 'y', 'z', 'color', 'size', 'symbol', 'names', 'values', 'hue', 'text', 'by', 'on', 'subset',
+        'columns', 'index', 'facet_row', 'facet_col', 'hover_name', 'hover_data', 'line_group',
+        'animation_frame', 'path', 'parents', 'value_vars', 'id_vars'
+    }
+    # 以欄位名稱為位置參數的方法
+    COLUMN_METHODS = {'groupby', 'sort_values', 'set_index', 'drop_duplicates', 'pivot_table', 'nlargest', 'nsmallest'}
+
+    # 日期欄位未轉換時常見的錯誤訊息
+    DATE_ERROR_PATTERN = re.compile(
+        r'\.dt accessor|DatetimeIndex|datetimelike|Timestamp|strftime|'
+        r"'str' object has no attribute '(year|month|day|hour|date)'|"
+        r"unsupported operand type\(s\) for -: 'str'|Invalid comparison between",
+        re.IGNORECASE
+    )
+
+    def __init__(self, columns: List[Any], datetime_columns: List[Any] = None,
+                 available_names: List[str] = None, df_name: str = 'df'):
+        """
+        Args:
+            columns: 數據的欄位名稱
+            datetime_columns: 識別為日期時間的欄位
+            available_names: 執行環境中已載入的名稱（模組別名與輔助函數）
+            df_name: 代碼中數據變數的名稱
+        """
+        self.columns = list(columns)
+        self.datetime_columns = list(datetime_columns or [])
+        self.available_names = set(available_names or []) | {df_name}
+        self.df_name = df_name
+        self._normalized = {}
+        for col in self.columns:
+            self._normalized.setdefault(_normalize_name(col), []).append(col)
+
+    def repair(self, code: str, error: BaseException) -> Dict[str, Any]:
+        """
+        嘗試修正代碼
+
+        Args:
+            code: 執行失敗的代碼
+            error: 執行時發生的例外
+
+        Returns:
+            {'code': 修正後的代碼, 'fixes': 修正說明清單}；無法修正時 fixes 為空、code 不變
+        """
+
+        try:
+            tree = ast.parse(code)
+        except SyntaxError:
+            return {'code': code, 'fixes': []}
+
+        message = str(error)
+        if isinstance(error, NameError):
+            fixer = self._fix_names
+        elif isinstance(error, AttributeError) and "'DataFrame' object has no attribute" in message:
+            fixer = self._fix_attribute_column
+        elif self.DATE_ERROR_PATTERN.search(message):
+            fixer = self._fix_dates
+        elif isinstance(error, (KeyError, ValueError)):
+            fixer = self._fix_columns
+        else:
+            return {'code': code, 'fixes': []}
+
+        replacements, fixes = fixer(tree, code, error)
+        if not fixes:
+            return {'code': code, 'fixes': []}
+        return {'code': self._apply(code, replacements), 'fixes': fixes}
+
+    def match_column(self, name) -> Optional[Any]:
+        """最接近的實際欄位名稱（找不到或有多個同樣接近時回傳 None）"""
+
+        if name in self.columns:
+            return name
+        key = _normalize_name(name)
+        exact = self._normalized.get(key, [])
+        if len(exact) == 1:
+            return exact[0]
+        if exact or not key:
+            return None
+
+        scores = sorted(
+            ((SequenceMatcher(None, key, normalized).ratio(), cols) for normalized, cols in self._normalized.items()),
+            key=lambda item: item[0], reverse=True
+        )
+        best_score, best = scores[0]
+        if best_score < self.MATCH_THRESHOLD or len(best) != 1:
+            return None
+        if len(scores) > 1 and scores[1][0] >= best_score:
+            return None
+        return best[0]
+
+    def _fix_columns(self, tree: ast.AST, code: str, error: BaseException) -> Tuple[List, List[str]]:
+        """錯誤的欄位名稱 → 最接近的實際欄位"""
+
+        names = self._missing_columns(error)
+        created = self._created_columns(tree)
+        if not names:
+            # 錯誤訊息沒有指出欄位時，檢查所有當作欄位使用的字串
+            names = [
+                node.value for node in self._column_constants(tree)
+                if node.value not in self.columns and node.value not in created
+            ]
+
+        mapping = {}
+        for name in names:
+            match = self.match_column(name)
+            if match is not None and match != name:
+                mapping[name] = match
+        if not mapping:
+            return [], []
+
+        replacements = [
+            (node, repr(mapping[node.value])) for node in ast.walk(tree)
+            if isinstance(node, ast.Constant) and isinstance(node.value, str) and node.value in mapping
+        ]
+        fixes = [f"欄位 {bad!r} → {good!r}" for bad, good in mapping.items()]
+        return replacements, fixes
+
+    def _fix_attribute_column(self, tree: ast.AST, code: str, error: BaseException) -> Tuple[List, List[str]]:
+        """df.欄位 寫法中錯誤的欄位名稱 → df['實際欄位']"""
+
+        found = re.search(r"has no attribute '([^']+)'", str(error))
+        if not found:
+            return [], []
+        match = self.match_column(found.group(1))
+        if match is None:
+            return [], []
+
+        replacements = [
+            (node, f"{ast.get_source_segment(code, node.value)}[{match!r}]") for node in ast.walk(tree)
+            if isinstance(node, ast.Attribute) and node.attr == found.group(1)
+            and isinstance(node.value, ast.Name) and node.value.id == self.df_name
+        ]
+        if not replacements:
+            return [], []
+        return replacements, [f"欄位 {found.group(1)!r} → {match!r}"]
+
+    def _fix_names(self, tree: ast.AST, code: str, error: BaseException) -> Tuple[List, List[str]]:
+        """未定義的名稱 → 已載入的模組別名或數據變數"""
+
+        name = getattr(error, 'name', None)
+        if not name:
+            found = re.search(r"name '([^']+)' is not defined", str(error))
+            name = found.group(1) if found else None
+        if not name or name in self.available_names:
+            return [], []
+
+        replacements, fixes = [], []
+        replaced_names = set()
+
+        # plotly.express.bar → px.bar
+        for node in ast.walk(tree):
+            dotted = self._dotted_name(node)
+            if dotted and dotted.split('.')[0] == name:
+                target = self.DOTTED_ALIASES.get(dotted)
+                if target in self.available_names:
+                    replacements.append((node, target))
+                    replaced_names.add(id(node.value))
+                    if f"{dotted} → {target}" not in fixes:
+                        fixes.append(f"{dotted} → {target}")
+
+        target = self._name_target(name)
+        if target is not None:
+            for node in ast.walk(tree):
+                if (isinstance(node, ast.Name) and node.id == name and isinstance(node.ctx, ast.Load)
+                        and id(node) not in replaced_names):
+                    replacements.append((node, target))
+            fixes.append(f"{name} → {target}")
+
+        return replacements, fixes
+
+    def _fix_dates(self, tree: ast.AST, code: str, error: BaseException) -> Tuple[List, List[str]]:
+        """在代碼開頭將用到的日期欄位轉換為 datetime"""
+
+        if not self.datetime_columns:
+            return [], []
+
+        used = {
+            node.value for node in ast.walk(tree)
+            if isinstance(node, ast.Constant) and isinstance(node.value, str)
+        }
+        columns = [col for col in self.datetime_columns if col in used] or self.datetime_columns
+        converted = self._converted_columns(tree)
+        columns = [col for col in columns if col not in converted]
+        if not columns:
+            return [], []
+
+        lines = ''.join(
+            f"{self.df_name}[{col!r}] = pd.to_datetime({self.df_name}[{col!r}], format='mixed', errors='coerce')\n"
+            for col in columns
+        )
+        return [(None, lines)], [f"將 {col!r} 轉換為日期時間" for col in columns]
+
+    def _missing_columns(self, error: BaseException) -> List[str]:
+        """從錯誤訊息取出找不到的欄位名稱"""
+
+        message = str(error)
+        if isinstance(error, KeyError) and error.args and isinstance(error.args[0], str):
+            key = error.args[0]
+            # df[['a', 'b']] 的錯誤訊息會列出所有找不到的欄位
+            if 'not in index' in key or 'are in the [' in key:
+                return re.findall(r"'([^']*)'", key)
+            # groupby(...)[欄位] 的錯誤訊息
+            if key.startswith('Column not found: '):
+                return [key[len('Column not found: '):]]
+            return [key]
+
+        for pattern in (
+            r'but received: (.+)',                      # plotly express
+            r'Could not interpret value `([^`]*)`',     # seaborn
+            r"Column\(s\) \['([^']*)'\] do not exist",  # pandas agg
+        ):
+            found = re.search(pattern, message)
+            if found:
+                return [found.group(1).strip()]
+        return []
+
+    def _column_constants(self, tree: ast.AST) -> List[ast.Constant]:
+        """當作欄位名稱使用的字串常數（df['x']、x='x'、groupby('x') 等）"""
+
+        nodes = []
+
+        def collect(value):
+            if isinstance(value, ast.Constant) and isinstance(value.value, str):
+                nodes.append(value)
+            elif isinstance(value, (ast.List, ast.Tuple)):
+                for element in value.elts:
+                    collect(element)
+
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Subscript):
+                collect(node.slice)
+            elif isinstance(node, ast.Call):
+                for keyword in node.keywords:
+                    if keyword.arg in self.COLUMN_KEYWORDS:
+                        collect(keyword.value)
+                if isinstance(node.func, ast.Attribute) and node.func.attr in self.COLUMN_METHODS:
+                    for arg in node.args[:1]:
+                        collect(arg)
+        return nodes
+
+    def _created_columns(self, tree: ast.AST) -> set:
+        """代碼自行建立的欄位（賦值目標、rename 與命名聚合的新名稱）"""
+
+        created = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Subscript) and isinstance(node.ctx, ast.Store):
+                if isinstance(node.slice, ast.Constant):
+                    created.add(node.slice.value)
+            elif isinstance(node, ast.Call):
+                for keyword in node.keywords:
+                    if keyword.arg is not None and isinstance(node.func, ast.Attribute) and node.func.attr in (
+                        'agg', 'aggregate', 'assign'
+                    ):
+                        created.add(keyword.arg)
+                    if keyword.arg in ('columns', 'name', 'value_name', 'var_name'):
+                        value = keyword.value
+                        if isinstance(value, ast.Dict):
+                            created.update(v.value for v in value.values if isinstance(v, ast.Constant))
+                        elif isinstance(value, ast.Constant):
+                            created.add(value.value)
+        return created
+
+    def _converted_columns(self, tree: ast.AST) -> set:
+        """代碼中已經以 to_datetime 轉換的欄位"""
+
+        converted = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'to_datetime':
+                for inner in ast.walk(node):
+                    if isinstance(inner, ast.Constant) and isinstance(inner.value, str):
+                        converted.add(inner.value)
+        return converted
+
+    def _name_target(self, name: str) -> Optional[str]:
+        """未定義名稱應改成的名稱"""
+
+        target = self.MODULE_ALIASES.get(name)
+        if target in self.available_names:
+            return target
+        if name.lower() in self.DATAFRAME_NAMES:
+            return self.df_name
+
+        candidates = [
+            candidate for candidate in self.available_names
+            if SequenceMatcher(None, name, candidate).ratio() >= self.MATCH_THRESHOLD
+        ]
+        return candidates[0] if len(candidates) == 1 else None
+
+    def _dotted_name(self, node: ast.AST) -> Optional[str]:
+        """Attribute 鏈的完整名稱（例如 plotly.express）；只處理兩層"""
+        if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name):
+            return f'{node.value.id}.{node.attr}'
+        return None
+
+    def _apply(self, code: str, replacements: List[Tuple[Optional[ast.AST], str]]) -> str:
+        """依原始位置取代節點（保留原本的格式與註解）；節點為 None 時插入到代碼開頭"""
+
+        line_starts = [0]
+        for line in code.splitlines(keepends=True):
+            line_starts.append(line_starts[-1] + len(line))
+
+        def offset(lineno, col):
+            # col_offset 以 UTF-8 位元組計算
+            line = code[line_starts[lineno - 1]:line_starts[lineno]] if lineno < len(line_starts) else ''
+            return line_starts[lineno - 1] + len(line.encode('utf-8')[:col].decode('utf-8', errors='ignore'))
+
+        prefix = ''
+        spans = []
+        for node, text in replacements:
+            if node is None:
+                prefix += text
+                continue
+            start = offset(node.lineno, node.col_offset)
+            end = offset(node.end_lineno, node.end_col_offset)
+            spans.append((start, end, text))
+
+        # 由後往前取代，並略過與已取代範圍重疊的節點
+        result = code
+        last_start = None
+        for start, end, text in sorted(set(spans), key=lambda span: span[0], reverse=True):
+            if last_start is not None and end > last_start:
+                continue
+            result = result[:start] + text + result[end:]
+            last_start = start
+        return prefix + result
@@ -1,8 +1,14 @@
+import logging
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Iterator, Tuple
 import re
 
+from modules.summary_cube import SummaryCube
+from modules.tracing import span
+
+logger = logging.getLogger(__name__)
+
 class DataAnalyzer:
     def __init__(self, df: pd.DataFrame):
         """初始化數據分析器"""
@@ -13,59 +19,99 @@ class DataAnalyzer:
     def analyze_data(self) -> Dict[str, Any]:
         """完整分析數據結構"""
         
-        # 識別欄位類型
-        self.column_types = self._identify_column_types()
-        
-        # 生成數據摘要
-        summary = self._generate_data_summary()
-        
-        # 取得數據樣本
-        sample_data = self._get_sample_data()
+        for _ in self.iter_analysis():
+            pass
         
-        self.analysis_result = {
+        return self.analysis_result
+    
+    def iter_analysis(self) -> Iterator[Tuple]:
+        """
+        逐步分析數據結構，每完成一個步驟就產生一個事件（供背景分析回報進度）
+        
+        事件依序為：
+            ('column_type', 欄位, 類型)      每個欄位的類型
+            ('types', 初步結果)              類型識別完成（尚無統計與聚合立方體）
+            ('column_stats', 欄位, 統計)     每個欄位的摘要統計
+            ('done', 完整結果)
+        """
+        
+        with span('analyze', rows=len(self.df), columns=len(self.df.columns)):
+            # 識別欄位類型
+            column_types = {'numeric': [], 'datetime': [], 'categorical': []}
+            with span('analyze.column_types'):
+                for col in self.df.columns:
+                    col_type = self._classify_column(col)
+                    column_types[col_type].append(col)
+                    yield ('column_type', col, col_type)
+            self.column_types = column_types
+            
+            # 取得數據樣本
+            sample_data = self._get_sample_data()
+            
+            # 類型確定後即可開始生成圖表（Gemini 只需要欄位類型與樣本）
+            self.analysis_result = self._build_result(
+                summary={'shape': self.df.shape, 'data_types': self.df.dtypes.astype(str).to_dict()},
+                sample_data=sample_data, summary_cube=None, complete=False
+            )
+            yield ('types', self.analysis_result)
+            
+            # 生成數據摘要
+            column_stats = {}
+            with span('analyze.summary'):
+                for col in self.df.columns:
+                    column_stats[col] = self._column_stats(col)
+                    yield ('column_stats', col, column_stats[col])
+                summary = self._generate_data_summary(column_stats)
+            
+            # 預先計算後備圖表用的聚合立方體
+            # 立方體只是後備圖表的加速，建立失敗時不影響分析結果
+            with span('analyze.summary_cube') as cube_span:
+                try:
+                    summary_cube = SummaryCube(self.df, self.column_types).build()
+                except Exception as e:
+                    logger.warning("建立聚合立方體失敗，後備圖表改用完整數據: %s", e, exc_info=True)
+                    cube_span.set_attribute('error', str(e))
+                    summary_cube = None
+        
+        self.analysis_result = self._build_result(
+            summary=summary, sample_data=sample_data, summary_cube=summary_cube, complete=True
+        )
+        yield ('done', self.analysis_result)
+    
+    def _build_result(self, summary: Dict[str, Any], sample_data: Dict[str, Any], summary_cube,
+                      complete: bool) -> Dict[str, Any]:
+        return {
             'column_types': self.column_types,
             'summary': summary,
             'sample_data': sample_data,
+            'summary_cube': summary_cube,
             'row_count': len(self.df),
             'column_count': len(self.df.columns),
             'numeric': self.column_types.get('numeric', []),
             'datetime': self.column_types.get('datetime', []),
-            'categorical': self.column_types.get('categorical', [])
+            'categorical': self.column_types.get('categorical', []),
+            'chart_suggestions': self.get_suitable_chart_suggestions(),
+            'complete': complete
         }
-        
-        return self.analysis_result
     
-    def _identify_column_types(self) -> Dict[str, List[str]]:
-        """智能識別欄位類型"""
+    def _classify_column(self, col) -> str:
+        """識別單一欄位的類型（numeric / datetime / categorical）"""
         
-        numeric_cols = []
-        datetime_cols = []
-        categorical_cols = []
+        col_data = self.df[col].dropna()
         
-        for col in self.df.columns:
-            col_data = self.df[col].dropna()
-            
-            if len(col_data) == 0:
-                categorical_cols.append(col)
-                continue
-            
-            # 檢查是否為數值類型
-            if self._is_numeric_column(col_data):
-                numeric_cols.append(col)
-            
-            # 檢查是否為日期時間類型
-            elif self._is_datetime_column(col_data):
-                datetime_cols.append(col)
-            
-            # 否則歸類為類別型
-            else:
-                categorical_cols.append(col)
+        if len(col_data) == 0:
+            return 'categorical'
         
-        return {
-            'numeric': numeric_cols,
-            'datetime': datetime_cols,
-            'categorical': categorical_cols
-        }
+        # 檢查是否為數值類型
+        if self._is_numeric_column(col_data):
+            return 'numeric'
+        
+        # 檢查是否為日期時間類型
+        if self._is_datetime_column(col_data):
+            return 'datetime'
+        
+        # 否則歸類為類別型
+        return 'categorical'
     
     def _is_numeric_column(self, series: pd.Series) -> bool:
         """判斷是否為數值欄位"""
@@ -127,32 +173,47 @@ class DataAnalyzer:
         except:
             return False
     
-    def _generate_data_summary(self) -> Dict[str, Any]:
-        """生成數據摘要統計"""
+    def _column_stats(self, col) -> Dict[str, Any]:
+        """單一欄位的摘要統計（依識別出的類型）"""
+        
+        series = self.df[col]
+        stats = {'missing': int(series.isnull().sum())}
+        
+        # 數值欄位統計
+        if col in self.column_types.get('numeric', []) and pd.api.types.is_numeric_dtype(series):
+            stats['numeric_stats'] = series.describe().to_dict()
+        
+        # 類別欄位統計
+        elif col in self.column_types.get('categorical', []):
+            stats['categorical_stats'] = {
+                'unique_count': series.nunique(),
+                'top_values': series.value_counts().head(10).to_dict()
+            }
+        
+        return stats
+    
+    def _generate_data_summary(self, column_stats: Dict[str, Dict[str, Any]] = None) -> Dict[str, Any]:
+        """生成數據摘要統計（可傳入已逐欄計算的統計）"""
+        
+        if column_stats is None:
+            column_stats = {col: self._column_stats(col) for col in self.df.columns}
         
         summary = {
             'shape': self.df.shape,
-            'missing_values': self.df.isnull().sum().to_dict(),
+            'missing_values': {col: stats['missing'] for col, stats in column_stats.items()},
             'data_types': self.df.dtypes.astype(str).to_dict()
         }
         
-        # 數值欄位統計
-        if self.column_types.get('numeric'):
-            numeric_df = self.df[self.column_types['numeric']].select_dtypes(include=[np.number])
-            if not numeric_df.empty:
-                summary['numeric_stats'] = numeric_df.describe().to_dict()
+        numeric_stats = {
+            col: stats['numeric_stats'] for col, stats in column_stats.items() if 'numeric_stats' in stats
+        }
+        if numeric_stats:
+            summary['numeric_stats'] = numeric_stats
         
-        # 類別欄位統計
         if self.column_types.get('categorical'):
-            categorical_stats = {}
-            for col in self.column_types['categorical']:
-                if col in self.df.columns:
-                    value_counts = self.df[col].value_counts().head(10)
-                    categorical_stats[col] = {
-                        'unique_count': self.df[col].nunique(),
-                        'top_values': value_counts.to_dict()
-                    }
-            summary['categorical_stats'] = categorical_stats
+            summary['categorical_stats'] = {
+                col: stats['categorical_stats'] for col, stats in column_stats.items() if 'categorical_stats' in stats
+            }
         
         return summary
     
@@ -191,4 +252,4 @@ class DataAnalyzer:
         if numeric_count == 1:
             suggestions.extend(['histogram', 'distribution'])
         
-        return list(set(suggestions))  # 去除重複
\ No newline at end of file
+        return list(dict.fromkeys(suggestions))  # 去除重複（保留順序）
\ No newline at end of file
@@ -0,0 +1,328 @@
+import threading
+import time
+import uuid
+import weakref
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, Any, Callable, List, Optional
+
+import pandas as pd
+
+from modules.background_profiler import BackgroundProfiler, ProfilingJob
+from modules.memory_accountant import deep_size, write_spill, read_spill, remove_files
+
+# 沒有 session 引用後保留的秒數（期間重新整理頁面或其他人上傳相同檔案可直接共用）
+DEFAULT_IDLE_TIMEOUT = 300
+
+# 引用超過此秒數未使用即視為放棄（分頁已關閉但 session 尚未被回收）
+DEFAULT_LEASE_TIMEOUT = 3600
+
+
+class _Entry:
+    """登錄表中的單一數據集"""
+
+    def __init__(self, dataset_hash: str):
+        self.dataset_hash = dataset_hash
+        self.future: Optional[Future] = None
+        self.profile_job: Optional[ProfilingJob] = None
+        self.refs = 0
+        self.idle_since = time.time()
+        self.spill_path: Optional[Path] = None
+        self.size = 0
+        self.analysis_size = 0
+
+
+class DatasetRegistry:
+    """
+    行程內共用的數據集登錄表（以內容雜湊為鍵）
+
+    相同內容的檔案只解析、分析一次，所有 session 共用同一份 DataFrame 與分析結果
+    （共用的數據不可原地修改；ChartGenerator 執行代碼前會先複製）。
+    最後一個引用釋放並閒置超過 idle_timeout 後才真正釋放記憶體。
+    """
+
+    def __init__(self, idle_timeout: float = DEFAULT_IDLE_TIMEOUT, lease_timeout: float = DEFAULT_LEASE_TIMEOUT,
+                 spill_dir: Path = None, profiler: BackgroundProfiler = None):
+        """
+        Args:
+            idle_timeout: 沒有引用後保留的秒數（0 表示立即釋放）
+            lease_timeout: 引用閒置多久後自動釋放（None 表示不限）
+            spill_dir: 記憶體不足時暫存未被引用的數據集的目錄
+            profiler: 執行背景分析的執行緒池
+        """
+        self.idle_timeout = idle_timeout
+        self.lease_timeout = lease_timeout
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        self.profiler = profiler or BackgroundProfiler()
+        self._entries: Dict[str, _Entry] = {}
+        self._leases = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self.stats = {'loads': 0, 'shared': 0, 'analyses': 0, 'restores': 0, 'spills': 0, 'freed': 0, 'expired': 0}
+
+    def acquire(self, dataset_hash: str, loader: Callable[[], pd.DataFrame]) -> 'DatasetLease':
+        """
+        取得數據集的引用（尚未載入時以 loader 載入；同一雜湊只會載入一次）
+
+        Args:
+            dataset_hash: 檔案內容雜湊
+            loader: 載入 DataFrame 的函數
+
+        Returns:
+            數據集引用；不再使用時呼叫 release()
+        """
+
+        self._add_ref(dataset_hash)
+        try:
+            self._load(dataset_hash, loader)
+        except Exception:
+            self._release(dataset_hash)
+            raise
+
+        lease = DatasetLease(self, dataset_hash, loader)
+        with self._lock:
+            self._leases.add(lease)
+        return lease
+
+    def _add_ref(self, dataset_hash: str) -> None:
+        with self._lock:
+            entry = self._entries.get(dataset_hash)
+            if entry is None:
+                entry = self._entries[dataset_hash] = _Entry(dataset_hash)
+            elif entry.future is not None:
+                self.stats['shared'] += 1
+            entry.refs += 1
+
+    def _release(self, dataset_hash: str) -> None:
+        with self._lock:
+            entry = self._entries.get(dataset_hash)
+            if entry is None or entry.refs == 0:
+                return
+            entry.refs -= 1
+            if entry.refs == 0:
+                entry.idle_since = time.time()
+                if self.idle_timeout <= 0:
+                    self._drop(entry)
+
+    def _load(self, dataset_hash: str, loader: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """取得 DataFrame（必要時載入，或從暫存檔載回）；呼叫端必須持有引用"""
+
+        with self._lock:
+            entry = self._entries[dataset_hash]
+            future = entry.future
+            owner = future is None
+            if owner:
+                future = entry.future = Future()
+                spill_path = entry.spill_path
+
+        if owner:
+            try:
+                if spill_path is not None:
+                    df = read_spill(spill_path)
+                else:
+                    df = loader()
+                size = deep_size(df)
+            except Exception as e:
+                with self._lock:
+                    if entry.future is future:
+                        entry.future = None
+                future.set_exception(e)
+            else:
+                with self._lock:
+                    entry.size = size
+                    self.stats['restores' if spill_path is not None else 'loads'] += 1
+                future.set_result(df)
+
+        return future.result()
+
+    def _profile(self, dataset_hash: str, loader: Callable[[], pd.DataFrame],
+                 retry_failed: bool = False) -> ProfilingJob:
+        """取得背景分析工作（同一數據集只分析一次）；呼叫端必須持有引用"""
+
+        with self._lock:
+            job = self._entries[dataset_hash].profile_job
+        if job is not None and not (retry_failed and job.failed):
+            return job
+
+        df = self._load(dataset_hash, loader)
+        with self._lock:
+            entry = self._entries[dataset_hash]
+            job = entry.profile_job
+            if job is None or (retry_failed and job.failed):
+                job = entry.profile_job = self.profiler.submit(
+                    df, on_done=lambda job: self._record_analysis(entry, job)
+                )
+        return job
+
+    def _record_analysis(self, entry: _Entry, job: ProfilingJob) -> None:
+        if job.failed:
+            return
+        size = deep_size(job.current_analysis())
+        with self._lock:
+            if entry.profile_job is job:
+                entry.analysis_size = size
+            self.stats['analyses'] += 1
+
+    def has_analysis(self, dataset_hash: str) -> bool:
+        """數據集是否已有完整的分析結果"""
+        with self._lock:
+            entry = self._entries.get(dataset_hash)
+            job = entry.profile_job if entry else None
+        return job is not None and job.done and not job.failed
+
+    def entry_usage(self, dataset_hash: str) -> Dict[str, int]:
+        """單一數據集在記憶體中的大小（已暫存到磁碟的部分不計）"""
+        with self._lock:
+            entry = self._entries.get(dataset_hash)
+            if entry is None:
+                return {'df': 0, 'data_analysis': 0}
+            return {
+                'df': entry.size if entry.future is not None else 0,
+                'data_analysis': entry.analysis_size
+            }
+
+    def spill_idle(self) -> int:
+        """
+        將沒有引用的數據集暫存到磁碟（記憶體不足時由 MemoryAccountant 呼叫）
+
+        Returns:
+            釋放的位元組數
+        """
+
+        with self._lock:
+            candidates = [
+                entry for entry in self._entries.values()
+                if entry.refs == 0 and entry.future is not None and entry.future.done()
+                and entry.future.exception() is None
+            ]
+
+        freed = 0
+        for entry in sorted(candidates, key=lambda entry: entry.idle_since):
+            future, path = entry.future, None
+            if future is None:
+                continue
+            if self.spill_dir is not None and entry.spill_path is None:
+                # 在鎖外寫檔，避免阻塞其他 session
+                self.spill_dir.mkdir(parents=True, exist_ok=True)
+                path = write_spill(
+                    future.result(), self.spill_dir / f'{entry.dataset_hash[:16]}_{uuid.uuid4().hex[:8]}'
+                )
+
+            with self._lock:
+                if entry.refs or self._entries.get(entry.dataset_hash) is not entry or entry.future is not future:
+                    # 寫檔期間又被引用
+                    if path is not None:
+                        remove_files([path])
+                    continue
+                if path is not None:
+                    entry.spill_path = path
+                if entry.spill_path is None:
+                    # 沒有暫存目錄時直接釋放，之後由 loader 重新載入
+                    self._drop(entry)
+                else:
+                    entry.future = None
+                    self.stats['spills'] += 1
+                freed += entry.size
+
+        return freed
+
+    def sweep(self) -> List[str]:
+        """
+        釋放閒置超過 idle_timeout 的數據集，並收回閒置超過 lease_timeout 的引用
+
+        Returns:
+            被釋放的數據集雜湊
+        """
+
+        now = time.time()
+        if self.lease_timeout is not None:
+            with self._lock:
+                stale = [lease for lease in self._leases if now - lease.last_access > self.lease_timeout]
+            for lease in stale:
+                if lease.release():
+                    self.stats['expired'] += 1
+
+        with self._lock:
+            expired = [
+                entry for entry in self._entries.values()
+                if entry.refs == 0 and now - entry.idle_since >= self.idle_timeout
+            ]
+            for entry in expired:
+                self._drop(entry)
+        return [entry.dataset_hash for entry in expired]
+
+    def _drop(self, entry: _Entry) -> None:
+        """從登錄表移除（呼叫端需持有鎖）"""
+        if self._entries.get(entry.dataset_hash) is entry:
+            del self._entries[entry.dataset_hash]
+            self.stats['freed'] += 1
+        if entry.spill_path is not None:
+            remove_files([entry.spill_path])
+            entry.spill_path = None
+        entry.future = None
+        entry.profile_job = None
+
+    def report(self) -> Dict[str, Any]:
+        """登錄表摘要"""
+        with self._lock:
+            entries = list(self._entries.values())
+            return {
+                'datasets': len(entries),
+                'references': sum(entry.refs for entry in entries),
+                'total_bytes': sum(
+                    (entry.size if entry.future is not None else 0) + entry.analysis_size for entry in entries
+                ),
+                'spilled_datasets': sum(1 for entry in entries if entry.future is None and entry.spill_path),
+                **self.stats
+            }
+
+
+class DatasetLease:
+    """
+    共用數據集的引用
+
+    release() 後仍可繼續使用：下次存取時自動重新取得（必要時重新載入）。
+    物件被回收時自動釋放。
+    """
+
+    def __init__(self, registry: DatasetRegistry, dataset_hash: str, loader: Callable[[], pd.DataFrame]):
+        self.registry = registry
+        self.dataset_hash = dataset_hash
+        self.last_access = time.time()
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._finalizer = weakref.finalize(self, registry._release, dataset_hash)
+
+    @property
+    def held(self) -> bool:
+        """目前是否持有引用"""
+        return self._finalizer.alive
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """共用的 DataFrame（唯讀，請勿原地修改）"""
+        self._touch()
+        return self.registry._load(self.dataset_hash, self._loader)
+
+    def profile(self, retry_failed: bool = False) -> ProfilingJob:
+        """共用的背景分析工作（尚未開始時開始分析；retry_failed 時重新分析失敗的工作）"""
+        self._touch()
+        return self.registry._profile(self.dataset_hash, self._loader, retry_failed)
+
+    def analysis(self, timeout: float = None) -> Dict[str, Any]:
+        """等待並取得完整的分析結果"""
+        return self.profile().wait(timeout)
+
+    def release(self) -> bool:
+        """釋放引用；回傳是否確實釋放（已釋放時回傳 False）"""
+        with self._lock:
+            if not self._finalizer.alive:
+                return False
+            self._finalizer()
+            return True
+
+    def _touch(self) -> None:
+        with self._lock:
+            self.last_access = time.time()
+            if not self._finalizer.alive:
+                self.registry._add_ref(self.dataset_hash)
+                self._finalizer = weakref.finalize(self, self.registry._release, self.dataset_hash)
@@ -0,0 +1,133 @@
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, Any, Union
+
+from modules.data_analyzer import DataAnalyzer
+from modules.file_loader import read_data_file, SUPPORTED_EXTENSIONS
+from modules.figure_cache import fingerprint_bytes
+
+_DATASET_ID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+class DatasetNotFoundError(KeyError):
+    """找不到指定 ID 的數據集"""
+
+
+class DatasetStore:
+    """
+    以內容雜湊為 ID 的數據集儲存
+
+    原始檔案寫入 data_dir（多個服務實例可掛載同一個目錄共用），
+    載入後的 DataFrame 與分析結果保留在行程內的 LRU 中。
+    """
+
+    def __init__(self, data_dir: Union[str, Path], max_loaded: int = 8):
+        """
+        Args:
+            data_dir: 原始檔案存放目錄
+            max_loaded: 行程內最多保留的已載入數據集數
+        """
+        self.data_dir = Path(data_dir)
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.max_loaded = max_loaded
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, filename: str, data: bytes) -> str:
+        """
+        儲存上傳的檔案
+
+        Args:
+            filename: 原始檔名（用來判斷格式）
+            data: 檔案內容
+
+        Returns:
+            數據集 ID
+        """
+
+        extension = filename.lower().rsplit('.', 1)[-1] if '.' in filename else ''
+        if extension not in SUPPORTED_EXTENSIONS:
+            raise ValueError(f"不支援的檔案格式: {extension or filename}")
+
+        dataset_id = fingerprint_bytes(data)
+        path = self.data_dir / f'{dataset_id}.{extension}'
+        if not path.exists():
+            # 先寫入暫存檔再改名，避免其他實例讀到寫到一半的檔案
+            temp_path = path.with_name(f'{path.name}.{threading.get_ident()}.tmp')
+            temp_path.write_bytes(data)
+            temp_path.replace(path)
+
+        return dataset_id
+
+    def exists(self, dataset_id: str) -> bool:
+        """判斷數據集是否存在"""
+        return self._find_file(dataset_id) is not None
+
+    def get(self, dataset_id: str) -> Dict[str, Any]:
+        """
+        取得已載入的數據集（必要時從磁碟載入並分析；同一 ID 只會載入一次）
+
+        Returns:
+            包含 dataset_id、df、data_analysis 的字典
+
+        Raises:
+            DatasetNotFoundError: 數據集不存在
+        """
+
+        with self._lock:
+            future = self._loaded.get(dataset_id)
+            owner = future is None
+            if owner:
+                path = self._find_file(dataset_id)
+                if path is None:
+                    raise DatasetNotFoundError(dataset_id)
+                future = Future()
+                self._loaded[dataset_id] = future
+                while len(self._loaded) > self.max_loaded:
+                    self._loaded.popitem(last=False)
+            else:
+                self._loaded.move_to_end(dataset_id)
+
+        if owner:
+            try:
+                df, _ = read_data_file(path)
+                data_analysis = DataAnalyzer(df).analyze_data()
+                future.set_result({
+                    'dataset_id': dataset_id,
+                    'df': df,
+                    'data_analysis': data_analysis
+                })
+            except Exception as e:
+                with self._lock:
+                    if self._loaded.get(dataset_id) is future:
+                        del self._loaded[dataset_id]
+                future.set_exception(e)
+
+        return future.result()
+
+    def stats(self) -> Dict[str, Any]:
+        """取得儲存統計"""
+        with self._lock:
+            loaded = len(self._loaded)
+        return {
+            'loaded': loaded,
+            'max_loaded': self.max_loaded,
+            'stored': sum(1 for path in self.data_dir.iterdir() if not path.name.endswith('.tmp'))
+        }
+
+    def source_path(self, dataset_id: str):
+        """數據集原始檔案的路徑（不存在時回傳 None）"""
+        return self._find_file(dataset_id)
+
+    def _find_file(self, dataset_id: str):
+        """依 ID 尋找原始檔案（ID 必須是 sha256 十六進位字串）"""
+        if not _DATASET_ID_PATTERN.match(dataset_id or ''):
+            return None
+        for extension in SUPPORTED_EXTENSIONS:
+            path = self.data_dir / f'{dataset_id}.{extension}'
+            if path.exists():
+                return path
+        return None
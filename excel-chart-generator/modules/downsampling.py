@@ -0,0 +1,284 @@
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+from typing import Dict, Any, Union
+
+# 瀏覽器端能流暢顯示的點數上限
+MAX_LINE_POINTS = 5000
+MAX_SCATTER_POINTS = 20000
+DEFAULT_DENSITY_BINS = 200
+MAX_HISTOGRAM_BINS = 200
+
+
+def _to_float_array(series: pd.Series) -> np.ndarray:
+    """將數值或日期欄位轉為 float 陣列（供距離與面積計算）"""
+
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.to_numpy(dtype='datetime64[ns]').astype(np.int64).astype(np.float64)
+
+    values = pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64)
+    return np.nan_to_num(values)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets 降採樣
+
+    Args:
+        x: 已排序的 x 值
+        y: 對應的 y 值
+        n_out: 輸出點數
+
+    Returns:
+        保留的資料列索引
+    """
+
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # 第一點和最後一點固定保留，中間分成 n_out - 2 個桶
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        start = edges[i]
+        end = max(edges[i + 1], start + 1)
+
+        # 下一個桶的平均點
+        next_start = edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        if next_end <= next_start:
+            next_end = next_start + 1
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        # 選擇與前一個點、下一桶平均點構成最大三角形的點
+        bucket_x = x[start:end]
+        bucket_y = y[start:end]
+        area = np.abs(
+            (x[a] - avg_x) * (bucket_y - y[a])
+            - (x[a] - bucket_x) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+
+    return indices
+
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Min/Max 分桶降採樣（保留每個桶的最小值與最大值，適合尖峰明顯的數據）
+
+    Args:
+        y: y 值
+        n_out: 輸出點數上限
+
+    Returns:
+        保留的資料列索引
+    """
+
+    n = len(y)
+    # 首尾兩點固定保留，其餘每桶保留兩點
+    n_buckets = (n_out - 2) // 2
+    if n <= n_out or n_buckets < 1:
+        return np.arange(n)
+
+    edges = np.linspace(0, n, n_buckets + 1).astype(np.int64)
+    indices = [0, n - 1]
+
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end <= start:
+            continue
+        segment = y[start:end]
+        indices.append(start + int(np.argmin(segment)))
+        indices.append(start + int(np.argmax(segment)))
+
+    return np.unique(indices)
+
+
+def downsample_line(df: pd.DataFrame, x: str, y: str, max_points: int = MAX_LINE_POINTS,
+                    method: str = 'lttb') -> pd.DataFrame:
+    """
+    降採樣折線圖數據
+
+    Args:
+        df: 數據
+        x: x 軸欄位（通常為日期）
+        y: y 軸數值欄位
+        max_points: 最大點數
+        method: 'lttb' 或 'minmax'
+
+    Returns:
+        依 x 排序且不超過 max_points 行的 DataFrame
+    """
+
+    data = df[[x, y]].dropna()
+    if not data[x].is_monotonic_increasing:
+        data = data.sort_values(x)
+
+    if len(data) <= max_points:
+        return data
+
+    y_values = _to_float_array(data[y])
+
+    if method == 'minmax':
+        indices = minmax_indices(y_values, max_points)
+    else:
+        indices = lttb_indices(_to_float_array(data[x]), y_values, max_points)
+
+    return data.iloc[indices]
+
+
+def scatter_bins(df: pd.DataFrame, x: str, y: str, bins: int = DEFAULT_DENSITY_BINS) -> pd.DataFrame:
+    """
+    將散點數據做 2D 分箱
+
+    Returns:
+        非空格子的 x 中心、y 中心與點數
+    """
+
+    data = df[[x, y]].dropna()
+    x_values = _to_float_array(data[x])
+    y_values = _to_float_array(data[y])
+
+    counts, x_edges, y_edges = np.histogram2d(x_values, y_values, bins=bins)
+    x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+    y_centers = (y_edges[:-1] + y_edges[1:]) / 2
+
+    x_idx, y_idx = np.nonzero(counts)
+    return pd.DataFrame({
+        x: x_centers[x_idx],
+        y: y_centers[y_idx],
+        'count': counts[x_idx, y_idx].astype(np.int64)
+    })
+
+
+def density_scatter(df: pd.DataFrame, x: str, y: str, max_points: int = MAX_SCATTER_POINTS,
+                    bins: int = DEFAULT_DENSITY_BINS, title: str = None) -> go.Figure:
+    """
+    建立散點圖；點數超過 max_points 時改為 2D 密度熱圖
+
+    Returns:
+        Plotly 圖表
+    """
+
+    data = df[[x, y]].dropna()
+    if title is None:
+        title = f'{x} vs {y}'
+
+    if len(data) <= max_points:
+        return px.scatter(data, x=x, y=y, title=title)
+
+    x_values = _to_float_array(data[x])
+    y_values = _to_float_array(data[y])
+    counts, x_edges, y_edges = np.histogram2d(x_values, y_values, bins=bins)
+
+    # 空格子設為 NaN，讓背景保持透明
+    z = counts.T
+    z[z == 0] = np.nan
+
+    fig = go.Figure(go.Heatmap(
+        x=(x_edges[:-1] + x_edges[1:]) / 2,
+        y=(y_edges[:-1] + y_edges[1:]) / 2,
+        z=z,
+        colorscale='Viridis',
+        colorbar={'title': 'count'}
+    ))
+    fig.update_layout(
+        title=f'{title} (density of {len(data):,} points)',
+        xaxis_title=x,
+        yaxis_title=y
+    )
+    return fig
+
+
+def _capped_bin_count(values: np.ndarray, bins: Union[int, str]) -> int:
+    """
+    在建立分箱邊界之前先決定分箱數（不超過 MAX_HISTOGRAM_BINS）
+
+    'auto' 與 'fd' 以 IQR 估計寬度，極端離群值會讓 NumPy 產生上億個分箱，
+    因此自行計算分箱數後再套用上限。
+    """
+
+    if not isinstance(bins, str):
+        return max(1, min(int(bins), MAX_HISTOGRAM_BINS))
+
+    data_range = float(values.max() - values.min())
+    if data_range == 0:
+        return 1
+
+    if bins in ('auto', 'fd'):
+        q75, q25 = np.percentile(values, [75, 25])
+        fd_width = 2.0 * (q75 - q25) * len(values) ** (-1 / 3)
+        fd_count = min(np.ceil(data_range / fd_width), MAX_HISTOGRAM_BINS) if fd_width > 0 else 0
+        sturges_count = np.ceil(np.log2(len(values)) + 1)
+        count = (fd_count or sturges_count) if bins == 'fd' else max(fd_count, sturges_count)
+    else:
+        # 其他估計方式的分箱數只與數據量有關
+        count = len(np.histogram_bin_edges(values, bins=bins)) - 1
+
+    return max(1, min(int(count), MAX_HISTOGRAM_BINS))
+
+
+def histogram_bins(series: pd.Series, bins: Union[int, str] = 'auto') -> pd.DataFrame:
+    """
+    以 NumPy 預先計算直方圖分箱（忽略 NaN 與 ±inf，分箱數不超過 MAX_HISTOGRAM_BINS）
+
+    Returns:
+        包含 bin_start、bin_end、bin_center、count 的 DataFrame
+    """
+
+    values = pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64)
+    values = values[np.isfinite(values)]
+
+    if len(values):
+        edges = np.histogram_bin_edges(values, bins=_capped_bin_count(values, bins))
+    else:
+        edges = np.array([0.0, 1.0])
+
+    counts, edges = np.histogram(values, bins=edges)
+
+    return pd.DataFrame({
+        'bin_start': edges[:-1],
+        'bin_end': edges[1:],
+        'bin_center': (edges[:-1] + edges[1:]) / 2,
+        'count': counts
+    })
+
+
+def binned_histogram(df: pd.DataFrame, x: str, bins: Union[int, str] = 'auto', title: str = None) -> go.Figure:
+    """
+    建立預先分箱的直方圖（只傳送分箱結果到瀏覽器）
+
+    Returns:
+        Plotly 圖表
+    """
+
+    hist = histogram_bins(df[x], bins=bins)
+    if title is None:
+        title = f'{x} distribution'
+
+    fig = go.Figure(go.Bar(
+        x=hist['bin_center'],
+        y=hist['count'],
+        width=(hist['bin_end'] - hist['bin_start']),
+        name=x
+    ))
+    fig.update_layout(title=title, xaxis_title=x, yaxis_title='count', bargap=0)
+    return fig
+
+
+def get_downsampling_helpers() -> Dict[str, Any]:
+    """取得要注入到生成代碼執行環境的降採樣輔助函數"""
+    return {
+        'downsample_line': downsample_line,
+        'density_scatter': density_scatter,
+        'scatter_bins': scatter_bins,
+        'histogram_bins': histogram_bins,
+        'binned_histogram': binned_histogram
+    }
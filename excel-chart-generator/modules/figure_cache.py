@@ -0,0 +1,204 @@
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+import pandas as pd
+import matplotlib.pyplot as plt
+import plotly.io as pio
+import streamlit as st
+
+from modules.figure_optimizer import optimize_figure, figure_from_json
+from modules.intent_router import canonical_intent
+from modules.tracing import span
+
+
+def fingerprint_bytes(data) -> str:
+    """以檔案內容計算數據集雜湊"""
+    return hashlib.sha256(bytes(data)).hexdigest()
+
+
+def fingerprint_dataframe(df: pd.DataFrame) -> str:
+    """以 DataFrame 內容計算數據集雜湊（沒有原始檔案時使用）"""
+    hasher = hashlib.sha256()
+    hasher.update(str(list(df.columns)).encode('utf-8'))
+    hasher.update(str(list(df.dtypes.astype(str))).encode('utf-8'))
+    hasher.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return hasher.hexdigest()
+
+
+def code_fingerprint(code: str) -> str:
+    """計算代碼雜湊（忽略前後空白）"""
+    return hashlib.sha256(code.strip().encode('utf-8')).hexdigest()
+
+
+def normalize_query(query: str) -> str:
+    """正規化查詢文字，讓僅有空白或大小寫差異的查詢視為相同"""
+    return ' '.join(query.lower().split())
+
+
+class FigureCapture:
+    """包裝 streamlit 模組，在顯示圖表的同時記錄產生的圖表"""
+
+    def __init__(self, st_module, render_manager=None):
+        self._st = st_module
+        self._render_manager = render_manager
+        self.figures = []
+        self.payload_reports = []
+
+    def plotly_chart(self, figure_or_data, *args, **kwargs):
+        # 傳送前先壓縮圖表（WebGL、二進位陣列）
+        with span('plotly.serialize') as serialize_span:
+            fig, report = optimize_figure(figure_or_data)
+            figure_json = pio.to_json(fig, validate=False)
+            serialize_span.set_attributes(
+                traces=len(fig.data), before_bytes=report['before_bytes'], after_bytes=report['after_bytes']
+            )
+        self.payload_reports.append(report)
+        self.figures.append({'type': 'plotly', 'json': figure_json})
+        with span('plotly.render'):
+            return self._st.plotly_chart(fig, *args, **kwargs)
+
+    def pyplot(self, fig=None, *args, **kwargs):
+        # st.pyplot 預設會清除圖表，必須在轉交前先存成 PNG
+        target = fig if fig is not None else plt.gcf()
+        if self._render_manager is not None:
+            self._render_manager.prepare_figure(target)
+            kwargs['dpi'] = self._render_manager.clamp_dpi(kwargs.get('dpi'))
+
+        with span('matplotlib.savefig') as savefig_span:
+            buffer = io.BytesIO()
+            target.savefig(buffer, format='png', bbox_inches='tight', dpi=kwargs.get('dpi', 'figure'))
+            savefig_span.set_attribute('png_bytes', buffer.tell())
+        self.figures.append({'type': 'png', 'data': buffer.getvalue()})
+        with span('matplotlib.render'):
+            return self._st.pyplot(fig, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._st, name)
+
+
+class FigureCache:
+    """以 (數據集雜湊, 代碼雜湊) 為鍵的圖表快取，附帶查詢到代碼的索引"""
+
+    def __init__(self, max_entries: int = 200, max_bytes: int = 200 * 1024 * 1024):
+        """初始化圖表快取"""
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._queries = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(dataset_hash: str, code: str) -> str:
+        """建立快取鍵"""
+        return f'{dataset_hash}:{code_fingerprint(code)}'
+
+    @staticmethod
+    def make_intent_key(dataset_hash: str, intent: Dict[str, Any]) -> str:
+        """
+        建立內建圖表的快取鍵
+
+        內建圖表不是執行 intent['code'] 產生的（可能來自聚合立方體），
+        使用獨立的命名空間，避免與執行相同代碼的結果共用快取。
+        """
+        return FigureCache.make_key(dataset_hash, 'intent:' + canonical_intent(intent))
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """讀取快取的圖表"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry['figures']
+
+    def put(self, key: str, figures: List[Dict[str, Any]], code: str = None) -> None:
+        """寫入圖表；超過數量或容量上限時淘汰最久未使用的項目"""
+
+        if not figures:
+            return
+
+        size = sum(self._figure_size(figure) for figure in figures)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            queries = set()
+            if key in self._entries:
+                previous = self._entries.pop(key)
+                self._total_bytes -= previous['size']
+                queries = previous['queries']
+
+            self._entries[key] = {'figures': figures, 'code': code, 'size': size, 'queries': queries}
+            self._total_bytes += size
+
+            while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+                evicted_key, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= evicted['size']
+                # 一併移除指向被淘汰項目的查詢，避免查詢索引無限成長
+                for query_key in evicted['queries']:
+                    if self._queries.get(query_key) == evicted_key:
+                        del self._queries[query_key]
+
+    def remember_query(self, dataset_hash: str, query: str, key: str) -> None:
+        """記錄查詢對應的快取鍵，讓相同的查詢直接重播（快取中沒有該鍵時不記錄）"""
+        query_key = (dataset_hash, normalize_query(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            previous = self._queries.get(query_key)
+            if previous is not None and previous != key and previous in self._entries:
+                self._entries[previous]['queries'].discard(query_key)
+            self._queries[query_key] = key
+            entry['queries'].add(query_key)
+
+    def lookup_query(self, dataset_hash: str, query: str) -> Optional[Tuple[str, str]]:
+        """
+        尋找相同數據集上相同查詢的結果
+
+        Returns:
+            (快取鍵, 代碼)；找不到或已被淘汰時回傳 None
+        """
+        with self._lock:
+            key = self._queries.get((dataset_hash, normalize_query(query)))
+            entry = self._entries.get(key) if key else None
+            if entry is None:
+                return None
+            return key, entry['code']
+
+    def stats(self) -> Dict[str, Any]:
+        """取得快取統計"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'queries': len(self._queries),
+                'bytes': self._total_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    def _figure_size(self, figure: Dict[str, Any]) -> int:
+        """估計單一圖表佔用的位元組數"""
+        if figure['type'] == 'plotly':
+            return len(figure['json'])
+        return len(figure['data'])
+
+
+def render_cached_figures(figures: List[Dict[str, Any]], key_prefix: str = None) -> None:
+    """直接從快取顯示圖表，不重新執行代碼"""
+
+    for i, figure in enumerate(figures):
+        if figure['type'] == 'plotly':
+            fig = figure_from_json(figure['json'])
+            kwargs = {'key': f'{key_prefix}_{i}'} if key_prefix else {}
+            st.plotly_chart(fig, use_container_width=True, **kwargs)
+        else:
+            st.image(figure['data'], use_container_width=True)
@@ -0,0 +1,306 @@
+import base64
+import json
+from typing import Dict, Any, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.basedatatypes import BaseFigure
+from plotly.utils import PlotlyJSONEncoder
+
+# 超過此點數的 scatter 改用 WebGL 繪製
+WEBGL_POINT_THRESHOLD = 5000
+# 超過此長度的數值陣列改用二進位編碼
+BINARY_MIN_LENGTH = 500
+# float32 的誤差小於數值範圍的此比例時才降為 float32
+FLOAT32_TOLERANCE = 1e-5
+
+# 可安全改為常數的逐點屬性
+PER_POINT_STYLE_KEYS = ('color', 'size', 'opacity', 'symbol')
+
+# Scattergl 不支援的 scatter 屬性
+_WEBGL_UNSUPPORTED_KEYS = ('cliponaxis', 'stackgroup', 'stackgaps', 'groupnorm', 'orientation')
+
+_INT_DTYPES = [
+    ('i1', np.int8), ('u1', np.uint8), ('i2', np.int16),
+    ('u2', np.uint16), ('i4', np.int32), ('u4', np.uint32)
+]
+
+
+def encode_typed_array(values: np.ndarray):
+    """
+    將數值陣列編碼為 plotly.js 的 typed array 格式 {'dtype', 'bdata', 'shape'}
+
+    Returns:
+        編碼後的字典；無法安全編碼時回傳原陣列
+    """
+
+    array = np.asarray(values)
+    if array.dtype.kind not in 'iufb' or array.size == 0:
+        return values
+
+    if array.dtype.kind == 'b':
+        array = array.astype(np.uint8)
+
+    if array.dtype.kind in 'iu':
+        lo, hi = array.min(), array.max()
+        for code, dtype in _INT_DTYPES:
+            info = np.iinfo(dtype)
+            if info.min <= lo and hi <= info.max:
+                encoded, dtype_code = array.astype(dtype), code
+                break
+        else:
+            encoded, dtype_code = array.astype(np.float64), 'f8'
+    else:
+        finite = array[np.isfinite(array)]
+        encoded, dtype_code = array.astype(np.float64), 'f8'
+        if finite.size:
+            as_float32 = finite.astype(np.float32)
+            span = float(finite.max() - finite.min()) or max(abs(float(finite.max())), 1.0)
+            error = float(np.max(np.abs(as_float32.astype(np.float64) - finite)))
+            if error <= span * FLOAT32_TOLERANCE:
+                encoded, dtype_code = array.astype(np.float32), 'f4'
+
+    result = {
+        'dtype': dtype_code,
+        'bdata': base64.b64encode(np.ascontiguousarray(encoded).tobytes()).decode('ascii')
+    }
+    if encoded.ndim > 1:
+        result['shape'] = ','.join(str(dim) for dim in encoded.shape)
+    return result
+
+
+def decode_typed_array(spec: Dict[str, Any]) -> np.ndarray:
+    """將 typed array 格式還原為 numpy 陣列"""
+
+    array = np.frombuffer(base64.b64decode(spec['bdata']), dtype=np.dtype(spec['dtype']))
+    if spec.get('shape'):
+        array = array.reshape([int(dim) for dim in str(spec['shape']).split(',')])
+    return array
+
+
+def _is_typed_array_spec(value) -> bool:
+    return isinstance(value, dict) and 'bdata' in value and 'dtype' in value
+
+
+def _encode_arrays(obj):
+    """遞迴將長數值陣列轉為 typed array"""
+
+    if isinstance(obj, dict):
+        return {key: _encode_arrays(value) for key, value in obj.items()}
+
+    if isinstance(obj, np.ndarray) or (isinstance(obj, (list, tuple)) and obj
+                                       and isinstance(obj[0], (int, float, list, tuple, np.number))):
+        try:
+            array = np.asarray(obj)
+        except ValueError:
+            array = None
+        if array is not None and array.dtype.kind in 'iufb' and array.size >= BINARY_MIN_LENGTH:
+            return encode_typed_array(array)
+
+    if isinstance(obj, (list, tuple)):
+        return [_encode_arrays(value) for value in obj]
+
+    return obj
+
+
+def _decode_arrays(obj):
+    """遞迴將 typed array 還原為 numpy 陣列"""
+
+    if _is_typed_array_spec(obj):
+        return decode_typed_array(obj)
+    if isinstance(obj, dict):
+        return {key: _decode_arrays(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [_decode_arrays(value) for value in obj]
+    return obj
+
+
+class CompactFigure(go.Figure):
+    """序列化時以二進位編碼數值陣列的 Figure（st.plotly_chart 與 write_html 都會使用 to_dict）"""
+
+    def to_dict(self):
+        return _encode_arrays(super().to_dict())
+
+    def to_plotly_json(self):
+        return self.to_dict()
+
+
+def figure_from_json(figure_json: str) -> CompactFigure:
+    """從（可能含 typed array 的）JSON 還原圖表"""
+    return CompactFigure(_decode_arrays(json.loads(figure_json)))
+
+
+def _array_length(value) -> int:
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return len(value)
+    return 0
+
+
+def _trace_points(trace: Dict[str, Any]) -> int:
+    return max(_array_length(trace.get('x')), _array_length(trace.get('y')))
+
+
+def _estimate_json_size(fig_dict: Dict[str, Any]) -> int:
+    """估計一般 JSON 序列化的大小（對長陣列取樣估計，避免完整序列化）"""
+
+    def estimate(obj) -> int:
+        if isinstance(obj, dict):
+            return sum(len(str(key)) + 4 + estimate(value) for key, value in obj.items()) + 2
+        if isinstance(obj, (list, tuple, np.ndarray)):
+            length = len(obj)
+            if length == 0:
+                return 2
+            # 巢狀結構（例如 data 清單）逐一估計
+            if not isinstance(obj, np.ndarray) and isinstance(obj[0], (dict, list, tuple)):
+                return sum(estimate(value) for value in obj) + length + 1
+            sample = obj[:1000] if isinstance(obj, np.ndarray) else list(obj[:1000])
+            return int(len(json.dumps(sample, cls=PlotlyJSONEncoder)) * length / len(sample))
+        return len(json.dumps(obj, cls=PlotlyJSONEncoder))
+
+    return estimate(fig_dict)
+
+
+def _strip_redundant(trace: Dict[str, Any]) -> int:
+    """移除重複或常數的逐點屬性，回傳移除數量"""
+
+    stripped = 0
+
+    # 常數的 marker 屬性改為單一值
+    marker = trace.get('marker')
+    if isinstance(marker, dict):
+        for key in PER_POINT_STYLE_KEYS:
+            values = marker.get(key)
+            if _array_length(values) > 1:
+                array = np.asarray(values)
+                if array.dtype.kind != 'O' and (array == array[0]).all():
+                    marker[key] = array[0].item()
+                    stripped += 1
+
+    # 與 x / y 相同或整個常數的 text、hovertext、customdata
+    for key in ('text', 'hovertext', 'customdata'):
+        values = trace.get(key)
+        if _array_length(values) <= 1:
+            continue
+        array = np.asarray(values)
+        for axis in ('x', 'y'):
+            other = trace.get(axis)
+            if _array_length(other) == len(array) and array.shape == np.asarray(other).shape \
+                    and (array == np.asarray(other)).all():
+                trace.pop(key)
+                stripped += 1
+                break
+        else:
+            if key != 'customdata' and array.dtype.kind != 'O' and array.ndim == 1 and (array == array[0]).all():
+                trace[key] = array[0].item()
+                stripped += 1
+
+    return stripped
+
+
+def _compact_datetimes(trace: Dict[str, Any]) -> None:
+    """將 datetime 物件陣列轉為 ISO 字串陣列（避免逐一深拷貝與逐一 JSON 編碼 datetime 物件）"""
+
+    for axis in ('x', 'y', 'base'):
+        values = trace.get(axis)
+        if not isinstance(values, np.ndarray) or values.dtype.kind != 'O' or len(values) < BINARY_MIN_LENGTH:
+            continue
+        if not isinstance(values[0], (pd.Timestamp, np.datetime64)) and not hasattr(values[0], 'isoformat'):
+            continue
+
+        try:
+            index = pd.DatetimeIndex(values)
+        except (TypeError, ValueError):
+            continue
+        if index.tz is not None:
+            continue
+
+        unit = 's' if (index.asi8 % 10**9 == 0).all() else 'ms'
+        trace[axis] = np.datetime_as_string(index.values, unit=unit).astype(object)
+
+
+def _to_webgl(trace: Dict[str, Any]) -> Dict[str, Any]:
+    """將 scatter trace 轉為 scattergl"""
+
+    trace = dict(trace)
+    trace['type'] = 'scattergl'
+    for key in _WEBGL_UNSUPPORTED_KEYS:
+        trace.pop(key, None)
+
+    line = trace.get('line')
+    if isinstance(line, dict) and line.get('shape') not in (None, 'linear', 'hv', 'vh', 'hvh', 'vhv'):
+        trace['line'] = {**line, 'shape': 'linear'}
+
+    return trace
+
+
+def optimize_figure(figure_or_data: Union[BaseFigure, Dict[str, Any]],
+                    webgl_threshold: int = WEBGL_POINT_THRESHOLD) -> Tuple[CompactFigure, Dict[str, Any]]:
+    """
+    最佳化要傳送到瀏覽器的 Plotly 圖表
+
+    Args:
+        figure_or_data: Plotly Figure 或圖表字典
+        webgl_threshold: 改用 WebGL 的點數門檻
+
+    Returns:
+        (最佳化後的圖表, 傳輸大小報告)
+    """
+
+    if isinstance(figure_or_data, BaseFigure):
+        fig_dict = figure_or_data.to_dict()
+    else:
+        fig_dict = go.Figure(figure_or_data).to_dict()
+
+    before_bytes = _estimate_json_size(fig_dict)
+
+    webgl_traces = 0
+    stripped_fields = 0
+    traces = []
+
+    for trace in fig_dict.get('data', []):
+        _compact_datetimes(trace)
+        stripped_fields += _strip_redundant(trace)
+
+        # 堆疊區域圖不能改用 WebGL
+        if trace.get('type', 'scatter') == 'scatter' and not trace.get('stackgroup') \
+                and _trace_points(trace) > webgl_threshold:
+            trace = _to_webgl(trace)
+            webgl_traces += 1
+
+        traces.append(trace)
+
+    fig_dict['data'] = traces
+    compact = CompactFigure(fig_dict, skip_invalid=True)
+
+    compact_dict = _encode_arrays(fig_dict)
+    after_bytes = len(json.dumps(compact_dict, cls=PlotlyJSONEncoder))
+    binary_arrays = _count_typed_arrays(compact_dict)
+
+    report = {
+        'before_bytes': before_bytes,
+        'after_bytes': after_bytes,
+        'webgl_traces': webgl_traces,
+        'binary_arrays': binary_arrays,
+        'stripped_fields': stripped_fields
+    }
+
+    return compact, report
+
+
+def _count_typed_arrays(obj) -> int:
+    if _is_typed_array_spec(obj):
+        return 1
+    if isinstance(obj, dict):
+        return sum(_count_typed_arrays(value) for value in obj.values())
+    if isinstance(obj, list):
+        return sum(_count_typed_arrays(value) for value in obj)
+    return 0
+
+
+def format_bytes(size: int) -> str:
+    """將位元組數格式化為易讀字串"""
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f'{size:.1f} {unit}' if unit != 'B' else f'{size} B'
+        size /= 1024
@@ -0,0 +1,84 @@
+import warnings
+
+import pandas as pd
+from pathlib import Path
+from typing import Tuple, Optional, Union
+
+# 依序嘗試的 CSV 編碼
+CSV_ENCODINGS = ['utf-8', 'gbk', 'big5', 'cp1252', 'iso-8859-1']
+SUPPORTED_EXTENSIONS = ('xlsx', 'csv')
+
+# 中文日期，例如 2020年1月5日
+_CJK_DATE = r'^\s*(\d{4})\s*年\s*(\d{1,2})\s*月\s*(\d{1,2})\s*日'
+
+
+def read_data_file(file_path: Union[str, Path]) -> Tuple[pd.DataFrame, Optional[str]]:
+    """
+    讀取 Excel 或 CSV 檔案
+
+    Args:
+        file_path: 檔案路徑
+
+    Returns:
+        (DataFrame, 使用的 CSV 編碼；Excel 檔案為 None)
+    """
+
+    file_path = Path(file_path)
+    file_extension = file_path.name.lower().split('.')[-1]
+    encoding_used = None
+
+    if file_extension == 'xlsx':
+        df = pd.read_excel(file_path)
+    elif file_extension == 'csv':
+        # 嘗試不同的編碼格式
+        df = None
+
+        for encoding in CSV_ENCODINGS:
+            try:
+                df = pd.read_csv(file_path, encoding=encoding)
+                encoding_used = encoding
+                break
+            except UnicodeDecodeError:
+                continue
+
+        if df is None:
+            raise ValueError("無法使用常見編碼格式讀取 CSV 檔案")
+
+    else:
+        raise ValueError(f"不支援的檔案格式: {file_extension}")
+
+    # 清理欄位名稱（移除前後空白）
+    df.columns = df.columns.str.strip()
+
+    return df, encoding_used
+
+
+def parse_dates(values: pd.Series) -> pd.Series:
+    """
+    將日期欄位轉為 datetime（同一欄可以混用多種格式，無法解析的值為 NaT）
+
+    先以第一個值推斷的格式一次解析整欄，不符合該格式的值再以 format='mixed' 逐一解析，
+    避免整欄逐一解析的成本，也不會把其他格式的日期當成缺失值。
+
+    Args:
+        values: 日期欄位
+
+    Returns:
+        與 values 同索引的 datetime Series
+    """
+
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+
+    with warnings.catch_warnings():
+        # 無法推斷格式時 pandas 會警告並改為逐一解析，結果相同
+        warnings.simplefilter('ignore', UserWarning)
+        parsed = pd.to_datetime(values, errors='coerce')
+
+    missing = parsed.isna() & values.notna()
+    if missing.any():
+        retry = values[missing]
+        if retry.dtype == object:
+            retry = retry.astype(str).str.replace(_CJK_DATE, r'\1-\2-\3', regex=True)
+        parsed[missing] = pd.to_datetime(retry, format='mixed', errors='coerce')
+    return parsed
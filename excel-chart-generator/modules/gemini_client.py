@@ -1,11 +1,54 @@
+import asyncio
 import os
+import threading
 import google.generativeai as genai
-from typing import Dict, Any
+from typing import Dict, Any, List
 import time
 
+from modules.tracing import span, get_tracer
+
+# 模型層級（由便宜、快速到強）；簡單的查詢從第一層開始，其餘從第二層開始。
+# 只有效能問題或執行失敗後的重新生成會升一層；未通過安全檢查的代碼直接拒絕、不重新生成也不升級
+# （把被擋下的寫法回饋給模型等於教它繞過黑名單）
+DEFAULT_MODEL_TIERS = ('gemini-2.5-flash-lite', 'gemini-2.5-flash', 'gemini-2.5-pro')
+
+# 失敗後重試前的等待時間（秒）
+RETRY_DELAY_SECONDS = 1
+
+# 提示詞與查詢都在此長度以內、且沒有複雜關鍵字時視為簡單查詢
+DEFAULT_SIMPLE_PROMPT_CHARS = 4000
+SIMPLE_QUERY_CHARS = 40
+
+# 出現這些詞時視為複雜查詢（多圖、分組比較、統計模型等）
+COMPLEX_QUERY_KEYWORDS = (
+    '比較', '分組', '子圖', '多個', '回歸', '預測', '趨勢線', '相關', '堆疊', '雙軸', '分面', '並且', '以及',
+    'compare', 'subplot', 'facet', 'regression', 'forecast', 'trendline', 'correlation', 'stacked', ' and ',
+)
+
+
+def _usage(response) -> Dict[str, int]:
+    """回應的 token 用量（SDK 沒有提供時為 0）"""
+    metadata = getattr(response, 'usage_metadata', None)
+    prompt_tokens = getattr(metadata, 'prompt_token_count', 0) or 0
+    response_tokens = getattr(metadata, 'candidates_token_count', 0) or 0
+    return {
+        'prompt_tokens': prompt_tokens,
+        'response_tokens': response_tokens,
+        'total_tokens': getattr(metadata, 'total_token_count', 0) or prompt_tokens + response_tokens
+    }
+
+
 class GeminiClient:
-    def __init__(self, api_key: str = None):
-        """初始化 Gemini 客戶端"""
+    def __init__(self, api_key: str = None, model_tiers: List[str] = None,
+                 simple_prompt_chars: int = None):
+        """
+        初始化 Gemini 客戶端
+
+        Args:
+            api_key: Gemini API Key（未提供時讀取 GEMINI_API_KEY）
+            model_tiers: 由便宜到強的模型名稱（未提供時讀取 GEMINI_MODEL_TIERS，以逗號分隔）
+            simple_prompt_chars: 簡單查詢的提示詞長度上限（未提供時讀取 GEMINI_SIMPLE_PROMPT_CHARS）
+        """
         if api_key is None:
             api_key = os.getenv('GEMINI_API_KEY')
         
@@ -13,52 +56,217 @@ class GeminiClient:
             raise ValueError("請提供 Gemini API Key")
         
         genai.configure(api_key=api_key)
-        # 使用 Gemini 2.5 Flash 模型
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
-    
-    def generate_chart_code(self, user_query: str, data_info: Dict[str, Any], available_modules: Dict[str, Any] = None, max_retries: int = 3) -> Dict[str, Any]:
+
+        if model_tiers is None:
+            model_tiers = [name.strip() for name in os.getenv('GEMINI_MODEL_TIERS', '').split(',') if name.strip()]
+        self.model_tiers = list(model_tiers) or list(DEFAULT_MODEL_TIERS)
+        if simple_prompt_chars is None:
+            simple_prompt_chars = int(os.getenv('GEMINI_SIMPLE_PROMPT_CHARS', DEFAULT_SIMPLE_PROMPT_CHARS))
+        self.simple_prompt_chars = simple_prompt_chars
+
+        self._models = {name: genai.GenerativeModel(name) for name in self.model_tiers}
+        # 非簡單查詢使用的預設模型
+        self.model = self._models[self.model_tiers[min(1, len(self.model_tiers) - 1)]]
+
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, Any]] = {}
+
+    def select_tier(self, user_query: str, prompt: str, escalate: int = 0) -> int:
+        """
+        選擇模型層級
+
+        Args:
+            user_query: 用戶查詢
+            prompt: 完整的提示詞
+            escalate: 往上升的層數（上一次代碼有效能問題或執行失敗時為 1；
+                      未通過安全檢查不會重新生成，因此不會因此升級）
+
+        Returns:
+            model_tiers 的索引
+        """
+
+        query = user_query.lower()
+        simple = (
+            len(prompt) <= self.simple_prompt_chars
+            and len(user_query) <= SIMPLE_QUERY_CHARS
+            and not any(keyword in query for keyword in COMPLEX_QUERY_KEYWORDS)
+        )
+        base = 0 if simple else 1
+        return max(0, min(base + escalate, len(self.model_tiers) - 1))
+
+    def generate_chart_code(self, user_query: str, data_info: Dict[str, Any], available_modules: Dict[str, Any] = None, max_retries: int = 3, performance_hint: str = None, error_feedback: Dict[str, str] = None) -> Dict[str, Any]:
         """
         生成圖表代碼
         
+        簡單的查詢使用最便宜的模型；附上 performance_hint 或 error_feedback
+        （上一次的代碼有效能問題或執行失敗）時改用高一層的模型。
+        
         Args:
             user_query: 用戶查詢
             data_info: 數據資訊
             available_modules: 可用模組字典
             max_retries: 最大重試次數
+            performance_hint: 上一次代碼的效能問題提示（重新生成時使用）
+            error_feedback: 上一次代碼與執行錯誤 {'code', 'error'}（本地修正失敗後重新生成時使用）
             
         Returns:
-            包含生成的代碼和相關資訊的字典
+            包含生成的代碼和相關資訊的字典；成功與失敗都包含 model、tier、attempts、seconds、usage（token 用量）
         """
         
-        prompt = self._create_prompt(user_query, data_info, available_modules)
+        started = time.perf_counter()
+        with span('gemini.generate', query_chars=len(user_query), max_retries=max_retries) as generate_span:
+            request = self._prepare(user_query, data_info, available_modules, performance_hint, error_feedback,
+                                    generate_span, started)
+            
+            for attempt in range(1, max_retries + 1):
+                generate_span.set_attribute('attempts', attempt)
+                get_tracer().increment('gemini_attempts')
+                try:
+                    with span('gemini.attempt', attempt=attempt) as attempt_span:
+                        response = self._models[request['model']].generate_content(request['prompt'])
+                        self._add_usage(request, response, attempt_span)
+                    return self._success(request, response, attempt)
+                    
+                except Exception as e:
+                    get_tracer().increment('gemini_failed_attempts', error_type=type(e).__name__)
+                    if attempt == max_retries:
+                        generate_span.set_attribute('outcome', 'failed')
+                        return self._failure(request, str(e), attempt)
+                    # 短暫等待後重試
+                    with span('gemini.retry_wait'):
+                        time.sleep(RETRY_DELAY_SECONDS)
         
-        for attempt in range(max_retries):
+        return {'success': False, 'error': '未知錯誤'}
+
+    async def generate_chart_code_async(self, user_query: str, data_info: Dict[str, Any], available_modules: Dict[str, Any] = None, max_retries: int = 3, performance_hint: str = None, error_feedback: Dict[str, str] = None) -> Dict[str, Any]:
+        """
+        generate_chart_code 的 asyncio 版本（參數與回傳值相同）
+
+        被取消時（asyncio.CancelledError）進行中的 API 呼叫與等待中的重試都會停止，
+        已使用的 token 以 cancelled 記錄後再拋出例外。
+        """
+
+        started = time.perf_counter()
+        with span('gemini.generate', query_chars=len(user_query), max_retries=max_retries) as generate_span:
+            request = self._prepare(user_query, data_info, available_modules, performance_hint, error_feedback,
+                                    generate_span, started)
+
+            attempt = 0
             try:
-                response = self.model.generate_content(prompt)
-                
-                # 提取代碼部分
-                code = self._extract_code(response.text)
-                
-                return {
-                    'success': True,
-                    'code': code,
-                    'raw_response': response.text,
-                    'attempt': attempt + 1
-                }
-                
-            except Exception as e:
-                if attempt == max_retries - 1:
-                    return {
-                        'success': False,
-                        'error': str(e),
-                        'attempts': max_retries
-                    }
-                # 短暫等待後重試
-                time.sleep(1)
-        
+                for attempt in range(1, max_retries + 1):
+                    generate_span.set_attribute('attempts', attempt)
+                    get_tracer().increment('gemini_attempts')
+                    try:
+                        with span('gemini.attempt', attempt=attempt) as attempt_span:
+                            response = await self._models[request['model']].generate_content_async(request['prompt'])
+                            self._add_usage(request, response, attempt_span)
+                        return self._success(request, response, attempt)
+
+                    except Exception as e:
+                        get_tracer().increment('gemini_failed_attempts', error_type=type(e).__name__)
+                        if attempt == max_retries:
+                            generate_span.set_attribute('outcome', 'failed')
+                            return self._failure(request, str(e), attempt)
+                        with span('gemini.retry_wait'):
+                            await asyncio.sleep(RETRY_DELAY_SECONDS)
+
+            except asyncio.CancelledError:
+                generate_span.set_attribute('outcome', 'cancelled')
+                self._record(self._accounting(request, attempt), 'cancelled')
+                raise
+
         return {'success': False, 'error': '未知錯誤'}
+
+    def _prepare(self, user_query: str, data_info: Dict[str, Any], available_modules: Dict[str, Any],
+                 performance_hint: str, error_feedback: Dict[str, str], generate_span, started: float) -> Dict[str, Any]:
+        """建立提示詞並選擇模型"""
+
+        with span('gemini.prompt') as prompt_span:
+            prompt = self._create_prompt(user_query, data_info, available_modules, performance_hint, error_feedback)
+            prompt_span.set_attribute('prompt_chars', len(prompt))
+
+        tier = self.select_tier(user_query, prompt, escalate=1 if performance_hint or error_feedback else 0)
+        generate_span.set_attributes(model=self.model_tiers[tier], tier=tier)
+        return {
+            'prompt': prompt,
+            'model': self.model_tiers[tier],
+            'tier': tier,
+            'usage': {'prompt_tokens': 0, 'response_tokens': 0, 'total_tokens': 0},
+            'started': started
+        }
+
+    def _add_usage(self, request: Dict[str, Any], response, attempt_span) -> None:
+        for key, value in _usage(response).items():
+            request['usage'][key] += value
+        attempt_span.set_attribute('response_chars', len(response.text))
+
+    def _accounting(self, request: Dict[str, Any], attempts: int) -> Dict[str, Any]:
+        return {
+            'model': request['model'],
+            'tier': request['tier'],
+            'attempts': attempts,
+            'seconds': round(time.perf_counter() - request['started'], 3),
+            'usage': request['usage']
+        }
+
+    def _success(self, request: Dict[str, Any], response, attempt: int) -> Dict[str, Any]:
+        # 提取代碼部分
+        with span('gemini.extract_code'):
+            code = self._extract_code(response.text)
+
+        accounting = self._accounting(request, attempt)
+        self._record(accounting, 'success')
+        return {
+            'success': True,
+            'code': code,
+            'raw_response': response.text,
+            'attempt': attempt,
+            **accounting
+        }
+
+    def _failure(self, request: Dict[str, Any], error: str, attempts: int) -> Dict[str, Any]:
+        accounting = self._accounting(request, attempts)
+        self._record(accounting, 'failed')
+        return {
+            'success': False,
+            'error': error,
+            **accounting
+        }
+
+    def _record(self, accounting: Dict[str, Any], outcome: str) -> None:
+        """累計各模型的請求數、token 用量與耗時（outcome 為 success、failed 或 cancelled）"""
+
+        model_name = accounting['model']
+        usage = accounting['usage']
+        tracer = get_tracer()
+        tracer.increment('gemini_requests', model=model_name, tier=accounting['tier'], outcome=outcome)
+        tracer.increment('gemini_tokens', usage['prompt_tokens'], model=model_name, kind='prompt')
+        tracer.increment('gemini_tokens', usage['response_tokens'], model=model_name, kind='response')
+        tracer.increment('gemini_request_seconds', accounting['seconds'], model=model_name)
+
+        with self._lock:
+            stats = self.stats.setdefault(model_name, {
+                'tier': accounting['tier'], 'requests': 0, 'failed': 0, 'cancelled': 0, 'attempts': 0,
+                'prompt_tokens': 0, 'response_tokens': 0, 'seconds': 0.0
+            })
+            stats['requests'] += 1
+            if outcome != 'success':
+                stats[outcome] += 1
+            stats['attempts'] += accounting['attempts']
+            stats['prompt_tokens'] += usage['prompt_tokens']
+            stats['response_tokens'] += usage['response_tokens']
+            stats['seconds'] += accounting['seconds']
+
+    def report(self) -> List[Dict[str, Any]]:
+        """各模型的請求數、token 用量與平均耗時（依層級排序）"""
+        with self._lock:
+            rows = [{'model': model_name, **stats} for model_name, stats in self.stats.items()]
+        for row in rows:
+            row['seconds'] = round(row['seconds'], 3)
+            row['mean_seconds'] = round(row['seconds'] / row['requests'], 3) if row['requests'] else 0.0
+        return sorted(rows, key=lambda row: row['tier'])
     
-    def _create_prompt(self, user_query: str, data_info: Dict[str, Any], available_modules: Dict[str, Any] = None) -> str:
+    def _create_prompt(self, user_query: str, data_info: Dict[str, Any], available_modules: Dict[str, Any] = None, performance_hint: str = None, error_feedback: Dict[str, str] = None) -> str:
         """建立提示詞"""
         
         columns_info = f"""
@@ -90,6 +298,36 @@ class GeminiClient:
         - sm: statsmodels 統計分析
         - stats: scipy.stats 統計測試
         - sklearn相關: 機器學習功能
+        """
+            # 大數據降採樣輔助函數
+            if 'downsample_line' in available_modules:
+                modules_info += """
+        大數據輔助函數（已載入，數據量大時請優先使用）：
+        - downsample_line(df, x, y, max_points=5000, method='lttb'): 折線圖降採樣，回傳 DataFrame
+        - density_scatter(df, x, y, max_points=20000, title=None): 散點圖，點數過多時自動改為密度熱圖，回傳 plotly fig
+        - scatter_bins(df, x, y, bins=200): 2D 分箱，回傳含 count 欄位的 DataFrame
+        - histogram_bins(series, bins='auto'): 預先計算直方圖分箱，回傳 DataFrame
+        - binned_histogram(df, x, bins='auto', title=None): 預先分箱的直方圖，回傳 plotly fig
+        """
+            # 記憶化聚合輔助函數
+            if 'agg' in available_modules:
+                modules_info += """
+        聚合輔助函數（結果會快取，同一數據集的重複查詢不需重新計算，請優先使用而不是直接 groupby）：
+        - agg(df, by, col, func='mean'): 等同 df.groupby(by)[col].agg(func).reset_index()
+        - value_counts(df, col, top=None, normalize=False): 回傳含 col 與 count 欄位的 DataFrame
+        - resample(df, date_col, value_col, freq='D', func='sum'): 自動轉換日期後依頻率聚合，回傳 DataFrame
+        注意：請直接傳入原始的 df，先篩選或修改過的數據不會使用快取
+        """
+            # 數據存放在 DuckDB 查詢引擎時，要求先在引擎內聚合
+            if 'db' in available_modules:
+                engine_info = available_modules['db'].describe()
+                modules_info += f"""
+        DuckDB 查詢引擎（數據共 {engine_info['row_count']} 行，存放在磁碟上；請一律優先使用）：
+        - db.sql("SELECT ... FROM data ...")：在引擎內以多核心執行 SQL，回傳 pandas DataFrame
+        - 資料表名稱為 data，欄位與 df 相同；欄位名稱含空白、大寫或中文時請用雙引號，例如 "Order Date"
+        - 請先在 SQL 中完成 GROUP BY、篩選、date_trunc 等聚合，或以 USING SAMPLE 取樣，再把小結果交給繪圖函數
+        - 查詢結果最多 {engine_info['max_result_rows']} 行，超過會失敗；不要用 SELECT * 取出全部數據
+        - 不要直接對 df 做 groupby 或逐行處理（df 只適合查看少量數據）
         """
         else:
             modules_info = """
@@ -102,6 +340,29 @@ class GeminiClient:
             - sns: seaborn 統計圖表
             - st: streamlit 顯示功能
             """
+
+        # 上一次生成的代碼有效能問題時，要求改寫
+        if performance_hint:
+            performance_info = f"""
+效能要求（請務必遵守）：
+{performance_hint}
+請使用 pandas/numpy 的向量化運算、groupby 或 df.sample() 取代逐行處理。
+"""
+        else:
+            performance_info = ""
+
+        # 上一次生成的代碼執行失敗且無法在本地修正時，附上錯誤要求修正
+        if error_feedback:
+            error_info = f"""
+上一次生成的代碼執行失敗，請修正錯誤後重新生成完整代碼：
+```python
+{error_feedback['code']}
+```
+錯誤訊息：{error_feedback['error']}
+完整欄位名稱：{data_info.get('sample_data', {}).get('columns', [])}
+"""
+        else:
+            error_info = ""
         
         prompt = f"""
             你是一個數據視覺化專家。根據用戶需求和數據資訊，生成 Python 代碼來建立圖表。
@@ -111,7 +372,7 @@ class GeminiClient:
 {modules_info}
 
 用戶需求：{user_query}
-
+{performance_info}{error_info}
 重要限制和要求：
 1. 數據已載入為 df 變數，請直接使用
 2. 只能使用上面列出的可用模組，絕對不要import其他模組
@@ -126,7 +387,7 @@ class GeminiClient:
 代碼風格要求：
 - 簡潔清晰，避免複雜的統計分析
 - 優先使用 plotly (px) 製作互動圖表
-- 如果數據量大，考慮適當採樣
+- 如果數據量大，使用上述大數據輔助函數或 df.sample() 採樣，不要把數十萬個點直接交給 plotly
 - 處理可能的缺失值
 - 如果有圖表文字請用英文字呈現，不要有任何中文字
 
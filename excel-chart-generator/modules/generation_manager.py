@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, Callable, Coroutine, Optional
+
+from modules.tracing import get_tracer
+
+# 等待結果時呼叫 on_tick 的間隔（秒）
+DEFAULT_TICK_SECONDS = 0.25
+
+
+class GenerationRequest:
+    """一次送出的生成請求（future 完成時為 generate_chart_code_async 的結果）"""
+
+    def __init__(self, request_id: str, session_id: str, future: Future):
+        self.request_id = request_id
+        self.session_id = session_id
+        self.future = future
+        self.started = time.perf_counter()
+        self.cancel_reason: Optional[str] = None
+
+    def __repr__(self) -> str:
+        return f'<GenerationRequest {self.request_id} session={self.session_id[:8]}>'
+
+
+class GenerationManager:
+    """
+    在背景 asyncio 事件迴圈執行 Gemini 請求，每個 session 同時只保留最新的一個
+
+    同一 session 送出新請求時取消前一個（superseded）；呼叫端也可以在重新執行或中斷連線時取消。
+    取消會停止進行中的 API 呼叫與等待中的重試，並以 generation_abandoned 計數器記錄原因。
+    """
+
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='generation-loop', daemon=True)
+        self._thread.start()
+        self._active: Dict[str, GenerationRequest] = {}
+        self._lock = threading.Lock()
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'abandoned': 0}
+        self.abandoned_by_reason: Dict[str, int] = {}
+
+    def submit(self, session_id: str, coroutine: Coroutine) -> GenerationRequest:
+        """
+        在事件迴圈中執行 coroutine（同一 session 進行中的請求會先被取消）
+
+        Args:
+            session_id: 送出請求的 session
+            coroutine: 例如 gemini_client.generate_chart_code_async(...)
+
+        Returns:
+            可等待或取消的請求
+        """
+
+        with self._lock:
+            previous = self._active.get(session_id)
+        if previous is not None:
+            self.cancel(previous, 'superseded')
+
+        request = GenerationRequest(uuid.uuid4().hex[:12], session_id,
+                                    asyncio.run_coroutine_threadsafe(coroutine, self._loop))
+        with self._lock:
+            self._active[session_id] = request
+            self.stats['submitted'] += 1
+        request.future.add_done_callback(lambda _: self._finished(request))
+        return request
+
+    def cancel(self, request: GenerationRequest, reason: str) -> bool:
+        """
+        取消請求（已完成時不做任何事）
+
+        Args:
+            request: 要取消的請求
+            reason: 記錄在指標中的原因（superseded、rerun、stopped、disconnected 等）
+
+        Returns:
+            是否確實取消
+        """
+
+        with self._lock:
+            if request.future.done() or request.cancel_reason is not None:
+                return False
+            request.cancel_reason = reason
+        # 取消 run_coroutine_threadsafe 的 future 時，事件迴圈中的 task 也會被取消
+        return request.future.cancel()
+
+    def cancel_session(self, session_id: str, reason: str) -> bool:
+        """取消 session 進行中的請求"""
+        with self._lock:
+            request = self._active.get(session_id)
+        return request is not None and self.cancel(request, reason)
+
+    def wait(self, request: GenerationRequest, on_tick: Callable[[float], None] = None,
+             tick: float = DEFAULT_TICK_SECONDS) -> Dict[str, Any]:
+        """
+        等待請求完成
+
+        Args:
+            request: 送出的請求
+            on_tick: 尚未完成時每 tick 秒呼叫一次，參數為已等待的秒數
+                     （Streamlit 在此時檢查重新執行的要求；on_tick 也可以呼叫 cancel）
+            tick: 呼叫 on_tick 的間隔
+
+        Raises:
+            concurrent.futures.CancelledError: 請求已被取消
+        """
+
+        while True:
+            try:
+                return request.future.result(timeout=tick)
+            except FutureTimeoutError:
+                if on_tick is not None:
+                    on_tick(time.perf_counter() - request.started)
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'active': len(self._active), **self.stats, 'abandoned_by_reason': dict(self.abandoned_by_reason)}
+
+    def _finished(self, request: GenerationRequest) -> None:
+        future = request.future
+        if future.cancelled():
+            outcome = 'abandoned'
+        elif future.exception() is not None:
+            outcome = 'failed'
+        else:
+            outcome = 'completed'
+
+        with self._lock:
+            if self._active.get(request.session_id) is request:
+                del self._active[request.session_id]
+            self.stats[outcome] += 1
+            if outcome == 'abandoned':
+                reason = request.cancel_reason or 'cancelled'
+                self.abandoned_by_reason[reason] = self.abandoned_by_reason.get(reason, 0) + 1
+
+        if outcome == 'abandoned':
+            get_tracer().increment('generation_abandoned', reason=reason)
+            # 被放棄前已花費的等待時間
+            get_tracer().increment('generation_abandoned_seconds', round(time.perf_counter() - request.started, 3),
+                                   reason=reason)
+        else:
+            get_tracer().increment('generation_requests', outcome=outcome)
@@ -0,0 +1,212 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Union
+
+from modules.figure_cache import normalize_query
+
+# 歷史列表每頁筆數
+PAGE_SIZE = 5
+
+# trigram 分詞器以 3 個字元為單位索引，可做中文的子字串搜尋
+_MIN_FTS_TERM = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chart_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT,
+    dataset_hash TEXT NOT NULL,
+    query TEXT NOT NULL,
+    normalized_query TEXT NOT NULL,
+    code TEXT NOT NULL,
+    cache_key TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chart_history_dataset ON chart_history (dataset_hash, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_chart_history_created ON chart_history (created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_chart_history_query ON chart_history (dataset_hash, normalized_query);
+CREATE INDEX IF NOT EXISTS idx_chart_history_session ON chart_history (session_id, dataset_hash, created_at DESC);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS chart_history_fts USING fts5(
+    query, content='chart_history', content_rowid='id', tokenize='{tokenizer}'
+);
+CREATE TRIGGER IF NOT EXISTS chart_history_fts_insert AFTER INSERT ON chart_history BEGIN
+    INSERT INTO chart_history_fts (rowid, query) VALUES (new.id, new.query);
+END;
+CREATE TRIGGER IF NOT EXISTS chart_history_fts_delete AFTER DELETE ON chart_history BEGIN
+    INSERT INTO chart_history_fts (chart_history_fts, rowid, query) VALUES ('delete', old.id, old.query);
+END;
+"""
+
+# 列表只取摘要欄位，代碼在展開時才讀取
+_SUMMARY_COLUMNS = ('id', 'session_id', 'dataset_hash', 'query', 'cache_key', 'created_at')
+_SUMMARY_SELECT = ', '.join(_SUMMARY_COLUMNS)
+_SUMMARY_SELECT_JOINED = ', '.join(f'h.{column}' for column in _SUMMARY_COLUMNS)
+
+
+class ChartHistoryStore:
+    """
+    以 SQLite 保存的圖表歷史
+
+    依數據集雜湊分頁列出，查詢文字可全文搜尋（有 FTS5 時使用 trigram 索引，否則退回 LIKE），
+    重新整理頁面或重新啟動後仍可重用先前生成的代碼。
+    整個行程共用同一個資料庫，因此讀取與刪除都以 session_id（歷史擁有者）過濾，
+    使用者之間看不到彼此的查詢與代碼。
+    """
+
+    def __init__(self, db_path: Union[str, Path] = 'chart_history.db'):
+        """
+        Args:
+            db_path: 資料庫檔案路徑（':memory:' 表示不落地）
+        """
+        self.db_path = str(db_path)
+        if self.db_path != ':memory:':
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+
+        # Streamlit 每次執行使用不同的執行緒，共用同一個連線並以鎖保護
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+
+        with self._lock, self._conn:
+            if self.db_path != ':memory:':
+                self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(_SCHEMA)
+            self.has_fts = self._create_fts()
+
+    def _create_fts(self) -> bool:
+        """建立全文索引；SQLite 沒有 FTS5 時回傳 False"""
+        for tokenizer in ('trigram', 'unicode61'):
+            try:
+                self._conn.executescript(_FTS_SCHEMA.format(tokenizer=tokenizer))
+            except sqlite3.OperationalError:
+                continue
+            self._trigram = tokenizer == 'trigram'
+            return True
+        self._trigram = False
+        return False
+
+    def add(self, dataset_hash: str, query: str, code: str, cache_key: str = None,
+            session_id: str = None) -> int:
+        """新增一筆歷史，回傳 ID（session_id 為歷史擁有者，沒有擁有者的紀錄不會被列出）"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                'INSERT INTO chart_history '
+                '(session_id, dataset_hash, query, normalized_query, code, cache_key, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (session_id, dataset_hash, query, normalize_query(query), code, cache_key, time.time())
+            )
+            return cursor.lastrowid
+
+    def count(self, session_id: str, dataset_hash: str) -> int:
+        """擁有者在數據集上的歷史筆數"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT COUNT(*) FROM chart_history WHERE session_id = ? AND dataset_hash = ?',
+                (session_id, dataset_hash)
+            ).fetchone()
+        return row[0]
+
+    def page(self, session_id: str, dataset_hash: str, page: int = 0,
+             page_size: int = PAGE_SIZE) -> List[Dict[str, Any]]:
+        """依時間由新到舊分頁列出擁有者在數據集上的歷史（不含代碼）"""
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT {_SUMMARY_SELECT} FROM chart_history WHERE session_id = ? AND dataset_hash = ? '
+                'ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?',
+                (session_id, dataset_hash, page_size, max(0, page) * page_size)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get(self, session_id: str, entry_id: int) -> Optional[Dict[str, Any]]:
+        """讀取擁有者的單筆歷史（含代碼）"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT * FROM chart_history WHERE id = ? AND session_id = ?', (entry_id, session_id)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def find_query(self, session_id: str, dataset_hash: str, query: str) -> Optional[Dict[str, Any]]:
+        """擁有者在相同數據集上最近一次相同查詢（忽略空白與大小寫）的歷史"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT * FROM chart_history WHERE session_id = ? AND dataset_hash = ? AND normalized_query = ? '
+                'ORDER BY created_at DESC, id DESC LIMIT 1',
+                (session_id, dataset_hash, normalize_query(query))
+            ).fetchone()
+        return dict(row) if row else None
+
+    def search(self, session_id: str, text: str, dataset_hash: str = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        全文搜尋擁有者過去的查詢（不含代碼）
+
+        Args:
+            session_id: 歷史擁有者
+            text: 搜尋文字（以空白分隔的詞須全部符合）
+            dataset_hash: 只搜尋此數據集（None 表示全部）
+            limit: 最多回傳筆數
+
+        Returns:
+            符合的歷史，相關度高的在前
+        """
+
+        terms = text.split()
+        if not terms:
+            return []
+
+        # trigram 無法索引少於 3 個字元的詞，這些詞改用 LIKE
+        if self.has_fts and self._trigram:
+            fts_terms = [term for term in terms if len(term) >= _MIN_FTS_TERM]
+        elif self.has_fts:
+            fts_terms = terms
+        else:
+            fts_terms = []
+        like_terms = [term for term in terms if term not in fts_terms]
+
+        conditions, params = [], []
+        if fts_terms:
+            # 每個詞都以片語引號包住，避免使用者輸入被當成 FTS 語法
+            quoted = ['"{}"'.format(term.replace('"', '""')) for term in fts_terms]
+            if not self._trigram:
+                quoted = [f'{term}*' for term in quoted]
+            sql = (
+                f'SELECT {_SUMMARY_SELECT_JOINED} '
+                'FROM chart_history_fts JOIN chart_history h ON h.id = chart_history_fts.rowid '
+                'WHERE chart_history_fts MATCH ?'
+            )
+            params.append(' AND '.join(quoted))
+            order = 'ORDER BY bm25(chart_history_fts), h.created_at DESC'
+        else:
+            sql = f'SELECT {_SUMMARY_SELECT_JOINED} FROM chart_history h WHERE 1 = 1'
+            order = 'ORDER BY h.created_at DESC'
+
+        conditions.append('h.session_id = ?')
+        params.append(session_id)
+        for term in like_terms:
+            conditions.append("h.query LIKE ? ESCAPE '\\'")
+            params.append('%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        if dataset_hash:
+            conditions.append('h.dataset_hash = ?')
+            params.append(dataset_hash)
+
+        sql = ' AND '.join([sql] + conditions) + f' {order} LIMIT ?'
+        params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def clear(self, session_id: str, dataset_hash: str) -> int:
+        """刪除擁有者在數據集上的所有歷史，回傳刪除筆數"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                'DELETE FROM chart_history WHERE session_id = ? AND dataset_hash = ?', (session_id, dataset_hash)
+            )
+            return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,390 @@
+import json
+import re
+from difflib import SequenceMatcher
+from typing import Dict, Any, List, Optional, Tuple
+
+# 信心值達到此門檻才直接以內建圖表函數繪製，否則交給 Gemini
+DEFAULT_THRESHOLD = 0.8
+
+# 圖表意圖的關鍵字：strong 為明確的圖表名稱，weak 為常見的描述方式
+INTENT_KEYWORDS = {
+    'histogram': {
+        'strong': ['histogram', 'hist', '直方圖'],
+        'weak': ['distribution', 'frequency', 'spread', '分布', '分佈', '頻率', '頻數'],
+    },
+    'time_series': {
+        'strong': ['line chart', 'line graph', 'line plot', 'time series', '折線圖', '時間序列', '趨勢圖', '走勢圖'],
+        'weak': ['over time', 'trend', 'trends', 'timeline', '趨勢', '走勢', '隨時間', '變化'],
+    },
+    'scatter': {
+        'strong': ['scatter plot', 'scatter chart', 'scatter', '散點圖', '散佈圖', '散布圖'],
+        'weak': ['vs', 'versus', 'against', 'relationship', 'correlation', 'relation', '關係', '相關性', '相關'],
+    },
+    'bar': {
+        'strong': ['bar chart', 'bar graph', 'bar plot', 'bar', '柱狀圖', '長條圖', '條形圖', '直條圖'],
+        'weak': ['by', 'per', 'each', 'across', 'compare', 'comparison', '各個', '各', '每個', '每', '按', '依', '比較'],
+    },
+}
+
+AGGREGATION_KEYWORDS = {
+    'mean': ['average', 'mean', 'avg', '平均值', '平均'],
+    'sum': ['total', 'sum', '總和', '總計', '合計', '加總'],
+}
+
+# 不影響意圖的詞；扣除關鍵字與欄位後若還有其他內容（篩選、排序、數字等），交給 Gemini
+EN_STOPWORDS = {
+    'a', 'an', 'the', 'of', 'for', 'show', 'me', 'plot', 'draw', 'chart', 'graph', 'make', 'create', 'please',
+    'give', 'display', 'visualize', 'visualise', 'and', 'with', 'in', 'on', 'to', 'my', 'data', 'column', 'field',
+    'what', 'is', 'how', 'does', 'over', 'between', 'values', 'value', 'can', 'you', 'i', 'want', 'see',
+    'generate', 'shows', 'showing', 'change', 'changes', 'all', 'it', 'its'
+}
+ZH_STOPWORDS = [
+    '幫我', '幫忙', '請', '畫出', '畫', '繪製', '製作', '生成', '產生', '顯示', '呈現', '一個', '一張', '個', '張',
+    '的', '圖表', '圖', '和', '與', '跟', '及', '之間', '看看', '看一下', '我想', '想要', '想', '看', '給我', '出',
+    '一下', '情況', '狀況', '數據', '欄位', '是', '如何', '怎麼', '吧', '嗎', '了'
+]
+
+_ASCII_WORD = re.compile(r'[a-z0-9_]+')
+_PUNCTUATION = re.compile(r'[\s,.;:!?()\[\]{}\'"`~\-/，。；：！？、（）「」『』《》]+')
+
+# 顯示用的圖表名稱
+CHART_LABELS = {
+    'histogram': '直方圖',
+    'time_series': '時間序列圖',
+    'scatter': '散點圖',
+    'bar': '柱狀圖',
+}
+
+
+def _normalize(text: str) -> str:
+    return ' '.join(str(text).lower().replace('_', ' ').split())
+
+
+def _is_ascii(text: str) -> bool:
+    return all(ord(char) < 128 for char in text)
+
+
+class _QueryText:
+    """記錄查詢中已被關鍵字或欄位使用的位置"""
+
+    def __init__(self, query: str):
+        self.text = _normalize(query)
+        self.used = [False] * len(self.text)
+
+    def find(self, phrase: str) -> List[Tuple[int, int]]:
+        """找出片語在查詢中尚未使用的位置（英文需完整單字）"""
+        if not phrase:
+            return []
+        if _is_ascii(phrase):
+            pattern = r'(?<![a-z0-9_])' + re.escape(phrase) + r'(?![a-z0-9_])'
+        else:
+            pattern = re.escape(phrase)
+        return [
+            (match.start(), match.end()) for match in re.finditer(pattern, self.text)
+            if not any(self.used[match.start():match.end()])
+        ]
+
+    def consume(self, start: int, end: int) -> None:
+        for i in range(start, end):
+            self.used[i] = True
+
+    def remaining(self) -> str:
+        return ''.join(' ' if used else char for char, used in zip(self.text, self.used))
+
+
+class IntentRouter:
+    """
+    在本地判斷簡單的圖表需求（例如「price 的直方圖」、「sales over time」）
+
+    以圖表意圖的關鍵字（中英文）與模糊比對的欄位名稱判斷；
+    只有所有內容都能解釋時才給出高信心值，其餘交給 Gemini。
+    """
+
+    def __init__(self, data_analysis: Dict[str, Any], threshold: float = DEFAULT_THRESHOLD):
+        """
+        Args:
+            data_analysis: 數據分析結果（需要 numeric / datetime / categorical 欄位清單）
+            threshold: 直接繪製所需的最低信心值
+        """
+        self.threshold = threshold
+        self.column_types = {}
+        for col_type in ('numeric', 'datetime', 'categorical'):
+            for col in data_analysis.get(col_type, []):
+                self.column_types[col] = col_type
+        self.datetime_columns = list(data_analysis.get('datetime', []))
+
+    def route(self, user_query: str) -> Optional[Dict[str, Any]]:
+        """
+        判斷查詢的圖表意圖
+
+        Returns:
+            {'chart_type', 'columns', 'aggregation', 'confidence', 'confident', 'code', 'description'}；
+            無法判斷時回傳 None
+        """
+
+        query = _QueryText(user_query)
+
+        columns = self._match_columns_exact(query)
+        intents = self._match_keywords(query)
+        aggregation = self._match_aggregation(query)
+        columns.extend(self._match_columns_fuzzy(query))
+        columns.sort(key=lambda match: match['position'])
+
+        leftover = self._leftover(query)
+
+        candidates = []
+        for chart_type in INTENT_KEYWORDS:
+            candidate = self._build_candidate(chart_type, intents, columns, aggregation, leftover)
+            if candidate is not None:
+                candidates.append(candidate)
+        if not candidates:
+            return None
+
+        candidates.sort(key=lambda candidate: candidate['confidence'], reverse=True)
+        best = candidates[0]
+        # 兩種意圖同樣可信時無法判斷
+        if len(candidates) > 1 and candidates[1]['confidence'] >= best['confidence'] - 0.05:
+            best['confidence'] = min(best['confidence'], self.threshold - 0.1)
+
+        best['confidence'] = round(best['confidence'], 2)
+        best['confident'] = best['confidence'] >= self.threshold
+        best['code'] = intent_code(best)
+        best['description'] = describe_intent(best)
+        return best
+
+    def _match_columns_exact(self, query: _QueryText) -> List[Dict[str, Any]]:
+        """完整出現在查詢中的欄位名稱（長的優先，避免 price 吃掉 unit_price）"""
+        matches = []
+        for col in sorted(self.column_types, key=lambda col: len(_normalize(col)), reverse=True):
+            for start, end in query.find(_normalize(col))[:1]:
+                query.consume(start, end)
+                matches.append({'column': col, 'score': 1.0, 'position': start})
+        return matches
+
+    def _match_keywords(self, query: _QueryText) -> Dict[str, str]:
+        """找出意圖關鍵字，回傳 {意圖: 'strong' | 'weak'}"""
+        phrases = [
+            (phrase, chart_type, strength)
+            for chart_type, groups in INTENT_KEYWORDS.items()
+            for strength, keywords in groups.items()
+            for phrase in keywords
+        ]
+        intents = {}
+        for phrase, chart_type, strength in sorted(phrases, key=lambda item: len(item[0]), reverse=True):
+            spans = query.find(phrase)
+            if not spans:
+                continue
+            for start, end in spans:
+                query.consume(start, end)
+            if intents.get(chart_type) != 'strong':
+                intents[chart_type] = strength
+        return intents
+
+    def _match_aggregation(self, query: _QueryText) -> Optional[str]:
+        found = set()
+        for aggregation, keywords in AGGREGATION_KEYWORDS.items():
+            for phrase in sorted(keywords, key=len, reverse=True):
+                for start, end in query.find(phrase):
+                    query.consume(start, end)
+                    found.add(aggregation)
+        if len(found) > 1:
+            return 'ambiguous'
+        return found.pop() if found else None
+
+    def _match_columns_fuzzy(self, query: _QueryText) -> List[Dict[str, Any]]:
+        """以相似度比對剩餘文字與欄位名稱（大小寫、底線、單複數、少一個字等差異）"""
+
+        remaining = query.remaining()
+        words = [
+            (match.start(), match.end(), match.group())
+            for match in _ASCII_WORD.finditer(remaining) if match.group() not in EN_STOPWORDS
+        ]
+
+        candidates = []
+        for col in self.column_types:
+            name = _normalize(col)
+            if _is_ascii(name):
+                size = len(name.split())
+                windows = [
+                    (words[i][0], words[i + n - 1][1], ' '.join(word for _, _, word in words[i:i + n]))
+                    for n in range(max(1, size - 1), size + 2)
+                    for i in range(len(words) - n + 1)
+                ]
+            else:
+                windows = [
+                    (start, start + length, remaining[start:start + length])
+                    for length in range(max(2, len(name) - 1), len(name) + 2)
+                    for start in range(len(remaining) - length + 1)
+                    if ' ' not in remaining[start:start + length]
+                ]
+            for start, end, text in windows:
+                score = SequenceMatcher(None, name, text).ratio()
+                if score >= 0.8:
+                    candidates.append((score, end - start, start, end, col))
+
+        matches, matched_columns = [], set()
+        for score, _, start, end, col in sorted(candidates, reverse=True):
+            if col in matched_columns or any(query.used[start:end]):
+                continue
+            query.consume(start, end)
+            matched_columns.add(col)
+            matches.append({'column': col, 'score': round(score, 2), 'position': start})
+        return matches
+
+    def _leftover(self, query: _QueryText) -> str:
+        """扣除停用詞後仍無法解釋的文字"""
+        remaining = query.remaining()
+        for phrase in sorted(ZH_STOPWORDS, key=len, reverse=True):
+            remaining = remaining.replace(phrase, ' ')
+        tokens = [token for token in _PUNCTUATION.split(remaining) if token]
+        leftover = []
+        for token in tokens:
+            for word in re.findall(r'[a-z0-9_]+|[^a-z0-9_]+', token):
+                if word not in EN_STOPWORDS:
+                    leftover.append(word)
+        return ' '.join(leftover)
+
+    def _build_candidate(self, chart_type: str, intents: Dict[str, str], columns: List[Dict[str, Any]],
+                         aggregation: Optional[str], leftover: str) -> Optional[Dict[str, Any]]:
+        """依意圖需要的欄位類型分配角色並計算信心值"""
+
+        by_type = {'numeric': [], 'datetime': [], 'categorical': []}
+        for match in columns:
+            by_type[self.column_types[match['column']]].append(match)
+        numeric, datetime_cols, categorical = by_type['numeric'], by_type['datetime'], by_type['categorical']
+        inferred = False
+
+        if chart_type == 'histogram':
+            if len(numeric) != 1 or datetime_cols or categorical:
+                return None
+            roles = {'column': numeric[0]}
+        elif chart_type == 'time_series':
+            if len(numeric) != 1 or categorical or len(datetime_cols) > 1:
+                return None
+            if datetime_cols:
+                roles = {'date': datetime_cols[0], 'value': numeric[0]}
+            elif len(self.datetime_columns) == 1:
+                # 只有一個日期欄位時可省略
+                roles = {'date': {'column': self.datetime_columns[0], 'score': 1.0}, 'value': numeric[0]}
+                inferred = True
+            else:
+                return None
+        elif chart_type == 'scatter':
+            if len(numeric) != 2 or datetime_cols or categorical:
+                return None
+            roles = {'x': numeric[0], 'y': numeric[1]}
+        else:
+            if len(numeric) != 1 or len(categorical) != 1 or datetime_cols:
+                return None
+            roles = {'category': categorical[0], 'value': numeric[0]}
+
+        strength = intents.get(chart_type)
+        if strength == 'strong':
+            confidence = 0.7
+        elif strength == 'weak':
+            confidence = 0.65
+        elif chart_type == 'time_series' and not intents:
+            # 只提到數值欄位與日期欄位，最自然的圖是趨勢圖
+            confidence = 0.55 if not inferred else 0.0
+        else:
+            confidence = 0.0
+        if not confidence:
+            return None
+
+        # 同時出現其他意圖的關鍵字（例如 "sales over time by region"）時降低信心值
+        for other, other_strength in intents.items():
+            if other != chart_type:
+                confidence -= 0.3 if other_strength == 'strong' else 0.15
+
+        confidence += (0.15 if inferred else 0.2) * min(match['score'] for match in roles.values())
+
+        if chart_type == 'bar':
+            if aggregation == 'ambiguous':
+                return None
+            if aggregation is None:
+                # 未指定聚合方式時使用平均值（標題會註明）
+                confidence -= 0.05
+                aggregation = 'mean'
+        elif aggregation is not None:
+            confidence -= 0.3
+
+        if leftover:
+            confidence = min(confidence, 0.4)
+        else:
+            confidence += 0.1
+
+        return {
+            'chart_type': chart_type,
+            'columns': {role: match['column'] for role, match in roles.items()},
+            'aggregation': aggregation if chart_type == 'bar' else None,
+            'confidence': min(confidence, 1.0),
+            'leftover': leftover
+        }
+
+
+def make_intent(chart_type: str, columns: Dict[str, Any], aggregation: str = None) -> Dict[str, Any]:
+    """
+    直接指定的圖表意圖（例如依數據特性建議的圖表），格式與 IntentRouter.route 相同
+
+    Args:
+        chart_type: histogram / time_series / scatter / bar
+        columns: 欄位角色（見 IntentRouter.route）
+        aggregation: 柱狀圖的聚合方式（mean 或 sum，預設 mean）
+    """
+
+    intent = {
+        'chart_type': chart_type,
+        'columns': dict(columns),
+        'aggregation': (aggregation or 'mean') if chart_type == 'bar' else None,
+        'confidence': 1.0,
+        'confident': True,
+        'leftover': ''
+    }
+    intent['code'] = intent_code(intent)
+    intent['description'] = describe_intent(intent)
+    return intent
+
+
+def canonical_intent(intent: Dict[str, Any]) -> str:
+    """意圖的正規化表示（圖表類型、欄位與聚合方式相同的意圖視為相同）"""
+    return json.dumps(
+        {'chart_type': intent['chart_type'], 'columns': intent['columns'], 'aggregation': intent['aggregation']},
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+
+
+def intent_code(intent: Dict[str, Any]) -> str:
+    """產生與本地圖表等效的代碼（記錄到歷史，之後可重用或修改）"""
+
+    columns = intent['columns']
+    chart_type = intent['chart_type']
+
+    if chart_type == 'histogram':
+        return f"fig = px.histogram(df, x={columns['column']!r})\nst.plotly_chart(fig)"
+    if chart_type == 'time_series':
+        date, value = columns['date'], columns['value']
+        return (
+            f"plot_df = df.copy()\n"
+            f"plot_df[{date!r}] = pd.to_datetime(plot_df[{date!r}], format='mixed', errors='coerce')\n"
+            f"plot_df = plot_df.dropna(subset=[{date!r}]).sort_values({date!r})\n"
+            f"fig = px.line(plot_df, x={date!r}, y={value!r})\n"
+            f"st.plotly_chart(fig)"
+        )
+    if chart_type == 'scatter':
+        return f"fig = px.scatter(df, x={columns['x']!r}, y={columns['y']!r})\nst.plotly_chart(fig)"
+
+    category, value = columns['category'], columns['value']
+    return (
+        f"summary = df.groupby({category!r})[{value!r}].{intent['aggregation']}().reset_index()\n"
+        f"fig = px.bar(summary, x={category!r}, y={value!r})\n"
+        f"st.plotly_chart(fig)"
+    )
+
+
+def describe_intent(intent: Dict[str, Any]) -> str:
+    """意圖的簡短說明（顯示給使用者）"""
+    columns = ', '.join(str(col) for col in intent['columns'].values())
+    label = CHART_LABELS[intent['chart_type']]
+    if intent['chart_type'] == 'bar':
+        label += '（總和）' if intent['aggregation'] == 'sum' else '（平均值）'
+    return f"{label}：{columns}"
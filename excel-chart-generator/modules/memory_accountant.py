@@ -0,0 +1,311 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+import pandas as pd
+
+MB = 1024 * 1024
+
+# 預設預算（可用環境變數 SESSION_MEMORY_BUDGET_MB / GLOBAL_MEMORY_BUDGET_MB 覆寫）
+DEFAULT_SESSION_BUDGET_MB = 512
+DEFAULT_GLOBAL_BUDGET_MB = 4096
+
+
+def deep_size(obj, _seen: set = None) -> int:
+    """
+    估計物件（含內容）的記憶體用量
+
+    DataFrame/Series 使用 pandas 的 deep memory_usage，其餘容器遞迴計算；
+    同一物件只計算一次。
+    """
+
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            return obj.nbytes + sum(deep_size(item, _seen) for item in obj.ravel())
+        return obj.nbytes
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(key, _seen) + deep_size(value, _seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, _seen) for item in obj)
+    return size
+
+
+def write_spill(df: pd.DataFrame, path_base: Path) -> Path:
+    """將 DataFrame 寫成欄式的 parquet（沒有 parquet 引擎時改用 pickle）"""
+    path = path_base.with_suffix('.parquet')
+    try:
+        df.to_parquet(path, index=True)
+        return path
+    except (ImportError, ValueError, TypeError):
+        # 缺少 pyarrow，或欄位型別無法寫成 parquet（例如混合型別的 object 欄位）
+        if path.exists():
+            path.unlink()
+        path = path_base.with_suffix('.pkl')
+        df.to_pickle(path)
+        return path
+
+
+def read_spill(path: Path) -> pd.DataFrame:
+    """讀回暫存到磁碟的 DataFrame"""
+    if path.suffix == '.parquet':
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+
+def remove_files(paths: List[Path]) -> None:
+    """刪除暫存檔（忽略已不存在的檔案）"""
+    for path in paths:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+
+class SessionData:
+    """
+    單一 session 的大型狀態：數據集引用與分析結果（圖表歷史存放在 ChartHistoryStore）
+
+    數據集本身存放在跨 session 共用的 DatasetRegistry，這裡只持有引用；
+    釋放引用後讀取 df 時會自動重新取得。
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.file_id = None
+        self.dataset_hash = None
+        self.shape = None
+        self.last_access = time.time()
+
+        self._lease = None
+        self._analyzed = False
+        self._lock = threading.RLock()
+
+    @property
+    def df(self) -> Optional[pd.DataFrame]:
+        """目前的數據集（共用、唯讀；引用已釋放時自動重新取得）"""
+        with self._lock:
+            self.last_access = time.time()
+            lease = self._lease
+        return lease.df if lease is not None else None
+
+    @property
+    def data_analysis(self) -> Optional[Dict[str, Any]]:
+        """
+        目前可用的分析結果
+
+        背景分析尚未識別完欄位類型時為 None，之後為初步結果，全部完成後為完整結果。
+        """
+        job = self.profiling_job
+        return job.current_analysis() if job is not None else None
+
+    @property
+    def profiling_job(self):
+        """目前數據集的背景分析工作（尚未開始分析時為 None）"""
+        with self._lock:
+            lease = self._lease if self._analyzed else None
+        return lease.profile() if lease is not None else None
+
+    @property
+    def is_spilled(self) -> bool:
+        """是否已釋放數據集引用（記憶體不足時）"""
+        return self._lease is not None and not self._lease.held
+
+    def set_dataset(self, lease, file_id: str = None) -> None:
+        """換成新的數據集引用（舊的引用與分析狀態一併釋放）"""
+        with self._lock:
+            if self._lease is not None:
+                self._lease.release()
+            self._lease = lease
+            self.file_id = file_id
+            self.dataset_hash = lease.dataset_hash
+            self.shape = lease.df.shape
+            self._analyzed = False
+            self.last_access = time.time()
+
+    def start_profiling(self, retry_failed: bool = False):
+        """
+        開始在背景分析目前的數據集（已開始時回傳同一個工作；
+        其他 session 已分析過相同內容的檔案時直接共用結果）
+        """
+        with self._lock:
+            if self._lease is None:
+                raise ValueError('尚未載入數據集')
+            self._analyzed = True
+            lease = self._lease
+        return lease.profile(retry_failed)
+
+    def release_dataset(self) -> bool:
+        """釋放數據集引用（其他 session 仍在使用時數據不會被釋放）"""
+        with self._lock:
+            return self._lease is not None and self._lease.release()
+
+    def usage(self) -> Dict[str, int]:
+        """
+        各部分的記憶體用量（位元組）
+
+        為共用數據的完整大小（多個 session 引用同一份時各自都會計入）。
+        """
+        with self._lock:
+            usage = {'df': 0, 'data_analysis': 0}
+            lease = self._lease
+            analyzed = self._analyzed
+        if lease is not None and lease.held:
+            shared = lease.registry.entry_usage(lease.dataset_hash)
+            usage['df'] = shared['df']
+            usage['data_analysis'] = shared['data_analysis'] if analyzed else 0
+        usage['total'] = sum(usage.values())
+        return usage
+
+
+class MemoryAccountant:
+    """追蹤所有 session 的記憶體用量，超過預算時釋放數據集引用"""
+
+    def __init__(self, session_budget_bytes: int = DEFAULT_SESSION_BUDGET_MB * MB,
+                 global_budget_bytes: int = DEFAULT_GLOBAL_BUDGET_MB * MB,
+                 spill_dir: Path = None, registry=None):
+        """
+        Args:
+            session_budget_bytes: 單一 session 的預算
+            global_budget_bytes: 所有 session 合計的預算
+            spill_dir: 數據集暫存目錄
+            registry: 共用的 DatasetRegistry（未指定時建立新的）
+        """
+        self.session_budget_bytes = session_budget_bytes
+        self.global_budget_bytes = global_budget_bytes
+        self.spill_dir = Path(spill_dir or Path(tempfile.gettempdir()) / 'excel-chart-spill')
+        if registry is None:
+            from modules.dataset_registry import DatasetRegistry
+            registry = DatasetRegistry(spill_dir=self.spill_dir)
+        self.registry = registry
+        self._sessions: Dict[str, weakref.ref] = {}
+        self._lock = threading.Lock()
+        self._enforce_lock = threading.Lock()
+        self.stats = {'spills': 0, 'bytes_spilled': 0}
+
+    @classmethod
+    def from_env(cls) -> 'MemoryAccountant':
+        """依環境變數建立"""
+        from modules.dataset_registry import DatasetRegistry, DEFAULT_IDLE_TIMEOUT
+
+        spill_dir = Path(os.getenv('SESSION_SPILL_DIR') or Path(tempfile.gettempdir()) / 'excel-chart-spill')
+        registry = DatasetRegistry(
+            idle_timeout=float(os.getenv('DATASET_IDLE_TIMEOUT', DEFAULT_IDLE_TIMEOUT)),
+            spill_dir=spill_dir
+        )
+        return cls(
+            session_budget_bytes=int(float(os.getenv('SESSION_MEMORY_BUDGET_MB', DEFAULT_SESSION_BUDGET_MB)) * MB),
+            global_budget_bytes=int(float(os.getenv('GLOBAL_MEMORY_BUDGET_MB', DEFAULT_GLOBAL_BUDGET_MB)) * MB),
+            spill_dir=spill_dir,
+            registry=registry
+        )
+
+    def get_session(self, session_id: str) -> SessionData:
+        """取得（必要時建立）session 的狀態物件；呼叫端需持有回傳的物件"""
+        with self._lock:
+            ref = self._sessions.get(session_id)
+            session = ref() if ref is not None else None
+            if session is None:
+                session = SessionData(session_id)
+                self._sessions[session_id] = weakref.ref(session)
+            return session
+
+    def _live_sessions(self) -> List[SessionData]:
+        with self._lock:
+            live = []
+            for session_id, ref in list(self._sessions.items()):
+                session = ref()
+                if session is None:
+                    del self._sessions[session_id]
+                else:
+                    live.append(session)
+            return live
+
+    def enforce(self, active_session_id: str = None) -> List[str]:
+        """
+        檢查預算並在超過時回收記憶體
+
+        先釋放已過期的共用數據集，再釋放超過單一 session 預算的其他 session 的數據集引用；
+        總量仍超過全域預算時，先暫存沒有引用的數據集，再依最久未使用的順序
+        釋放其他 session 的引用（目前使用中的 session 最後處理）。
+
+        Returns:
+            執行的回收動作說明
+        """
+
+        with self._enforce_lock:
+            return self._enforce(active_session_id)
+
+    def _global_total(self) -> int:
+        # 共用數據只計算一次
+        return self.registry.report()['total_bytes']
+
+    def _enforce(self, active_session_id: str = None) -> List[str]:
+        actions = [f'釋放閒置數據集 {dataset_hash[:12]}' for dataset_hash in self.registry.sweep()]
+        sessions = self._live_sessions()
+
+        # 目前執行中的 session 不受單一 session 預算限制（否則大於預算的數據集每次執行後都被釋放、下次又重新載入），
+        # 只在超過全域預算時才釋放
+        for session in sessions:
+            if session.session_id != active_session_id and session.usage()['total'] > self.session_budget_bytes:
+                actions.extend(self._spill(session))
+
+        if self._global_total() > self.global_budget_bytes:
+            actions.extend(self._spill_idle())
+            candidates = sorted(
+                sessions, key=lambda session: (session.session_id == active_session_id, session.last_access)
+            )
+            for session in candidates:
+                if self._global_total() <= self.global_budget_bytes:
+                    break
+                actions.extend(self._spill(session))
+
+        return actions
+
+    def _spill(self, session: SessionData) -> List[str]:
+        if not session.release_dataset():
+            return []
+        actions = [f'{session.session_id}: 釋放數據集引用']
+        return actions + self._spill_idle()
+
+    def _spill_idle(self) -> List[str]:
+        freed = self.registry.spill_idle()
+        if not freed:
+            return []
+        self.stats['spills'] += 1
+        self.stats['bytes_spilled'] += freed
+        return [f'未使用的數據集暫存到磁碟（{freed / MB:.1f} MB）']
+
+    def report(self) -> Dict[str, Any]:
+        """所有 session 的用量摘要"""
+        sessions = self._live_sessions()
+        usages = [session.usage()['total'] for session in sessions]
+        registry_report = self.registry.report()
+        return {
+            'sessions': len(sessions),
+            'total_bytes': registry_report['total_bytes'],
+            'max_session_bytes': max(usages, default=0),
+            'spilled_sessions': sum(1 for session in sessions if session.is_spilled),
+            'shared_datasets': registry_report['datasets'],
+            'shared_bytes': registry_report['total_bytes'],
+            'session_budget_bytes': self.session_budget_bytes,
+            'global_budget_bytes': self.global_budget_bytes,
+            **self.stats
+        }
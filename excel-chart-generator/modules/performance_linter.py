@@ -0,0 +1,349 @@
+import ast
+from typing import Dict, Any, List, Optional, Tuple
+
+
+class PerformanceLinter:
+    """以 AST 分析生成代碼中的常見效能問題，並在可行時改寫為採樣或向量化版本"""
+
+    # 超過此行數的散點圖會自動採樣
+    SCATTER_SAMPLE_THRESHOLD = 50000
+    SCATTER_SAMPLE_SIZE = 20000
+    # pairplot 最多保留的欄位數與行數
+    PAIRPLOT_MAX_COLUMNS = 6
+    PAIRPLOT_SAMPLE_SIZE = 5000
+
+    # 粗略的每行成本估計（秒）
+    VECTORIZED_ROW_COST = 5e-9
+    PYTHON_ROW_COST = 2e-6
+    RENDER_POINT_COST = 2e-6
+
+    # 會掃描整個 DataFrame 的向量化操作
+    FULL_SCAN_METHODS = {
+        'groupby', 'sort_values', 'merge', 'pivot_table', 'value_counts',
+        'resample', 'describe', 'corr', 'drop_duplicates', 'to_datetime', 'to_numeric'
+    }
+    # 每列資料繪製一個點的 plotly.express 函數；散點類可以直接採樣，折線類採樣會改變線形，只計入成本
+    PLOTLY_SCATTER_FUNCS = {
+        'scatter', 'scatter_3d', 'scatter_polar', 'scatter_ternary', 'scatter_geo',
+        'scatter_map', 'scatter_mapbox', 'scatter_matrix', 'strip'
+    }
+    PLOTLY_LINE_FUNCS = {'line', 'line_3d', 'line_polar', 'line_ternary', 'line_geo', 'line_map', 'line_mapbox'}
+    PLOTLY_POINT_FUNCS = PLOTLY_SCATTER_FUNCS | PLOTLY_LINE_FUNCS
+
+    def __init__(self, row_count: int, column_count: int, df_name: str = 'df',
+                 scatter_sample_threshold: int = None, scatter_sample_size: int = None,
+                 pairplot_max_columns: int = None):
+        """初始化效能檢查器"""
+        self.row_count = row_count
+        self.column_count = column_count
+        self.df_name = df_name
+        self.scatter_sample_threshold = scatter_sample_threshold or self.SCATTER_SAMPLE_THRESHOLD
+        self.scatter_sample_size = scatter_sample_size or self.SCATTER_SAMPLE_SIZE
+        self.pairplot_max_columns = pairplot_max_columns or self.PAIRPLOT_MAX_COLUMNS
+
+    def analyze(self, code: str) -> Dict[str, Any]:
+        """
+        分析代碼效能
+
+        Args:
+            code: 要分析的 Python 代碼
+
+        Returns:
+            包含問題清單、改寫後代碼、是否需要重新生成與成本估計的字典
+        """
+
+        try:
+            tree = ast.parse(code)
+        except SyntaxError as e:
+            return {
+                'success': False,
+                'error': f'代碼語法錯誤: {str(e)}',
+                'issues': [],
+                'code': code,
+                'rewritten': False,
+                'needs_regeneration': False,
+                'hint': '',
+                'estimated_cost': self._estimate_cost([], 0, 0)
+            }
+
+        issues = self._find_issues(tree)
+
+        # 改寫可自動修正的問題
+        rewritten = False
+        new_code = code
+        if any(issue['fixable'] for issue in issues):
+            rewriter = _SamplingRewriter(self)
+            new_tree = ast.fix_missing_locations(rewriter.visit(tree))
+            if rewriter.changed:
+                new_code = ast.unparse(new_tree)
+                rewritten = True
+                tree = new_tree
+
+        unfixable = [issue for issue in issues if not issue['fixable']]
+        hint = self._build_hint(unfixable)
+
+        full_scans, rendered_points = self._count_work(tree)
+
+        return {
+            'success': True,
+            'issues': issues,
+            'code': new_code,
+            'rewritten': rewritten,
+            'needs_regeneration': bool(unfixable),
+            'hint': hint,
+            'estimated_cost': self._estimate_cost(unfixable, full_scans, rendered_points)
+        }
+
+    def _find_issues(self, tree: ast.AST) -> List[Dict[str, Any]]:
+        """尋找已知的慢速模式"""
+
+        issues = []
+
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+                attr = node.func.attr
+
+                # df.iterrows() / df.itertuples()
+                if attr in ('iterrows', 'itertuples'):
+                    issues.append(self._issue(
+                        node, 'iterrows', False,
+                        f'使用 {attr}() 逐行迭代，請改用向量化運算或 groupby'
+                    ))
+
+                # df.apply(lambda ..., axis=1)
+                elif attr == 'apply' and self._is_row_axis(node):
+                    issues.append(self._issue(
+                        node, 'row_apply', False,
+                        'apply(..., axis=1) 逐行執行 Python 函數，請改用欄位間的向量化運算或 np.where'
+                    ))
+
+                # px.scatter(df, ...) 未採樣
+                elif (self._is_module_call(node, 'px', self.PLOTLY_SCATTER_FUNCS)
+                        and self._uses_raw_df(self._data_arg(node))
+                        and self.row_count > self.scatter_sample_threshold):
+                    issues.append(self._issue(
+                        node, 'unsampled_scatter', True,
+                        f'散點圖直接繪製 {self.row_count} 個點，將自動採樣至 {self.scatter_sample_size} 點'
+                    ))
+
+                # sns.pairplot(df) 寬表
+                elif (self._is_module_call(node, 'sns', {'pairplot'})
+                        and self._uses_raw_df(self._data_arg(node))
+                        and not self._has_keyword(node, 'vars')
+                        and self.column_count > self.pairplot_max_columns):
+                    issues.append(self._issue(
+                        node, 'wide_pairplot', True,
+                        f'pairplot 會產生 {self.column_count}x{self.column_count} 個子圖，將限制為前 {self.pairplot_max_columns} 個數值欄位'
+                    ))
+
+            # for x in df[col]: / for i in range(len(df)):
+            elif isinstance(node, ast.For) and self._is_df_loop(node.iter):
+                issues.append(self._issue(
+                    node, 'column_loop', False,
+                    '使用 Python 迴圈逐一處理欄位值，請改用 Series 的向量化方法'
+                ))
+
+        return sorted(issues, key=lambda issue: issue['line'])
+
+    def _issue(self, node: ast.AST, pattern: str, fixable: bool, message: str) -> Dict[str, Any]:
+        """建立問題記錄"""
+        return {
+            'pattern': pattern,
+            'line': getattr(node, 'lineno', 0),
+            'fixable': fixable,
+            'message': message
+        }
+
+    def _build_hint(self, issues: List[Dict[str, Any]]) -> str:
+        """根據無法自動修正的問題產生重新生成提示"""
+
+        if not issues:
+            return ''
+
+        lines = [f"- 第 {issue['line']} 行: {issue['message']}" for issue in issues]
+        return (
+            f"上一次生成的代碼在 {self.row_count} 行的數據上會非常慢，請避免逐行的 Python 迴圈：\n"
+            + '\n'.join(lines)
+        )
+
+    def _count_work(self, tree: ast.AST) -> Tuple[int, int]:
+        """計算全表掃描次數與預估繪製的點數"""
+
+        full_scans = 0
+        rendered_points = 0
+
+        for node in ast.walk(tree):
+            if not isinstance(node, ast.Call):
+                continue
+
+            if isinstance(node.func, ast.Attribute) and node.func.attr in self.FULL_SCAN_METHODS:
+                full_scans += 1
+
+            if self._is_module_call(node, 'px', self.PLOTLY_POINT_FUNCS):
+                data_arg = self._data_arg(node)
+                if self._uses_raw_df(data_arg):
+                    rendered_points += self.row_count
+                else:
+                    sample_size = self._sample_size(data_arg)
+                    rendered_points += min(sample_size or self.row_count, self.row_count)
+
+        return full_scans, rendered_points
+
+    def _estimate_cost(self, slow_issues: List[Dict[str, Any]], full_scans: int,
+                       rendered_points: int) -> Dict[str, Any]:
+        """粗略估計執行成本"""
+
+        python_row_ops = len(slow_issues) * self.row_count
+        vectorized_row_ops = max(full_scans, 1) * self.row_count
+
+        seconds = (
+            python_row_ops * self.PYTHON_ROW_COST
+            + vectorized_row_ops * self.VECTORIZED_ROW_COST
+            + rendered_points * self.RENDER_POINT_COST
+        )
+
+        if seconds < 1:
+            level = 'low'
+        elif seconds < 10:
+            level = 'medium'
+        else:
+            level = 'high'
+
+        return {
+            'python_row_ops': python_row_ops,
+            'vectorized_row_ops': vectorized_row_ops,
+            'rendered_points': rendered_points,
+            'estimated_seconds': round(seconds, 3),
+            'level': level
+        }
+
+    # ---- AST 判斷輔助 ----
+
+    def _is_module_call(self, node: ast.Call, alias: str, funcs) -> bool:
+        """判斷是否為 alias.func(...) 形式的呼叫"""
+        func = node.func
+        return (
+            isinstance(func, ast.Attribute)
+            and isinstance(func.value, ast.Name)
+            and func.value.id == alias
+            and func.attr in funcs
+        )
+
+    def _data_arg(self, node: ast.Call) -> Optional[ast.AST]:
+        """取得繪圖函數的數據參數"""
+        for keyword in node.keywords:
+            if keyword.arg in ('data_frame', 'data'):
+                return keyword.value
+        return node.args[0] if node.args else None
+
+    def _uses_raw_df(self, node: Optional[ast.AST]) -> bool:
+        """判斷參數是否為未經過濾或採樣的 df"""
+        return isinstance(node, ast.Name) and node.id == self.df_name
+
+    def _sample_size(self, node: Optional[ast.AST]) -> Optional[int]:
+        """取得 df.sample(n=...) 的採樣數"""
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'sample'):
+            return None
+
+        size_node = node.args[0] if node.args else None
+        for keyword in node.keywords:
+            if keyword.arg == 'n':
+                size_node = keyword.value
+
+        # n=min(20000, len(df)) 形式
+        if isinstance(size_node, ast.Call) and isinstance(size_node.func, ast.Name) and size_node.func.id == 'min':
+            constants = [arg.value for arg in size_node.args if isinstance(arg, ast.Constant)]
+            return min(constants) if constants else None
+
+        if isinstance(size_node, ast.Constant) and isinstance(size_node.value, int):
+            return size_node.value
+
+        return None
+
+    def _has_keyword(self, node: ast.Call, name: str) -> bool:
+        """判斷呼叫是否包含指定的關鍵字參數"""
+        return any(keyword.arg == name for keyword in node.keywords)
+
+    def _is_row_axis(self, node: ast.Call) -> bool:
+        """判斷 apply 是否沿著列（axis=1）執行"""
+        for keyword in node.keywords:
+            if keyword.arg == 'axis' and isinstance(keyword.value, ast.Constant):
+                return keyword.value.value in (1, 'columns')
+        return False
+
+    def _is_df_loop(self, node: ast.AST) -> bool:
+        """判斷迴圈是否在逐一走訪 df 的欄位值或行號"""
+
+        # 去掉 .values / .tolist() / .items() 等包裝
+        while True:
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+                if node.func.attr in ('tolist', 'items', 'to_list', 'to_numpy'):
+                    node = node.func.value
+                    continue
+            if isinstance(node, ast.Attribute) and node.attr == 'values':
+                node = node.value
+                continue
+            break
+
+        # df[col]
+        if isinstance(node, ast.Subscript) and self._uses_raw_df(node.value):
+            return True
+
+        # range(len(df))
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'range'
+                and node.args and isinstance(node.args[-1], ast.Call)
+                and isinstance(node.args[-1].func, ast.Name) and node.args[-1].func.id == 'len'
+                and node.args[-1].args and self._uses_raw_df(node.args[-1].args[0])):
+            return True
+
+        return False
+
+
+class _SamplingRewriter(ast.NodeTransformer):
+    """將大型散點圖與寬表 pairplot 改寫為採樣版本"""
+
+    def __init__(self, linter: PerformanceLinter):
+        self.linter = linter
+        self.changed = False
+
+    def visit_Call(self, node: ast.Call) -> ast.AST:
+        self.generic_visit(node)
+        linter = self.linter
+
+        if (linter._is_module_call(node, 'px', linter.PLOTLY_SCATTER_FUNCS)
+                and linter._uses_raw_df(linter._data_arg(node))
+                and linter.row_count > linter.scatter_sample_threshold):
+            self._replace_data_arg(node, self._sample_expr(linter.scatter_sample_size))
+            self.changed = True
+
+        elif (linter._is_module_call(node, 'sns', {'pairplot'})
+                and linter._uses_raw_df(linter._data_arg(node))
+                and not linter._has_keyword(node, 'vars')
+                and linter.column_count > linter.pairplot_max_columns):
+            # 保留 hue 等參數，只限制繪製的數值欄位
+            vars_expr = ast.parse(
+                f"{linter.df_name}.select_dtypes('number').columns[:{linter.pairplot_max_columns}].tolist()",
+                mode='eval'
+            ).body
+            node.keywords.append(ast.keyword(arg='vars', value=vars_expr))
+            if linter.row_count > linter.PAIRPLOT_SAMPLE_SIZE:
+                self._replace_data_arg(node, self._sample_expr(linter.PAIRPLOT_SAMPLE_SIZE))
+            self.changed = True
+
+        return node
+
+    def _sample_expr(self, size: int) -> ast.AST:
+        """建立 df.sample(n=size, random_state=42) 表達式（只在行數大於 size 時使用）"""
+        return ast.parse(
+            f"{self.linter.df_name}.sample(n={size}, random_state=42)",
+            mode='eval'
+        ).body
+
+    def _replace_data_arg(self, node: ast.Call, new_value: ast.AST) -> None:
+        """替換呼叫中的數據參數"""
+        for keyword in node.keywords:
+            if keyword.arg in ('data_frame', 'data'):
+                keyword.value = new_value
+                return
+        if node.args:
+            node.args[0] = new_value
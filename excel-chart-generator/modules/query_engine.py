@@ -0,0 +1,267 @@
+import os
+import threading
+import uuid
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, Any, Callable, Optional, Union
+
+import pandas as pd
+
+from modules.tracing import span
+
+# 查詢結果最多轉成 pandas 的行數（超過時要求先在 SQL 中聚合）
+DEFAULT_MAX_RESULT_ROWS = 200000
+
+# 生成代碼中使用的資料表名稱
+TABLE_NAME = 'data'
+
+
+def load_duckdb():
+    """載入選用的 duckdb；未安裝或無法載入時回傳 None"""
+    try:
+        import duckdb
+    except ImportError:
+        return None
+    return duckdb
+
+
+def _quote_identifier(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class QueryEngine:
+    """
+    單一數據集的 DuckDB 查詢引擎（以 db 注入生成代碼的執行環境）
+
+    數據存放在磁碟上的欄式資料庫檔案，聚合在引擎內以多核心向量化執行，
+    超過記憶體上限時由 DuckDB 暫存到磁碟；只有聚合後的小結果才轉為 pandas。
+    資料庫以唯讀、禁止存取外部檔案的方式開啟，生成的 SQL 只能查詢 data 表。
+    """
+
+    def __init__(self, db_path: Union[str, Path], max_result_rows: int = DEFAULT_MAX_RESULT_ROWS,
+                 threads: int = None, memory_limit: str = None, temp_directory: Union[str, Path] = None):
+        """
+        Args:
+            db_path: 已建立的資料庫檔案（見 build_database）
+            max_result_rows: sql() 最多回傳的行數
+            threads: DuckDB 使用的執行緒數（None 表示全部核心）
+            memory_limit: DuckDB 記憶體上限（例如 '2GB'）
+            temp_directory: 超過記憶體上限時的暫存目錄
+        """
+
+        duckdb = load_duckdb()
+        if duckdb is None:
+            raise ImportError('需要安裝 duckdb 才能使用查詢引擎')
+
+        config = {'access_mode': 'READ_ONLY', 'enable_external_access': False}
+        if threads:
+            config['threads'] = threads
+        if memory_limit:
+            config['memory_limit'] = memory_limit
+        if temp_directory:
+            config['temp_directory'] = str(temp_directory)
+
+        self.db_path = Path(db_path)
+        self.max_result_rows = max_result_rows
+        self.table = TABLE_NAME
+        self._con = duckdb.connect(str(self.db_path), read_only=True, config=config)
+        self._lock = threading.Lock()
+        self.columns = [row[0] for row in self._con.execute(f'DESCRIBE {TABLE_NAME}').fetchall()]
+        self.row_count = self._con.execute(f'SELECT COUNT(*) FROM {TABLE_NAME}').fetchone()[0]
+
+    def sql(self, query: str) -> pd.DataFrame:
+        """
+        執行 SQL 並把結果轉為 DataFrame
+
+        Args:
+            query: SELECT 查詢（資料表為 data）
+
+        Raises:
+            ValueError: 結果超過 max_result_rows 行（請先 GROUP BY、篩選或 USING SAMPLE）
+        """
+
+        with self._lock:
+            # 每次查詢使用獨立的 cursor，多個執行緒可同時查詢
+            cursor = self._con.cursor()
+        try:
+            with span('query_engine.sql', query_chars=len(query)) as query_span:
+                result = cursor.sql(query.strip().rstrip(';'))
+                if result is None:
+                    raise ValueError('db.sql 只接受 SELECT 查詢')
+                df = result.limit(self.max_result_rows + 1).df()
+                query_span.set_attribute('rows', len(df))
+        finally:
+            cursor.close()
+
+        if len(df) > self.max_result_rows:
+            raise ValueError(
+                f'查詢結果超過 {self.max_result_rows} 行，請先在 SQL 中聚合（GROUP BY）、篩選或取樣（USING SAMPLE）'
+            )
+        return df
+
+    def describe(self) -> Dict[str, Any]:
+        """提示詞用的摘要"""
+        return {'table': self.table, 'columns': self.columns, 'row_count': self.row_count,
+                'max_result_rows': self.max_result_rows}
+
+    def close(self) -> None:
+        with self._lock:
+            self._con.close()
+
+    def __repr__(self) -> str:
+        return f'<QueryEngine table={self.table} rows={self.row_count} columns={len(self.columns)}>'
+
+
+def build_database(db_path: Union[str, Path], source_path: Union[str, Path] = None,
+                   df_loader: Callable[[], pd.DataFrame] = None) -> Path:
+    """
+    將原始檔案匯入 DuckDB 資料庫檔案（已存在時直接重用）
+
+    CSV 由 DuckDB 直接平行讀取，不經過 pandas；
+    Excel 或 DuckDB 無法讀取的 CSV（例如非 UTF-8 編碼）改由 df_loader 載入後匯入。
+
+    Args:
+        db_path: 資料庫檔案路徑
+        source_path: 原始檔案
+        df_loader: 載入 DataFrame 的函數（無法直接讀取原始檔案時使用）
+
+    Returns:
+        資料庫檔案路徑
+    """
+
+    db_path = Path(db_path)
+    if db_path.exists():
+        return db_path
+
+    duckdb = load_duckdb()
+    if duckdb is None:
+        raise ImportError('需要安裝 duckdb 才能使用查詢引擎')
+
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    # 先寫入暫存檔再改名，避免其他 session 或實例讀到寫到一半的資料庫
+    temp_path = db_path.with_name(f'{db_path.name}.{uuid.uuid4().hex[:8]}.tmp')
+    con = duckdb.connect(str(temp_path))
+    try:
+        imported = False
+        if source_path is not None and Path(source_path).suffix.lower() in ('.csv', '.parquet'):
+            reader = 'read_parquet' if Path(source_path).suffix.lower() == '.parquet' else 'read_csv_auto'
+            literal = "'" + str(source_path).replace("'", "''") + "'"
+            try:
+                with span('query_engine.import', source=reader):
+                    con.execute(f'CREATE TABLE {TABLE_NAME} AS SELECT * FROM {reader}({literal})')
+                imported = True
+            except duckdb.Error:
+                if df_loader is None:
+                    raise
+
+        if not imported:
+            if df_loader is None:
+                raise ValueError(f'無法匯入 {source_path}')
+            with span('query_engine.import', source='dataframe'):
+                source_df = df_loader()
+                con.register('source_df', source_df)
+                con.execute(f'CREATE TABLE {TABLE_NAME} AS SELECT * FROM source_df')
+                con.unregister('source_df')
+
+        # 與 read_data_file 一致：移除欄位名稱前後的空白
+        for name, in con.execute(f'SELECT column_name FROM (DESCRIBE {TABLE_NAME})').fetchall():
+            if name != name.strip():
+                con.execute(
+                    f'ALTER TABLE {TABLE_NAME} RENAME COLUMN {_quote_identifier(name)} TO {_quote_identifier(name.strip())}'
+                )
+        con.execute('CHECKPOINT')
+    except BaseException:
+        con.close()
+        for path in (temp_path, temp_path.with_name(temp_path.name + '.wal')):
+            if path.exists():
+                path.unlink()
+        raise
+    con.close()
+
+    temp_path.replace(db_path)
+    return db_path
+
+
+class QueryEngineCache:
+    """
+    每個數據集一個查詢引擎（跨 session 共用，同一數據集只匯入一次）
+
+    資料庫檔案以內容雜湊命名，重新啟動或其他實例掛載同一目錄時可直接重用。
+    """
+
+    def __init__(self, cache_dir: Union[str, Path], max_result_rows: int = DEFAULT_MAX_RESULT_ROWS,
+                 threads: int = None, memory_limit: str = None):
+        """
+        Args:
+            cache_dir: 資料庫檔案存放目錄
+            max_result_rows: db.sql() 最多回傳的行數
+            threads: 每個引擎使用的執行緒數
+            memory_limit: 每個引擎的記憶體上限（例如 '2GB'）
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_result_rows = max_result_rows
+        self.threads = threads
+        self.memory_limit = memory_limit
+        self._engines: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {'built': 0, 'reused': 0, 'failed': 0}
+
+    @classmethod
+    def from_env(cls) -> Optional['QueryEngineCache']:
+        """
+        從環境變數建立；QUERY_ENGINE 不是 duckdb 或未安裝 duckdb 時回傳 None
+
+        讀取 QUERY_ENGINE_DIR、QUERY_ENGINE_MAX_ROWS、QUERY_ENGINE_THREADS、QUERY_ENGINE_MEMORY_LIMIT。
+        """
+        if os.getenv('QUERY_ENGINE', '').lower() != 'duckdb' or load_duckdb() is None:
+            return None
+        threads = os.getenv('QUERY_ENGINE_THREADS')
+        return cls(
+            os.getenv('QUERY_ENGINE_DIR', 'query_cache'),
+            max_result_rows=int(os.getenv('QUERY_ENGINE_MAX_ROWS', DEFAULT_MAX_RESULT_ROWS)),
+            threads=int(threads) if threads else None,
+            memory_limit=os.getenv('QUERY_ENGINE_MEMORY_LIMIT') or None
+        )
+
+    def get(self, dataset_hash: str, source_path: Union[str, Path] = None,
+            df_loader: Callable[[], pd.DataFrame] = None) -> Optional[QueryEngine]:
+        """
+        取得數據集的查詢引擎（必要時匯入；失敗時回傳 None，生成的代碼改用 df）
+
+        Args:
+            dataset_hash: 數據集雜湊
+            source_path: 原始檔案
+            df_loader: 無法直接讀取原始檔案時載入 DataFrame 的函數
+        """
+
+        with self._lock:
+            future = self._engines.get(dataset_hash)
+            owner = future is None
+            if owner:
+                future = self._engines[dataset_hash] = Future()
+
+        if owner:
+            db_path = self.cache_dir / f'{dataset_hash}.duckdb'
+            try:
+                with span('query_engine.build', dataset=dataset_hash[:12]):
+                    reused = db_path.exists()
+                    build_database(db_path, source_path, df_loader)
+                    engine = QueryEngine(
+                        db_path, max_result_rows=self.max_result_rows, threads=self.threads,
+                        memory_limit=self.memory_limit, temp_directory=self.cache_dir / 'tmp'
+                    )
+            except Exception as e:
+                with self._lock:
+                    self.stats['failed'] += 1
+                future.set_exception(e)
+            else:
+                with self._lock:
+                    self.stats['reused' if reused else 'built'] += 1
+                future.set_result(engine)
+
+        # 匯入失敗的數據集不再重試（直到重新啟動）
+        return future.result() if future.exception() is None else None
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'engines': len(self._engines), **self.stats}
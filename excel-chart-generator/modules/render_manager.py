@@ -0,0 +1,165 @@
+import ast
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Tuple
+
+import matplotlib
+import matplotlib.pyplot as plt
+
+# pyplot 的全域圖表註冊表與 rcParams 不是執行緒安全的，使用 matplotlib 的代碼需要序列化執行
+_PYPLOT_LOCK = threading.RLock()
+
+# 代碼中出現這些名稱時會經過 pyplot
+_PYPLOT_NAMES = {'plt', 'sns', 'matplotlib'}
+# pandas 透過 matplotlib 繪圖的存取方式（df.plot()、df.plot.bar()、df.hist()、pd.plotting 等）與 st.pyplot
+_PYPLOT_ATTRIBUTES = {'plot', 'hist', 'boxplot', 'plotting', 'pyplot'}
+
+
+def ensure_agg_backend() -> None:
+    """強制使用非互動式的 Agg 後端"""
+    if matplotlib.get_backend().lower() != 'agg':
+        plt.switch_backend('Agg')
+
+
+def uses_pyplot(code: str) -> bool:
+    """判斷代碼是否可能透過 pyplot 繪圖（無法解析時視為會使用）"""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return True
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id in _PYPLOT_NAMES:
+            return True
+        if isinstance(node, ast.Attribute) and node.attr in _PYPLOT_ATTRIBUTES:
+            return True
+    return False
+
+
+class RenderManager:
+    """管理 matplotlib/seaborn 圖表的生命週期：固定 Agg 後端、限制解析度、關閉執行期間建立的圖表"""
+
+    MAX_DPI = 100
+    MAX_FIGSIZE = (16.0, 10.0)
+    # 單一 artist 的點數超過此值時改為點陣化
+    RASTERIZE_THRESHOLD = 5000
+
+    # 累計統計（跨 session）
+    _stats_lock = threading.Lock()
+    _stats = {'executions': 0, 'figures_created': 0, 'figures_leaked': 0, 'artists_rasterized': 0}
+
+    def __init__(self, max_dpi: int = None, max_figsize: Tuple[float, float] = None,
+                 rasterize_threshold: int = None):
+        """初始化渲染管理器"""
+        self.max_dpi = max_dpi or self.MAX_DPI
+        self.max_figsize = max_figsize or self.MAX_FIGSIZE
+        self.rasterize_threshold = rasterize_threshold or self.RASTERIZE_THRESHOLD
+        self.report = self._empty_report()
+        self._shown = set()
+        ensure_agg_backend()
+
+    def _empty_report(self) -> Dict[str, Any]:
+        return {
+            'figures_created': 0,
+            'figures_leaked': 0,
+            'artists_rasterized': 0,
+            'open_figures': len(plt.get_fignums())
+        }
+
+    @contextmanager
+    def session(self, code: str = None):
+        """
+        包住一次代碼執行：套用解析度上限，結束時關閉執行期間建立的所有圖表
+
+        使用 pyplot 的代碼在執行期間持有全域鎖，期間新增到 pyplot 註冊表的圖表只可能來自這次執行；
+        不使用 pyplot 的代碼（例如只用 plotly）不取得鎖、可以並行，也不碰 pyplot 的全域狀態。
+
+        Args:
+            code: 要執行的代碼（未提供時視為會使用 pyplot）
+        """
+
+        self.report = self._empty_report()
+        self._shown = set()
+        if code is not None and not uses_pyplot(code):
+            with self._stats_lock:
+                RenderManager._stats['executions'] += 1
+            yield self
+            return
+
+        _PYPLOT_LOCK.acquire()
+        before = set(plt.get_fignums())
+
+        try:
+            rc = {
+                'figure.dpi': self.max_dpi,
+                'savefig.dpi': self.max_dpi,
+                'figure.figsize': self._clamp_size(plt.rcParams['figure.figsize'])
+            }
+            with plt.rc_context(rc):
+                yield self
+        finally:
+            created = [num for num in plt.get_fignums() if num not in before]
+            # 執行期間建立的圖表一律關閉；沒有交給 st.pyplot 顯示的才算洩漏
+            for num in created:
+                plt.close(num)
+
+            self.report['figures_leaked'] = len([num for num in created if num not in self._shown])
+            self.report['figures_created'] = max(self.report['figures_created'], len(created))
+            self.report['open_figures'] = len(plt.get_fignums())
+
+            with self._stats_lock:
+                stats = RenderManager._stats
+                stats['executions'] += 1
+                stats['figures_created'] += self.report['figures_created']
+                stats['figures_leaked'] += self.report['figures_leaked']
+                stats['artists_rasterized'] += self.report['artists_rasterized']
+
+            _PYPLOT_LOCK.release()
+
+    def prepare_figure(self, fig) -> None:
+        """在顯示前限制圖表尺寸與解析度，並將高密度的 artist 點陣化"""
+
+        width, height = fig.get_size_inches()
+        max_width, max_height = self.max_figsize
+        if width > max_width or height > max_height:
+            fig.set_size_inches(*self._clamp_size((width, height)))
+
+        if fig.get_dpi() > self.max_dpi:
+            fig.set_dpi(self.max_dpi)
+
+        for ax in fig.axes:
+            for line in ax.lines:
+                if len(line.get_xdata()) > self.rasterize_threshold and not line.get_rasterized():
+                    line.set_rasterized(True)
+                    self.report['artists_rasterized'] += 1
+
+            for collection in ax.collections:
+                size = max(len(collection.get_offsets()), len(collection.get_paths()))
+                if size > self.rasterize_threshold and not collection.get_rasterized():
+                    collection.set_rasterized(True)
+                    self.report['artists_rasterized'] += 1
+
+        self.report['figures_created'] += 1
+        if getattr(fig, 'number', None) is not None:
+            self._shown.add(fig.number)
+
+    def clamp_dpi(self, dpi) -> int:
+        """限制輸出 DPI"""
+        if dpi is None:
+            return self.max_dpi
+        return min(int(dpi), self.max_dpi)
+
+    def _clamp_size(self, size) -> Tuple[float, float]:
+        """等比例縮小尺寸至上限內"""
+        width, height = size
+        max_width, max_height = self.max_figsize
+        scale = min(1.0, max_width / width if width else 1.0, max_height / height if height else 1.0)
+        return (width * scale, height * scale)
+
+    @classmethod
+    def get_stats(cls) -> Dict[str, Any]:
+        """取得累計的渲染統計與目前 pyplot 註冊表中的圖表數"""
+        with cls._stats_lock:
+            stats = dict(cls._stats)
+        stats['open_figures'] = len(plt.get_fignums())
+        return stats
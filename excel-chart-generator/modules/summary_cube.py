@@ -0,0 +1,179 @@
+import pandas as pd
+import numpy as np
+from typing import Dict, List, Any, Optional
+
+from modules.downsampling import histogram_bins, MAX_SCATTER_POINTS
+from modules.file_loader import parse_dates
+
+
+class SummaryCube:
+    """預先計算的小型聚合立方體，讓後備圖表不需要再掃描整個 DataFrame"""
+
+    MAX_CATEGORICAL_COLUMNS = 3
+    MAX_DATETIME_COLUMNS = 2
+    MAX_NUMERIC_COLUMNS = 5
+    TOP_CATEGORIES = 20
+    MAX_TIME_BUCKETS = 500
+    # 由細到粗的時間分桶頻率
+    TIME_FREQUENCIES = ['h', 'D', 'W', 'MS', 'QS', 'YS']
+
+    def __init__(self, df: pd.DataFrame, column_types: Dict[str, List[str]]):
+        """初始化聚合立方體"""
+        self.df = df
+        self.column_types = column_types
+        self._numeric_cache = {}
+
+    def build(self) -> Dict[str, Any]:
+        """
+        建立聚合立方體
+
+        Returns:
+            包含類別聚合、時間分桶聚合、直方圖分箱與散點樣本的字典（只含基本型別，可序列化）
+        """
+
+        numeric_cols = self.column_types.get('numeric', [])[:self.MAX_NUMERIC_COLUMNS]
+        categorical_cols = self.column_types.get('categorical', [])[:self.MAX_CATEGORICAL_COLUMNS]
+        datetime_cols = self.column_types.get('datetime', [])[:self.MAX_DATETIME_COLUMNS]
+
+        cube = {
+            'categorical': {},
+            'time': {},
+            'histograms': {},
+            'scatter': None
+        }
+
+        for col in categorical_cols:
+            cube['categorical'][col] = self._build_categorical(col, numeric_cols)
+
+        for col in datetime_cols:
+            time_agg = self._build_time(col, numeric_cols)
+            if time_agg is not None:
+                cube['time'][col] = time_agg
+
+        for col in numeric_cols:
+            hist = histogram_bins(self._numeric(col))
+            cube['histograms'][col] = {
+                'bin_start': hist['bin_start'].tolist(),
+                'bin_end': hist['bin_end'].tolist(),
+                'count': hist['count'].tolist()
+            }
+
+        if len(numeric_cols) >= 2:
+            cube['scatter'] = self._build_scatter(numeric_cols[0], numeric_cols[1])
+
+        return cube
+
+    def _numeric(self, col: str) -> pd.Series:
+        """取得轉換為數值的欄位（處理貨幣符號、千分位和百分比）"""
+
+        if col not in self._numeric_cache:
+            series = self.df[col]
+            if not pd.api.types.is_numeric_dtype(series):
+                cleaned = series.astype(str).str.replace(r'[\s$¥€£,%]', '', regex=True)
+                series = pd.to_numeric(cleaned, errors='coerce')
+            self._numeric_cache[col] = series
+        return self._numeric_cache[col]
+
+    def _build_categorical(self, cat_col: str, numeric_cols: List[str]) -> Dict[str, Any]:
+        """計算前幾個類別的 count/sum/mean"""
+
+        counts = self.df[cat_col].value_counts()
+        top_categories = counts.head(self.TOP_CATEGORIES).index
+
+        result = {
+            'unique_count': int(len(counts)),
+            'categories': [str(value) for value in top_categories],
+            'count': counts.head(self.TOP_CATEGORIES).astype(int).tolist(),
+            'numeric': {}
+        }
+
+        if not numeric_cols:
+            return result
+
+        mask = self.df[cat_col].isin(top_categories)
+        numeric_df = pd.DataFrame({col: self._numeric(col)[mask] for col in numeric_cols})
+        grouped = numeric_df.groupby(self.df.loc[mask, cat_col]).agg(['count', 'sum', 'mean'])
+        grouped = grouped.reindex(top_categories)
+
+        for col in numeric_cols:
+            result['numeric'][col] = {
+                'count': grouped[(col, 'count')].fillna(0).astype(int).tolist(),
+                'sum': self._to_list(grouped[(col, 'sum')]),
+                'mean': self._to_list(grouped[(col, 'mean')])
+            }
+
+        return result
+
+    def _build_time(self, date_col: str, numeric_cols: List[str]) -> Optional[Dict[str, Any]]:
+        """依資料跨度選擇時間分桶，計算各數值欄位的聚合"""
+
+        # 同一欄可能混用多種日期格式，無法解析的列不計入
+        dates = parse_dates(self.df[date_col])
+        valid = dates.notna()
+        if not valid.any():
+            return None
+
+        span = dates[valid].max() - dates[valid].min()
+        freq = self._choose_frequency(span)
+
+        numeric_df = pd.DataFrame({col: self._numeric(col)[valid] for col in numeric_cols})
+        numeric_df.index = dates[valid]
+        numeric_df['__rows__'] = 1
+        resampled = numeric_df.resample(freq)
+
+        counts = resampled['__rows__'].sum()
+        result = {
+            'freq': freq,
+            'period': [period.isoformat() for period in counts.index],
+            'rows': counts.astype(int).tolist(),
+            'numeric': {}
+        }
+
+        if numeric_cols:
+            agg = resampled[numeric_cols].agg(['sum', 'mean', 'min', 'max'])
+            for col in numeric_cols:
+                result['numeric'][col] = {
+                    stat: self._to_list(agg[(col, stat)]) for stat in ('sum', 'mean', 'min', 'max')
+                }
+
+        return result
+
+    def _choose_frequency(self, span: pd.Timedelta) -> str:
+        """選擇讓分桶數不超過上限的最細頻率"""
+
+        approx_bucket = {
+            'h': pd.Timedelta(hours=1),
+            'D': pd.Timedelta(days=1),
+            'W': pd.Timedelta(weeks=1),
+            'MS': pd.Timedelta(days=30),
+            'QS': pd.Timedelta(days=91),
+            'YS': pd.Timedelta(days=365)
+        }
+
+        for freq in self.TIME_FREQUENCIES:
+            if span / approx_bucket[freq] <= self.MAX_TIME_BUCKETS:
+                return freq
+        return self.TIME_FREQUENCIES[-1]
+
+    def _build_scatter(self, x_col: str, y_col: str) -> Dict[str, Any]:
+        """保存第一組數值欄位的散點樣本"""
+
+        data = pd.DataFrame({x_col: self._numeric(x_col), y_col: self._numeric(y_col)}).dropna()
+        total_points = len(data)
+        sampled = total_points > MAX_SCATTER_POINTS
+        if sampled:
+            data = data.sample(n=MAX_SCATTER_POINTS, random_state=42)
+
+        return {
+            'x': x_col,
+            'y': y_col,
+            'x_values': self._to_list(data[x_col]),
+            'y_values': self._to_list(data[y_col]),
+            'sampled': sampled,
+            'total_points': int(total_points)
+        }
+
+    def _to_list(self, series: pd.Series) -> List[Any]:
+        """轉為 list，NaN 轉為 None"""
+        values = series.astype(float).to_numpy()
+        return [None if np.isnan(value) else float(value) for value in values]
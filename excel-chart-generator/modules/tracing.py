@@ -0,0 +1,249 @@
+import functools
+import itertools
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional, Tuple
+
+# 秒；涵蓋從毫秒級的驗證到數十秒的 Gemini 呼叫
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_PREFIX = 'chart_pipeline'
+
+_current_span: ContextVar[Optional['Span']] = ContextVar('current_span', default=None)
+
+
+class Span:
+    """一段計時區間；可附加數據大小等屬性"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, name: str, parent: Optional['Span'] = None, attributes: Dict[str, Any] = None):
+        self.name = name
+        self.span_id = next(self._ids)
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self.depth = parent.depth + 1 if parent else 0
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        self.duration = None
+        self.status = 'ok'
+        self.error = None
+        self.children: List['Span'] = []
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'span_id': self.span_id,
+            'trace_id': self.trace_id,
+            'depth': self.depth,
+            'start_time': self.start_time,
+            'duration': self.duration,
+            'status': self.status,
+            'error': self.error,
+            'attributes': self.attributes
+        }
+
+    def flatten(self) -> List[Dict[str, Any]]:
+        """依開始順序展開成清單（含子區間）"""
+        spans = [self.to_dict()]
+        for child in self.children:
+            spans.extend(child.flatten())
+        return spans
+
+
+class Histogram:
+    """累積型直方圖（Prometheus 語意：bucket 計數包含所有 <= le 的觀測值）"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        total = 0
+        result = []
+        for bound, count in zip(list(self.buckets) + [math.inf], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class Tracer:
+    """行程內的追蹤器：記錄每個階段的耗時直方圖、計數器與最近的追蹤"""
+
+    def __init__(self, max_traces: int = 50, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Histogram] = {}
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._traces = deque(maxlen=max_traces)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        記錄一個階段
+
+        用法：
+            with tracer.span('analyze', rows=len(df)) as span:
+                ...
+                span.set_attribute('columns', n)
+        """
+
+        parent = _current_span.get()
+        span = Span(name, parent, attributes)
+        if parent is not None:
+            parent.children.append(span)
+        token = _current_span.set(span)
+
+        try:
+            yield span
+        except BaseException as e:
+            span.status = 'error'
+            span.error = f'{type(e).__name__}: {str(e)}'
+            raise
+        finally:
+            span.duration = time.perf_counter() - span._started
+            _current_span.reset(token)
+            self._record(span)
+
+    def _record(self, span: Span) -> None:
+        with self._lock:
+            histogram = self._histograms.get(span.name)
+            if histogram is None:
+                histogram = self._histograms[span.name] = Histogram(self.buckets)
+            histogram.observe(span.duration)
+
+            if span.status == 'error':
+                key = ('stage_errors_total', (('stage', span.name),))
+                self._counters[key] = self._counters.get(key, 0) + 1
+
+            if span.parent is None:
+                self._traces.append(span)
+
+    def increment(self, name: str, value: float = 1, **labels) -> None:
+        """累加計數器（例如 Gemini 嘗試次數）"""
+        key = (name, tuple(sorted((label, str(label_value)) for label, label_value in labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def current_span(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def recent_traces(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """最近完成的追蹤（新的在前），每個追蹤為展開後的區間清單"""
+        with self._lock:
+            traces = list(self._traces)[-limit:]
+        return [trace.flatten() for trace in reversed(traces)]
+
+    def stage_summary(self) -> List[Dict[str, Any]]:
+        """各階段的次數、平均與總耗時"""
+        with self._lock:
+            items = [(name, histogram.count, histogram.sum) for name, histogram in self._histograms.items()]
+        return [
+            {'stage': name, 'count': count, 'total_seconds': round(total, 4),
+             'mean_seconds': round(total / count, 4) if count else 0.0}
+            for name, count, total in sorted(items)
+        ]
+
+    def export_prometheus(self) -> str:
+        """以 Prometheus text exposition 格式輸出"""
+
+        with self._lock:
+            histograms = {
+                name: (histogram.cumulative(), histogram.sum, histogram.count)
+                for name, histogram in self._histograms.items()
+            }
+            counters = dict(self._counters)
+
+        metric = f'{METRIC_PREFIX}_stage_duration_seconds'
+        lines = [
+            f'# HELP {metric} Duration of chart pipeline stages.',
+            f'# TYPE {metric} histogram'
+        ]
+        for name in sorted(histograms):
+            buckets, total, count = histograms[name]
+            stage = _escape_label(name)
+            for bound, cumulative in buckets:
+                le = '+Inf' if math.isinf(bound) else repr(float(bound))
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{stage="{stage}"}} {total}')
+            lines.append(f'{metric}_count{{stage="{stage}"}} {count}')
+
+        for counter_name in sorted({name for name, _ in counters}):
+            metric = f'{METRIC_PREFIX}_{counter_name}'
+            if not metric.endswith('_total'):
+                metric += '_total'
+            lines.append(f'# TYPE {metric} counter')
+            for (name, labels), value in sorted(counters.items()):
+                if name != counter_name:
+                    continue
+                label_text = ','.join(f'{label}="{_escape_label(label_value)}"' for label, label_value in labels)
+                lines.append(f'{metric}{{{label_text}}} {value}' if label_text else f'{metric} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._traces.clear()
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# 行程內共用的追蹤器
+_TRACER = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """取得行程內共用的追蹤器"""
+    return _TRACER
+
+
+def span(name: str, **attributes):
+    """在共用追蹤器上記錄一個階段"""
+    return _TRACER.span(name, **attributes)
+
+
+def set_attributes(**attributes) -> None:
+    """在目前的區間上附加屬性（沒有進行中的區間時忽略）"""
+    current = _current_span.get()
+    if current is not None:
+        current.set_attributes(**attributes)
+
+
+def traced(name: str):
+    """以裝飾器形式記錄整個函數的耗時"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _TRACER.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
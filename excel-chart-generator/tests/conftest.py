@@ -0,0 +1,35 @@
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# 以專案根目錄匯入 modules 與入口程式
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+# 同一欄混用的日期格式
+MIXED_DATE_FORMATS = ['%Y-%m-%d', '%m/%d/%Y', '%d %b %Y']
+
+
+@pytest.fixture
+def mixed_dates_df():
+    """300 天、每天三列（各用一種日期格式），value 為 0..899"""
+    days = pd.date_range('2020-01-01', periods=300, freq='D')
+    dates = [day.strftime(fmt) for fmt in MIXED_DATE_FORMATS for day in days]
+    return pd.DataFrame({'date': dates, 'value': np.arange(len(dates), dtype=float)})
+
+
+@pytest.fixture
+def sales_df():
+    """常見的銷售數據：數值、類別與日期欄位"""
+    rng = np.random.default_rng(0)
+    rows = 200
+    return pd.DataFrame({
+        'order_date': pd.date_range('2023-01-01', periods=rows, freq='D').strftime('%Y-%m-%d'),
+        'region': rng.choice(['North', 'South', 'East', 'West'], size=rows),
+        'price': rng.normal(100, 15, size=rows).round(2),
+        'quantity': rng.integers(1, 20, size=rows),
+    })
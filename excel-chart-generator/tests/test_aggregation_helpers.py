@@ -0,0 +1,48 @@
+import pandas as pd
+
+from modules.aggregation_helpers import AggregationCache, AggregationHelpers, resample
+
+
+def test_resample_mixed_date_formats(mixed_dates_df):
+    result = resample(mixed_dates_df, 'date', 'value', 'D', 'sum')
+    assert len(result) == 300
+    assert result['value'].sum() == mixed_dates_df['value'].sum()
+    # 每天三列：i、i+300、i+600
+    assert result['value'].iloc[0] == 0 + 300 + 600
+
+
+def test_resample_drops_unparseable_dates():
+    df = pd.DataFrame({'date': ['2020-01-01', 'bad', '01/02/2020'], 'value': [1.0, 2.0, 3.0]})
+    result = resample(df, 'date', 'value', 'D', 'sum')
+    assert result['date'].tolist() == [pd.Timestamp('2020-01-01'), pd.Timestamp('2020-01-02')]
+    assert result['value'].tolist() == [1.0, 3.0]
+
+
+def test_resample_monthly_multiple_columns(mixed_dates_df):
+    df = mixed_dates_df.assign(other=1.0)
+    result = resample(df, 'date', ['value', 'other'], 'MS', 'sum')
+    assert result.columns.tolist() == ['date', 'value', 'other']
+    assert result['other'].sum() == len(df)
+
+
+def test_helpers_resample_is_memoized(mixed_dates_df):
+    cache = AggregationCache()
+    exec_df = mixed_dates_df.copy()
+    helpers = AggregationHelpers('dataset', exec_df, mixed_dates_df, cache=cache)
+
+    first = helpers.resample(exec_df, 'date', 'value')
+    second = helpers.resample(exec_df, 'date', 'value')
+    pd.testing.assert_frame_equal(first, second)
+    assert cache.stats()['hits'] == 1
+
+
+def test_helpers_skip_cache_after_in_place_change(mixed_dates_df):
+    cache = AggregationCache()
+    exec_df = mixed_dates_df.copy()
+    helpers = AggregationHelpers('dataset', exec_df, mixed_dates_df, cache=cache)
+
+    helpers.resample(exec_df, 'date', 'value')
+    exec_df.loc[0, 'value'] = 1000.0
+    result = helpers.resample(exec_df, 'date', 'value')
+    assert result['value'].iloc[0] == 1000.0 + 300 + 600
+    assert cache.stats()['hits'] == 0
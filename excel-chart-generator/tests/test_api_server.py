@@ -0,0 +1,120 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+from api_server import MAX_JSON_BYTES, ChartAPIServer, QueueFullError, WorkerPool
+
+DATASET_ID = 'a' * 64
+CHARTS_PATH = f'/datasets/{DATASET_ID}/charts'
+
+
+class StubService:
+    """只記錄呼叫的服務；generate_chart 可被阻塞以佔滿工作池"""
+
+    query_engines = None
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+        self.started = threading.Event()
+
+    def generate_chart(self, dataset_id, user_query, use_fallback=True):
+        self.calls.append(user_query)
+        self.started.set()
+        self.release.wait(5)
+        return {'success': True, 'query': user_query}
+
+
+@pytest.fixture
+def server():
+    service = StubService()
+    server = ChartAPIServer(('127.0.0.1', 0), service, WorkerPool(workers=1, queue_size=0),
+                            request_timeout=5, retry_after=7, quiet=True)
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    yield server
+    service.release.set()
+    server.shutdown()
+    server.server_close()
+
+
+def _post(server, body: bytes, path: str = CHARTS_PATH, headers: dict = None):
+    conn = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=5)
+    conn.request('POST', path, body=body, headers={'Content-Type': 'application/json', **(headers or {})})
+    response = conn.getresponse()
+    payload = json.loads(response.read() or b'{}')
+    conn.close()
+    return response, payload
+
+
+def test_chart_request_succeeds(server):
+    response, payload = _post(server, json.dumps({'query': ' bar chart '}).encode())
+    assert response.status == 200
+    assert payload == {'success': True, 'query': 'bar chart'}
+
+
+@pytest.mark.parametrize('body', [
+    b'[1, 2, 3]',
+    b'"bar chart"',
+    b'null',
+    b'{not json',
+    b'\xff\xfe',
+    b'{"query": ""}',
+    b'{"query": 3}',
+])
+def test_invalid_json_body_returns_400(server, body):
+    response, payload = _post(server, body)
+    assert response.status == 400
+    assert 'error' in payload
+    assert server.service.calls == []
+
+
+def test_oversized_json_body_returns_413_and_closes(server):
+    body = json.dumps({'query': 'x' * MAX_JSON_BYTES}).encode()
+    response, payload = _post(server, body)
+    assert response.status == 413
+    assert response.getheader('Connection') == 'close'
+    assert server.service.calls == []
+
+
+def test_malformed_content_length_returns_400(server):
+    conn = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=5)
+    conn.putrequest('POST', CHARTS_PATH)
+    conn.putheader('Content-Length', 'abc')
+    conn.endheaders()
+    response = conn.getresponse()
+    assert response.status == 400
+    assert response.getheader('Connection') == 'close'
+    conn.close()
+
+
+def test_full_queue_returns_429(server):
+    service = server.service
+    service.release.clear()
+    worker = threading.Thread(target=_post, args=(server, b'{"query": "slow"}'))
+    worker.start()
+    assert service.started.wait(5)
+
+    response, payload = _post(server, b'{"query": "fast"}')
+    assert response.status == 429
+    assert response.getheader('Retry-After') == '7'
+    assert server.pool.stats()['rejected'] == 1
+
+    service.release.set()
+    worker.join(5)
+    assert service.calls == ['slow']
+
+
+def test_worker_pool_rejects_beyond_queue():
+    pool = WorkerPool(workers=1, queue_size=1)
+    release = threading.Event()
+    futures = [pool.submit(release.wait, 5), pool.submit(release.wait, 5)]
+    with pytest.raises(QueueFullError):
+        pool.submit(release.wait, 5)
+    release.set()
+    assert all(future.result(5) for future in futures)
+    stats = pool.stats()
+    assert stats['completed'] == 2 and stats['rejected'] == 1
@@ -0,0 +1,63 @@
+import pytest
+
+from modules.chart_generator import ChartGenerator, find_dunder_access
+
+ESCAPES = [
+    "df.__class__.__init__.__globals__",
+    "x = ().__class__.__base__.__subclasses__()",
+    "b = __builtins__",
+    "s = '{0.__class__.__init__.__globals__}'.format(df)",
+    "s = '{.__init__}'.format(df)",
+]
+
+
+@pytest.fixture
+def generator(sales_df):
+    return ChartGenerator(sales_df, show_module_status=False)
+
+
+@pytest.mark.parametrize('code', ESCAPES)
+def test_find_dunder_access(code):
+    assert find_dunder_access(code)
+
+
+def test_find_dunder_access_allows_plain_code():
+    assert find_dunder_access("fig = px.bar(df, x='region', y='price')\nst.plotly_chart(fig)") is None
+    assert find_dunder_access("s = '{0:.2f}'.format(1.5)") is None
+
+
+@pytest.mark.parametrize('code', ESCAPES)
+def test_validate_rejects_dunder_access(generator, code):
+    is_valid, message = generator.validate_chart_code(code)
+    assert not is_valid
+    assert '危險' in message
+
+
+@pytest.mark.parametrize('code', ESCAPES)
+def test_execute_rejects_dunder_access(generator, code):
+    # 本地修正後的代碼不會再經過 validate_chart_code，執行時也必須擋下
+    result = generator.execute_chart_code(code)
+    assert not result['success']
+    assert result['error_type'] == 'UnsafeCode'
+
+
+@pytest.mark.parametrize('code', [
+    "cls = getattr(df, '__cl' + 'ass__')",
+    "setattr(df, 'x', 1)",
+    "cls = type(df)",
+    "cls = type('X', (), {})",
+    "v = vars(df)",
+    "g = globals()",
+])
+def test_execute_has_no_reflection_builtins(generator, code):
+    assert find_dunder_access(code) is None
+    result = generator.execute_chart_code(code)
+    assert not result['success']
+    assert result['error_type'] in ('MissingModule', 'NameError')
+
+
+def test_execute_runs_safe_chart_code(generator):
+    code = "fig = px.bar(agg(df, 'region', 'price'), x='region', y='price')\nst.plotly_chart(fig)"
+    result = generator.execute_chart_code(code)
+    assert result['success'], result.get('error')
+    assert len(result['figures']) == 1
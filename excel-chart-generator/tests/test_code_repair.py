@@ -0,0 +1,97 @@
+import pandas as pd
+import pytest
+
+from modules.code_repair import CodeRepairer
+
+AVAILABLE = ['pd', 'np', 'px', 'go', 'plt', 'sns', 'st', 'agg', 'value_counts', 'resample']
+
+
+@pytest.fixture
+def repairer():
+    return CodeRepairer(['Order Date', 'Region', 'unit_price', 'Quantity'], ['Order Date'], AVAILABLE)
+
+
+def _error(code: str, df: pd.DataFrame, **namespace) -> BaseException:
+    """執行代碼並回傳發生的例外"""
+    with pytest.raises(Exception) as info:
+        exec(code, {'pd': pd, **namespace}, {'df': df.copy()})
+    return info.value
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        'Order Date': ['2024-01-02', '01/03/2024', '4 Jan 2024'],
+        'Region': ['North', 'South', 'North'],
+        'unit_price': [1.0, 2.0, 3.0],
+        'Quantity': [1, 2, 3],
+    })
+
+
+def test_fix_column_key_error(repairer, df):
+    code = "total = df.groupby('region')['Unit Price'].sum()"
+    result = repairer.repair(code, _error(code, df))
+    assert result['code'] == "total = df.groupby('Region')['Unit Price'].sum()"
+
+    code = result['code']
+    result = repairer.repair(code, _error(code, df))
+    assert result['code'] == "total = df.groupby('Region')['unit_price'].sum()"
+    exec(result['code'], {}, {'df': df})
+
+
+def test_fix_column_leaves_ambiguous_names(df):
+    repairer = CodeRepairer(['sales_2023', 'sales_2024'], [], AVAILABLE)
+    result = repairer.repair("y = df['sales']", KeyError('sales'))
+    assert result['fixes'] == []
+    assert result['code'] == "y = df['sales']"
+
+
+def test_fix_attribute_column(repairer, df):
+    code = "q = df.quantity.sum()"
+    result = repairer.repair(code, _error(code, df))
+    assert result['code'] == "q = df['Quantity'].sum()"
+    assert result['fixes'] == ["欄位 'quantity' → 'Quantity'"]
+
+
+def test_fix_module_names(repairer):
+    code = "fig = plotly.express.bar(df, x='Region')\nst.plotly_chart(fig)"
+    result = repairer.repair(code, NameError("name 'plotly' is not defined"))
+    assert result['code'].startswith("fig = px.bar(df, x='Region')")
+
+    code = "fig = pyplot.figure()"
+    result = repairer.repair(code, NameError("name 'pyplot' is not defined"))
+    assert result['code'] == "fig = plt.figure()"
+
+
+def test_fix_dataframe_variable_name(repairer):
+    code = "fig = px.bar(data, x='Region')"
+    result = repairer.repair(code, NameError("name 'data' is not defined"))
+    assert result['code'] == "fig = px.bar(df, x='Region')"
+
+
+def test_unknown_name_is_not_fixed(repairer):
+    result = repairer.repair("x = foo(df)", NameError("name 'foo' is not defined"))
+    assert result['fixes'] == []
+
+
+def test_fix_dates_with_mixed_formats(repairer, df):
+    code = "df['month'] = df['Order Date'].dt.month"
+    result = repairer.repair(code, _error(code, df))
+    assert "format='mixed'" in result['code']
+    assert result['fixes'] == ["將 'Order Date' 轉換為日期時間"]
+
+    local_vars = {'df': df.copy()}
+    exec(result['code'], {'pd': pd}, local_vars)
+    assert local_vars['df']['month'].tolist() == [1, 1, 1]
+    assert local_vars['df']['Order Date'].dt.day.tolist() == [2, 3, 4]
+
+
+def test_fix_dates_skips_converted_columns(repairer):
+    code = "df['Order Date'] = pd.to_datetime(df['Order Date'])\nm = df['Order Date'].dt.month"
+    result = repairer.repair(code, AttributeError('Can only use .dt accessor with datetimelike values'))
+    assert result['fixes'] == []
+
+
+def test_syntax_error_is_left_alone(repairer):
+    result = repairer.repair("fig = px.bar(df,", KeyError('x'))
+    assert result == {'code': "fig = px.bar(df,", 'fixes': []}
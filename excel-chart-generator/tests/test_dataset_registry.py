@@ -0,0 +1,133 @@
+import time
+
+import pandas as pd
+import pytest
+
+from modules.dataset_registry import DatasetRegistry
+
+
+class CountingLoader:
+    """記錄被呼叫次數的 loader"""
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.calls = 0
+
+    def __call__(self) -> pd.DataFrame:
+        self.calls += 1
+        return self.df.copy()
+
+
+@pytest.fixture
+def loader(sales_df):
+    return CountingLoader(sales_df)
+
+
+def test_same_hash_is_loaded_once(loader):
+    registry = DatasetRegistry(idle_timeout=300)
+    first = registry.acquire('abc', loader)
+    second = registry.acquire('abc', loader)
+
+    assert first.df is second.df
+    assert loader.calls == 1
+    report = registry.report()
+    assert report['references'] == 2
+    assert report['loads'] == 1 and report['shared'] == 1
+
+
+def test_release_counts_down_and_is_idempotent(loader):
+    registry = DatasetRegistry(idle_timeout=300)
+    first = registry.acquire('abc', loader)
+    second = registry.acquire('abc', loader)
+
+    assert first.release()
+    assert not first.release()
+    assert registry.report()['references'] == 1
+    assert second.release()
+    report = registry.report()
+    assert report['references'] == 0
+    # 閒置期間仍保留在記憶體
+    assert report['datasets'] == 1 and report['freed'] == 0
+
+
+def test_zero_idle_timeout_frees_immediately(loader):
+    registry = DatasetRegistry(idle_timeout=0)
+    lease = registry.acquire('abc', loader)
+    lease.release()
+    assert registry.report()['datasets'] == 0
+    assert registry.report()['freed'] == 1
+
+
+def test_released_lease_reacquires_on_access(loader):
+    registry = DatasetRegistry(idle_timeout=0)
+    lease = registry.acquire('abc', loader)
+    lease.release()
+
+    assert len(lease.df) == len(loader.df)
+    assert lease.held
+    assert registry.report()['references'] == 1
+    assert loader.calls == 2
+
+
+def test_sweep_frees_only_unreferenced_datasets(loader):
+    registry = DatasetRegistry(idle_timeout=0.01, lease_timeout=None)
+    kept = registry.acquire('kept', loader)
+    registry.acquire('idle', loader).release()
+    time.sleep(0.02)
+
+    assert registry.sweep() == ['idle']
+    assert kept.held and registry.report()['datasets'] == 1
+
+
+def test_failed_load_does_not_leak_reference():
+    registry = DatasetRegistry()
+
+    def failing():
+        raise ValueError('bad file')
+
+    with pytest.raises(ValueError):
+        registry.acquire('abc', failing)
+    assert registry.report()['references'] == 0
+
+
+def test_spill_idle_and_restore(loader, tmp_path):
+    registry = DatasetRegistry(idle_timeout=300, spill_dir=tmp_path)
+    active = registry.acquire('active', loader)
+    idle = registry.acquire('idle', loader)
+    idle.release()
+
+    freed = registry.spill_idle()
+    assert freed > 0
+    report = registry.report()
+    assert report['spills'] == 1 and report['spilled_datasets'] == 1
+    assert registry.entry_usage('idle')['df'] == 0
+    assert registry.entry_usage('active')['df'] > 0
+    assert len(list(tmp_path.iterdir())) == 1
+
+    # 從暫存檔載回，不再呼叫 loader
+    pd.testing.assert_frame_equal(idle.df, loader.df)
+    assert loader.calls == 2
+    assert registry.report()['restores'] == 1
+    assert active.held
+
+
+def test_spill_without_directory_drops_dataset(loader):
+    registry = DatasetRegistry(idle_timeout=300)
+    lease = registry.acquire('abc', loader)
+    lease.release()
+
+    assert registry.spill_idle() > 0
+    assert registry.report()['datasets'] == 0
+    assert len(lease.df) == len(loader.df)
+    assert loader.calls == 2
+
+
+def test_dropping_spilled_dataset_removes_file(loader, tmp_path):
+    registry = DatasetRegistry(idle_timeout=0.01, lease_timeout=None, spill_dir=tmp_path)
+    registry.acquire('abc', loader).release()
+    registry.spill_idle()
+    assert list(tmp_path.iterdir())
+    time.sleep(0.02)
+
+    assert registry.sweep() == ['abc']
+    assert not list(tmp_path.iterdir())
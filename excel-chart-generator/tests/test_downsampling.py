@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.downsampling import (
+    MAX_HISTOGRAM_BINS, binned_histogram, density_scatter, downsample_line, histogram_bins,
+    lttb_indices, minmax_indices
+)
+
+
+@pytest.fixture
+def long_series():
+    rng = np.random.default_rng(1)
+    n = 50_000
+    y = rng.normal(size=n).cumsum()
+    y[12_345] = 1_000.0  # 尖峰
+    return pd.DataFrame({'x': np.arange(n, dtype=float), 'y': y})
+
+
+def test_lttb_respects_point_budget(long_series):
+    indices = lttb_indices(long_series['x'].to_numpy(), long_series['y'].to_numpy(), 500)
+    assert len(indices) == 500
+    assert indices[0] == 0 and indices[-1] == len(long_series) - 1
+    assert np.all(np.diff(indices) > 0)
+    assert 12_345 in indices
+
+
+def test_lttb_returns_all_points_under_budget():
+    x = np.arange(10, dtype=float)
+    assert lttb_indices(x, x, 20).tolist() == list(range(10))
+    assert lttb_indices(x, x, 2).tolist() == list(range(10))
+
+
+def test_minmax_respects_point_budget(long_series):
+    y = long_series['y'].to_numpy()
+    indices = minmax_indices(y, 500)
+    assert len(indices) <= 500
+    assert indices[0] == 0 and indices[-1] == len(y) - 1
+    assert int(np.argmax(y)) in indices
+    assert int(np.argmin(y)) in indices
+
+
+@pytest.mark.parametrize('method', ['lttb', 'minmax'])
+def test_downsample_line_point_budget(long_series, method):
+    shuffled = long_series.sample(frac=1, random_state=0)
+    result = downsample_line(shuffled, 'x', 'y', max_points=1000, method=method)
+    assert len(result) <= 1000
+    assert result['x'].is_monotonic_increasing
+    assert result['y'].max() == 1_000.0
+
+
+def test_downsample_line_keeps_small_data():
+    df = pd.DataFrame({'x': [3, 1, 2], 'y': [1.0, None, 2.0]})
+    result = downsample_line(df, 'x', 'y', max_points=10)
+    assert result['x'].tolist() == [2, 3]
+
+
+def test_density_scatter_switches_to_heatmap(long_series):
+    assert density_scatter(long_series, 'x', 'y', max_points=100_000).data[0].type in ('scatter', 'scattergl')
+    assert density_scatter(long_series, 'x', 'y', max_points=1000).data[0].type == 'heatmap'
+
+
+@pytest.mark.parametrize('bins', ['auto', 'fd', 'sturges', 10_000])
+def test_histogram_bins_capped_with_outlier(bins):
+    values = pd.Series(np.r_[np.random.default_rng(2).normal(size=10_000), 1e12])
+    hist = histogram_bins(values, bins=bins)
+    assert 1 <= len(hist) <= MAX_HISTOGRAM_BINS
+    assert hist['count'].sum() == len(values)
+
+
+def test_histogram_bins_ignores_non_finite_values():
+    hist = histogram_bins(pd.Series([1.0, 2.0, np.nan, np.inf, -np.inf, 'x']), bins=4)
+    assert len(hist) == 4
+    assert hist['count'].sum() == 2
+
+
+def test_histogram_bins_empty_and_constant():
+    assert histogram_bins(pd.Series([], dtype=float))['count'].sum() == 0
+    constant = histogram_bins(pd.Series([5.0] * 100))
+    assert len(constant) == 1 and constant['count'].iloc[0] == 100
+
+
+def test_binned_histogram_sends_only_bins():
+    df = pd.DataFrame({'v': np.random.default_rng(3).normal(size=100_000)})
+    fig = binned_histogram(df, 'v', bins=50)
+    assert len(fig.data[0].x) == 50
@@ -0,0 +1,75 @@
+import pandas as pd
+import plotly.express as px
+import pytest
+
+from modules.intent_router import IntentRouter, canonical_intent, make_intent
+
+
+@pytest.fixture
+def router():
+    return IntentRouter({
+        'numeric': ['price', 'quantity', 'unit_price'],
+        'categorical': ['region'],
+        'datetime': ['order_date'],
+    })
+
+
+@pytest.mark.parametrize('query, chart_type, columns, aggregation', [
+    ('histogram of price', 'histogram', {'column': 'price'}, None),
+    ('price 的直方圖', 'histogram', {'column': 'price'}, None),
+    ('unit price distribution', 'histogram', {'column': 'unit_price'}, None),
+    ('prcie histogram', 'histogram', {'column': 'price'}, None),
+    ('price over time', 'time_series', {'date': 'order_date', 'value': 'price'}, None),
+    ('scatter of price vs quantity', 'scatter', {'x': 'price', 'y': 'quantity'}, None),
+    ('average price by region', 'bar', {'category': 'region', 'value': 'price'}, 'mean'),
+    ('total quantity per region', 'bar', {'category': 'region', 'value': 'quantity'}, 'sum'),
+])
+def test_routes_simple_queries(router, query, chart_type, columns, aggregation):
+    intent = router.route(query)
+    assert intent is not None
+    assert intent['confident']
+    assert intent['chart_type'] == chart_type
+    assert intent['columns'] == columns
+    assert intent['aggregation'] == aggregation
+
+
+@pytest.mark.parametrize('query', [
+    'scatter or histogram of price',
+    'show price for region north sorted by date',
+])
+def test_ambiguous_or_unexplained_queries_are_not_confident(router, query):
+    intent = router.route(query)
+    assert intent is not None
+    assert not intent['confident']
+    assert intent['confidence'] < router.threshold
+
+
+@pytest.mark.parametrize('query', ['price', 'hello there', ''])
+def test_queries_without_intent_are_not_routed(router, query):
+    assert router.route(query) is None
+
+
+def test_intent_code_runs(router, sales_df):
+    sales_df = sales_df.assign(unit_price=1.0)
+    captured = []
+    st = type('St', (), {'plotly_chart': staticmethod(lambda fig, **kwargs: captured.append(fig))})
+    for query in ('histogram of price', 'price over time', 'scatter of price vs quantity', 'average price by region'):
+        intent = router.route(query)
+        exec(intent['code'], {'pd': pd, 'px': px, 'st': st}, {'df': sales_df})
+    assert len(captured) == 4
+
+
+def test_time_series_code_parses_mixed_dates(mixed_dates_df):
+    router = IntentRouter({'numeric': ['value'], 'categorical': [], 'datetime': ['date']})
+    intent = router.route('value over time')
+    captured = []
+    st = type('St', (), {'plotly_chart': staticmethod(lambda fig, **kwargs: captured.append(fig))})
+    exec(intent['code'], {'pd': pd, 'px': px, 'st': st}, {'df': mixed_dates_df})
+    assert len(captured[0].data[0].x) == len(mixed_dates_df)
+
+
+def test_make_intent_matches_routed_intent(router):
+    routed = router.route('average price by region')
+    made = make_intent('bar', {'category': 'region', 'value': 'price'})
+    assert canonical_intent(routed) == canonical_intent(made)
+    assert made['code'] == routed['code']
@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+
+from modules.chart_generator import ChartGenerator
+from modules.data_analyzer import DataAnalyzer
+from modules.file_loader import parse_dates
+from modules.summary_cube import SummaryCube
+
+
+def _points(fig) -> pd.DataFrame:
+    trace = fig.data[0]
+    return pd.DataFrame({'x': pd.to_datetime(list(trace.x)), 'y': list(trace.y)})
+
+
+def test_parse_dates_mixed_formats(mixed_dates_df):
+    parsed = parse_dates(mixed_dates_df['date'])
+    assert parsed.notna().all()
+    assert parsed.nunique() == 300
+
+
+def test_parse_dates_cjk_and_invalid():
+    parsed = parse_dates(pd.Series(['2020年1月5日', '2020-01-06', 'not a date', None]))
+    assert parsed.tolist()[:2] == [pd.Timestamp('2020-01-05'), pd.Timestamp('2020-01-06')]
+    assert parsed.iloc[2:].isna().all()
+
+
+def test_cube_time_counts_every_row(mixed_dates_df):
+    cube = SummaryCube(mixed_dates_df, {'numeric': ['value'], 'categorical': [], 'datetime': ['date']}).build()
+    time_agg = cube['time']['date']
+    assert sum(time_agg['rows']) == len(mixed_dates_df)
+    assert sum(time_agg['numeric']['value']['sum']) == pytest.approx(mixed_dates_df['value'].sum())
+
+
+def test_cube_and_direct_time_series_fallback_match(mixed_dates_df):
+    analysis = DataAnalyzer(mixed_dates_df).analyze_data()
+    assert analysis['datetime'] == ['date']
+    assert analysis['summary_cube'] is not None
+
+    generator = ChartGenerator(mixed_dates_df, show_module_status=False)
+    cube_result = generator.create_fallback_chart(analysis, '')
+    direct_result = generator.create_fallback_chart({**analysis, 'summary_cube': None}, '')
+    assert cube_result['chart_type'] == direct_result['chart_type'] == 'time_series'
+
+    # 立方體以每日平均繪製；直接繪製的原始點依日期平均後應相同
+    cube_points = _points(cube_result['figure']).set_index('x')['y']
+    direct_points = _points(direct_result['figure'])
+    assert len(direct_points) == len(mixed_dates_df)
+    direct_means = direct_points.groupby('x')['y'].mean()
+    pd.testing.assert_series_equal(cube_points, direct_means, check_names=False, check_index_type=False)